@@ -0,0 +1,113 @@
+"""元组键字典、整数编码聚合表及其写入磁盘模式的峰值内存对比
+
+各方式在独立子进程中聚合同一批随机数据并构建 DataFrame，
+统计耗时与进程峰值内存。写入磁盘模式的聚合数组上限为 SPILL_LIMIT_MB。
+用法: python benchmarks/bench_aggregate.py [键数量]
+"""
+
+import resource
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from v2log.aggregate import Aggregator  # noqa: E402
+
+BLOCK_ROWS = 50000
+SPILL_LIMIT_MB = 64
+
+
+def peak_rss_mb() -> float:
+    """本进程的内存峰值（MB）"""
+    try:
+        with open("/proc/self/status") as f:
+            return next(
+                int(line.split()[1]) / 1024
+                for line in f
+                if line.startswith("VmHWM")
+            )
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def iter_blocks(keys: int):
+    """按块生成与 parse_block 输出相同结构的随机数据"""
+    rng = np.random.default_rng(0)
+    ips = [
+        f"10.{i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(200000)
+    ]
+    sites = [f"site{i}.example.com" for i in range(5000)]
+    start = 29_000_000
+    for offset in range(0, keys, BLOCK_ROWS):
+        rows = min(BLOCK_ROWS, keys - offset)
+        minutes = start + (offset + np.arange(rows)) // 2000
+        srcs = [ips[i] for i in rng.integers(0, len(ips), rows)]
+        dsts = [sites[i] for i in rng.integers(0, len(sites), rows)]
+        yield minutes, srcs, dsts, np.ones(rows, dtype=np.int64)
+
+
+def run_dict(keys: int) -> int:
+    aggregated_data = defaultdict(int)
+    epoch = datetime(1970, 1, 1)
+    for minutes, srcs, dsts, counts in iter_blocks(keys):
+        for minute, src, dst, count in zip(minutes, srcs, dsts, counts):
+            key = (epoch + timedelta(minutes=int(minute)), src, dst)
+            aggregated_data[key] += int(count)
+
+    records = [
+        {"min": minute, "src": src, "dst": dst, "count": count}
+        for (minute, src, dst), count in aggregated_data.items()
+    ]
+    return len(pd.DataFrame(records))
+
+
+def run_aggregator(keys: int, memory_limit=None) -> int:
+    aggregator = Aggregator(memory_limit=memory_limit)
+    for block in iter_blocks(keys):
+        aggregator.add_block(*block)
+    return len(aggregator.to_frame())
+
+
+def run_spill(keys: int) -> int:
+    return run_aggregator(keys, SPILL_LIMIT_MB * 1024**2)
+
+
+def main():
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    if len(sys.argv) > 2:
+        # 子进程：执行一种聚合方式并输出结果
+        start = time.perf_counter()
+        modes = {
+            "dict": run_dict,
+            "aggregator": run_aggregator,
+            "spill": run_spill,
+        }
+        rows = modes[sys.argv[2]](keys)
+        elapsed = time.perf_counter() - start
+        print(f"{elapsed:.2f} {peak_rss_mb():.0f} {rows}")
+        return
+
+    print(f"键数量: {keys:,}")
+    for mode, name in (
+        ("dict", "元组键字典"),
+        ("aggregator", "整数编码聚合表"),
+        ("spill", f"整数编码聚合表（上限 {SPILL_LIMIT_MB}MB）"),
+    ):
+        elapsed, rss, rows = subprocess.run(
+            [sys.executable, __file__, str(keys), mode],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        print(f"{name}: {elapsed}s, 峰值内存 {rss}MB, {int(rows):,} 行")
+
+
+if __name__ == "__main__":
+    main()
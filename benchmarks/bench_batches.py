@@ -0,0 +1,64 @@
+"""分批处理的总耗时随日志行数的增长情况
+
+对不同行数的日志做完整的串行处理（小批次、带批次回调和断点），
+每批只回调和追加保存新增数据，总耗时应随行数线性增长，
+即每行耗时基本不变。
+用法: python benchmarks/bench_batches.py [最小行数] [批大小]
+"""
+
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from v2log.analyzer import IPAnalyzer  # noqa: E402
+from v2log.utils.generator import generate_log  # noqa: E402
+
+
+def run(log_path: Path, batch_size: int) -> tuple:
+    """处理一次日志，返回耗时和批次数"""
+    batches = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # 不做地理定位，只统计解析、分批回调和断点的开销
+        analyzer = IPAnalyzer(
+            cache_dir=cache_dir, batch_size=batch_size, geolocate=False
+        )
+        start = time.perf_counter()
+        analyzer.process_log_file(
+            log_path,
+            use_cache=False,
+            batch_callback=lambda df: batches.append(len(df)),
+        )
+        return time.perf_counter() - start, len(batches)
+
+
+def main():
+    base = int(sys.argv[1]) if len(sys.argv) > 1 else 250000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = Path(tmp) / "access.log"
+        lines = 0
+        print(f"批大小: {batch_size:,}")
+        for scale in (1, 2, 4, 8):
+            # 每轮追加新时间段的日志，使行数和聚合键数都翻倍
+            with log_path.open("a") as f:
+                while lines < base * scale:
+                    start_time = datetime(2025, 1, 1) + timedelta(
+                        days=lines // base
+                    )
+                    f.write(generate_log(base, start_time) + "\n")
+                    lines += base
+
+            elapsed, batches = run(log_path, batch_size)
+            print(
+                f"{lines:>10,} 行: {elapsed:.3f}s, {batches} 批, "
+                f"{elapsed / lines * 1e6:.2f}µs/行"
+            )
+
+
+if __name__ == "__main__":
+    main()
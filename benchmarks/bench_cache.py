@@ -0,0 +1,132 @@
+"""pickle 缓存、列式缓存与按天分区缓存的冷加载时间和内存对比
+
+每种格式都在独立子进程中加载，统计加载耗时和进程峰值内存。
+用法: python benchmarks/bench_cache.py [行数] [天数]
+"""
+
+import pickle
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from v2log.analyzer import IPAnalyzer  # noqa: E402
+from v2log.cache import (  # noqa: E402
+    FRAME_SUFFIX,
+    PARTITION_SUFFIX,
+    save_frame,
+)
+
+LOAD_SCRIPT = """
+import pickle, resource, sys, time
+sys.path.insert(0, {root!r})
+import pandas as pd
+from v2log.cache import load_frame
+start = time.perf_counter()
+{load}
+elapsed = time.perf_counter() - start
+try:
+    # Linux 下 ru_maxrss 会继承自父进程，优先读取本进程的内存峰值
+    with open("/proc/self/status") as f:
+        rss = next(
+            int(line.split()[1]) / 1024
+            for line in f
+            if line.startswith("VmHWM")
+        )
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(f"{{elapsed:.3f}} {{rss:.0f}} {{len(df)}}")
+"""
+
+
+def make_frame(rows: int, days: int = 30) -> pd.DataFrame:
+    """生成与分析结果结构相同的随机数据"""
+    rng = np.random.default_rng(0)
+    ips = np.array(
+        [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(50000)]
+    )
+    sites = np.array([f"site{i}.example.com" for i in range(3000)])
+    cities = np.array([f"City{i}" for i in range(800)])
+    src_idx = rng.integers(0, len(ips), rows)
+    return pd.DataFrame(
+        {
+            "min": pd.Timestamp("2025-01-01")
+            + pd.to_timedelta(
+                np.sort(rng.integers(0, 60 * 24 * days, rows)), unit="m"
+            ),
+            "src": ips[src_idx],
+            "dst": sites[rng.integers(0, len(sites), rows)],
+            "count": rng.integers(1, 100, rows),
+            "x": rng.random(rows, dtype=np.float32),
+            "y": rng.random(rows, dtype=np.float32),
+            "country": np.array(["CN", "US", "DE", "JP"])[src_idx % 4],
+            "city": cities[src_idx % len(cities)],
+        },
+        columns=IPAnalyzer.COLUMNS,
+    ).astype({"src": object, "dst": object, "country": object, "city": object})
+
+
+def measure(load: str) -> tuple:
+    script = LOAD_SCRIPT.format(
+        root=str(Path(__file__).parent.parent), load=load
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    return float(output[0]), float(output[1]), int(output[2])
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    df = make_frame(rows, days)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pickle_path = Path(tmp) / "cache.pkl"
+        frame_path = Path(tmp) / f"cache{FRAME_SUFFIX}"
+        with pickle_path.open("wb") as f:
+            pickle.dump(df, f)
+        save_frame(df, frame_path)
+        parts_path = Path(tmp) / f"cache{PARTITION_SUFFIX}"
+        save_frame(df, parts_path)
+
+        last_day = df["min"].max().normalize()
+        last_24h = df["min"].max() - pd.Timedelta(hours=24)
+        cases = {
+            "pickle": f"df = pickle.load(open({str(pickle_path)!r}, 'rb'))",
+            "列式缓存": f"df = load_frame({str(frame_path)!r})",
+            "列式缓存(列投影)": (
+                f"df = load_frame({str(frame_path)!r}, "
+                "columns=['min', 'city', 'count'])"
+            ),
+            "列式缓存(最近一天)": (
+                f"df = load_frame({str(frame_path)!r}, "
+                f"time_range=(pd.Timestamp({str(last_day)!r}), None))"
+            ),
+            "分区缓存": f"df = load_frame({str(parts_path)!r})",
+            "分区缓存(最近24小时)": (
+                f"df = load_frame({str(parts_path)!r}, "
+                f"time_range=(pd.Timestamp({str(last_24h)!r}), None))"
+            ),
+        }
+
+        print(f"行数: {rows:,}, 天数: {days}")
+        print(f"pickle 文件: {pickle_path.stat().st_size / 1024 ** 2:.1f}MB")
+        print(f"列式文件: {frame_path.stat().st_size / 1024 ** 2:.1f}MB")
+        for name, load in cases.items():
+            elapsed, rss, loaded = measure(load)
+            print(
+                f"{name}: {elapsed:.3f}s, 峰值内存 {rss:.0f}MB, {loaded:,} 行"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""官方库逐个查询与 GeoLocator 两种引擎的地理位置查询对比
+
+随机生成一批IPv4/IPv6地址，分别用官方库 get_all、文件读取引擎和
+内存映射引擎查询，校验结果一致并统计耗时。
+用法: python benchmarks/bench_geo.py [IP数量] [数据库路径]
+"""
+
+import ipaddress
+import random
+import sys
+import time
+from pathlib import Path
+
+import IP2Location
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from v2log.geo import DEFAULT_LOCATION, GeoLocator  # noqa: E402
+
+DEFAULT_DB_PATH = (
+    Path(__file__).parent.parent
+    / "v2log"
+    / "data"
+    / "IP2LOCATION-LITE-DB11.BIN"
+)
+
+
+def make_ips(count: int) -> list:
+    """生成测试用IP，包含少量IPv6和无效地址"""
+    rng = random.Random(0)
+    ips = [
+        str(ipaddress.IPv4Address(rng.getrandbits(32)))
+        for _ in range(count - count // 20)
+    ]
+    ips += [
+        str(ipaddress.IPv6Address(rng.getrandbits(128)))
+        for _ in range(count // 20)
+    ]
+    ips += ["::ffff:8.8.8.8", "255.255.255.255", "1.2.3.256", "invalid"]
+    return ips
+
+
+def reference(db_path: Path, ips: list) -> dict:
+    """官方库逐个查询，与 IPAnalyzer 以前的实现相同"""
+    database = IP2Location.IP2Location(str(db_path))
+    result = {}
+    for ip in ips:
+        try:
+            rec = database.get_all(ip)
+            result[ip] = {
+                "x": np.float32(rec.latitude),
+                "y": np.float32(rec.longitude),
+                "country": rec.country_long,
+                "city": rec.city,
+            }
+        except Exception:
+            result[ip] = DEFAULT_LOCATION.copy()
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    db_path = Path(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_DB_PATH
+    ips = make_ips(count)
+
+    start = time.perf_counter()
+    expected = reference(db_path, ips)
+    print(f"IP数量: {len(ips):,}")
+    print(f"官方库 get_all: {time.perf_counter() - start:.3f}s")
+
+    for engine in GeoLocator.ENGINES:
+        locator = GeoLocator(db_path, engine=engine)
+        start = time.perf_counter()
+        result = locator.locate_many(ips)
+        elapsed = time.perf_counter() - start
+        assert result == expected, f"{engine} 引擎结果与官方库不一致"
+        print(f"GeoLocator({engine}): {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""各入口的导入耗时
+
+每条语句都在新的解释器中执行多次，取耗时中位数，
+并检查执行后是否加载了界面相关的依赖（streamlit、folium、plotly）。
+用法: python benchmarks/bench_import.py [重复次数]
+"""
+
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# 语句执行后打印已加载的界面依赖
+CHECK_UI = (
+    "import sys; print(','.join(m for m in ('streamlit', 'folium', 'plotly')"
+    " if m in sys.modules))"
+)
+
+STATEMENTS = {
+    "import v2log": "import v2log",
+    "from v2log import IPAnalyzer": "from v2log import IPAnalyzer",
+    "v2log --help": (
+        "import sys; sys.argv = ['v2log', '--help']\n"
+        "from v2log.cli import main\n"
+        "try:\n    main()\nexcept SystemExit:\n    pass"
+    ),
+    "v2log analyze --help": (
+        "import sys; sys.argv = ['v2log', 'analyze', '--help']\n"
+        "from v2log.cli import main\n"
+        "try:\n    main()\nexcept SystemExit:\n    pass"
+    ),
+    "import v2log.components": "import v2log.components",
+}
+
+
+def run(statement: str) -> tuple:
+    """在新解释器中执行一次，返回耗时（秒）和加载的界面依赖"""
+    code = (
+        "import time; _start = time.perf_counter()\n"
+        f"{statement}\n"
+        "_elapsed = time.perf_counter() - _start\n"
+        "import sys; sys.stdout = sys.__stdout__\n"
+        f"{CHECK_UI}; print(_elapsed)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    *_, modules, elapsed = result.stdout.splitlines()
+    return float(elapsed), modules
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"重复次数: {repeat}")
+    for name, statement in STATEMENTS.items():
+        runs = [run(statement) for _ in range(repeat)]
+        elapsed = statistics.median(seconds for seconds, _ in runs)
+        modules = runs[-1][1] or "无"
+        print(f"{name:<30} {elapsed * 1000:8.1f}ms  界面依赖: {modules}")
+
+
+if __name__ == "__main__":
+    main()
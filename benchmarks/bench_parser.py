@@ -0,0 +1,61 @@
+"""逐行解析与批量解析的性能对比
+
+用法: python benchmarks/bench_parser.py [行数]
+"""
+
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from v2log.parser import parse_block, parse_log_line  # noqa: E402
+from v2log.utils.generator import generate_log  # noqa: E402
+
+
+def per_line(text: str) -> dict:
+    """逐行正则匹配 + strptime 的解析与聚合（不含地理定位）"""
+    aggregated_data = defaultdict(int)
+    for line in text.splitlines():
+        if parsed := parse_log_line(line.strip()):
+            aggregated_data[(parsed["min"], parsed["src"], parsed["dst"])] += 1
+    return dict(aggregated_data)
+
+
+def as_dict(block: tuple) -> dict:
+    """将批量解析的列式结果转换为逐行解析的字典形式，用于校验"""
+    minutes, srcs, dsts, counts = block
+    epoch = datetime(1970, 1, 1)
+    return {
+        (epoch + timedelta(minutes=int(minute)), src, dst): int(count)
+        for minute, src, dst, count in zip(minutes, srcs, dsts, counts)
+    }
+
+
+def timed(func, text: str, repeat: int = 3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    text = generate_log(count=count) + "\n"
+
+    line_time, line_result = timed(per_line, text)
+    block_time, block_result = timed(parse_block, text)
+    assert line_result == as_dict(block_result), "批量解析结果与逐行解析不一致"
+
+    print(f"行数: {count}")
+    print(f"逐行解析: {line_time:.3f}s ({count / line_time:,.0f} 行/秒)")
+    print(f"批量解析: {block_time:.3f}s ({count / block_time:,.0f} 行/秒)")
+    print(f"加速比: {line_time / block_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
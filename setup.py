@@ -13,7 +13,7 @@ setup(
         ("example", ["example/demo_access.log"]),
     ],
     install_requires=[
-        "streamlit>=1.31.0",
+        "streamlit>=1.37.0",
         "pandas>=2.0.0",
         "folium>=0.14.0",
         "plotly>=5.18.0",
@@ -22,6 +22,12 @@ setup(
         "click>=8.0.0",
         "streamlit-folium>=0.12.0",
     ],
+    extras_require={
+        # 列式缓存，未安装时回退到 pickle
+        "parquet": ["pyarrow>=14.0.0"],
+        # 读取 zstd 压缩的日志，Python 3.14 起可使用标准库
+        "zstd": ["zstandard>=0.22.0"],
+    },
     entry_points={
         "console_scripts": [
             "v2log=v2log.cli:main",
@@ -0,0 +1,82 @@
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from v2log.analyzer import IPAnalyzer
+
+LINE_FORMAT = (
+    "{time:%Y/%m/%d %H:%M:%S} {src}:{port} accepted tcp:{dst}:443 "
+    "[inbound-27018 -> default]\n"
+)
+
+
+def generate_lines(count, start=datetime(2025, 1, 31, 20), seed=0) -> list:
+    """生成按时间递增的日志行，src/dst 取值较少，同一分钟内有重复的键"""
+    rng = random.Random(seed)
+    lines = []
+    time = start
+    for _ in range(count):
+        time += timedelta(seconds=rng.randint(0, 40))
+        lines.append(
+            LINE_FORMAT.format(
+                time=time,
+                src=f"10.0.{rng.randint(0, 3)}.{rng.randint(1, 20)}",
+                port=rng.randint(1024, 65535),
+                dst=f"s{rng.randint(0, 30)}.example{rng.randint(0, 3)}.com",
+            )
+        )
+    return lines
+
+
+def sorted_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """按键排序并把分类列转换为字符串，便于比较不同方式得到的结果"""
+    df = df.astype(
+        {
+            column: str
+            for column, dtype in df.dtypes.items()
+            if isinstance(dtype, pd.CategoricalDtype)
+        }
+    )
+    df["min"] = df["min"].astype("datetime64[us]")
+    return df.sort_values(["min", "src", "dst"], ignore_index=True)
+
+
+@pytest.fixture
+def log_lines():
+    return generate_lines
+
+
+@pytest.fixture
+def make_log(tmp_path):
+    """把日志行写入 tmp_path 下的文件"""
+
+    def make(lines, name="access.log"):
+        path = tmp_path / name
+        path.write_text("".join(lines))
+        return path
+
+    return make
+
+
+@pytest.fixture
+def make_analyzer(tmp_path):
+    """创建不做地理定位的分析器，缓存目录在 tmp_path 下"""
+
+    def make(cache="cache", **kwargs):
+        return IPAnalyzer(
+            cache_dir=tmp_path / cache, geolocate=False, **kwargs
+        )
+
+    return make
+
+
+@pytest.fixture
+def assert_same_frame():
+    def check(actual, expected):
+        pd.testing.assert_frame_equal(
+            sorted_frame(actual), sorted_frame(expected)
+        )
+
+    return check
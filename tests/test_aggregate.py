@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from v2log.aggregate import Aggregator, merge_runs, reduce_keys
+
+
+def random_block(rng, rows, start=0):
+    """随机生成 parse_block 格式的数据，分钟数从 start 起大致递增"""
+    minutes = np.sort(rng.integers(start, start + 50, rows)).astype(np.int64)
+    srcs = [f"10.0.0.{value}" for value in rng.integers(0, 40, rows)]
+    dsts = [f"s{value}.example.com" for value in rng.integers(0, 25, rows)]
+    return minutes, srcs, dsts, rng.integers(1, 5, rows)
+
+
+def test_reduce_keys_sums_duplicates():
+    minutes, srcs, dsts, counts = reduce_keys(
+        np.array([2, 1, 2, 1]),
+        np.array([0, 1, 0, 1]),
+        np.array([3, 3, 3, 4]),
+        np.array([1, 2, 5, 7]),
+    )
+    assert minutes.tolist() == [1, 1, 2]
+    assert srcs.tolist() == [1, 1, 0]
+    assert dsts.tolist() == [3, 4, 3]
+    assert counts.tolist() == [2, 7, 6]
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 3, 1000])
+def test_merge_runs_equals_reduce(chunk_rows):
+    rng = np.random.default_rng(0)
+    runs = []
+    for rows in (0, 50, 120, 7):
+        keys = [rng.integers(0, 10, rows) for _ in range(3)]
+        runs.append(reduce_keys(*keys, rng.integers(1, 9, rows)))
+
+    merged = merge_runs(runs, chunk_rows)
+    expected = reduce_keys(*(np.concatenate(column) for column in zip(*runs)))
+    for actual, column in zip(merged, expected):
+        np.testing.assert_array_equal(actual, column)
+
+
+def test_spill_equals_in_memory(tmp_path, assert_same_frame):
+    rng = np.random.default_rng(1)
+    blocks = [random_block(rng, 300, start * 20) for start in range(12)]
+    in_memory = Aggregator()
+    spilled = Aggregator(
+        buffer_size=100, memory_limit=2000, spill_dir=tmp_path
+    )
+    for block in blocks:
+        in_memory.add_block(*block)
+        spilled.add_block(*block)
+
+    spill_dirs = list(tmp_path.glob("v2log-spill-*"))
+    assert spill_dirs and any(spill_dirs[0].iterdir())
+    assert_same_frame(spilled.to_frame(), in_memory.to_frame())
+    # 归并后删除临时文件
+    assert not any(tmp_path.iterdir())
+
+
+def test_update_merges_symbol_tables(assert_same_frame):
+    rng = np.random.default_rng(2)
+    blocks = [random_block(rng, 200, start) for start in (0, 10, 40)]
+    whole = Aggregator()
+    for block in blocks:
+        whole.add_block(*block)
+
+    combined = Aggregator()
+    for block in blocks:
+        part = Aggregator()
+        part.add_block(*block)
+        combined.update(part)
+    assert_same_frame(combined.to_frame(), whole.to_frame())
+    assert_same_frame(
+        Aggregator.from_frame(whole.to_frame()).to_frame(), whole.to_frame()
+    )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_memory_limit_equals_unlimited(
+    log_lines, make_log, make_analyzer, assert_same_frame, workers
+):
+    path = make_log(log_lines(3000))
+    expected = make_analyzer("unlimited").process_log_file(path)
+    limited = make_analyzer(
+        "limited", batch_size=200, memory_limit_mb=0.002, workers=workers
+    ).process_log_file(path)
+    assert_same_frame(limited, expected)
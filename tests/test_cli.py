@@ -0,0 +1,169 @@
+import functools
+import io
+import os
+import sys
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from v2log import analyzer
+from v2log.cli import main
+from v2log.partial import PARTIAL_SUFFIX, read_partial_meta
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    """调用命令行，分析器的缓存目录在 tmp_path 下"""
+    monkeypatch.setattr(
+        analyzer,
+        "IPAnalyzer",
+        functools.partial(analyzer.IPAnalyzer, cache_dir=tmp_path / "cache"),
+    )
+
+    def invoke(*args):
+        return CliRunner().invoke(main, [str(arg) for arg in args])
+
+    return invoke
+
+
+@pytest.fixture
+def log_path(log_lines, make_log):
+    return make_log(log_lines(2000))
+
+
+def read_csv(result) -> pd.DataFrame:
+    assert result.exit_code == 0, result.output
+    return pd.read_csv(io.BytesIO(result.stdout_bytes))
+
+
+def test_analyze_aggregate(run, log_path, make_analyzer):
+    df = read_csv(run("analyze", log_path, "--no-geo"))
+    expected = make_analyzer("reference").process_log_file(log_path)
+    assert list(df.columns) == list(expected.columns)
+    assert len(df) == len(expected)
+    assert df["count"].sum() == 2000
+
+
+def test_analyze_table(run, log_path):
+    dst = read_csv(run("analyze", log_path, "--no-geo", "--table", "dst"))
+    assert sorted(dst.columns) == ["count", "dst"]
+    assert dst["count"].sum() == 2000
+
+    result = run(
+        "analyze", log_path, "--no-geo", "--table", "src", "--format", "json"
+    )
+    assert result.exit_code == 0, result.output
+    src = pd.read_json(io.BytesIO(result.stdout_bytes), orient="records")
+    assert src["count"].sum() == 2000
+
+    # 不做地理定位时没有城市相关的汇总表
+    result = run("analyze", log_path, "--no-geo", "--table", "city")
+    assert result.exit_code == 1
+    assert "city" in result.output
+
+
+def test_analyze_output_dir(run, log_path, tmp_path):
+    output_dir = tmp_path / "out"
+    result = run(
+        "analyze",
+        log_path,
+        "--no-geo",
+        "--output-dir",
+        output_dir,
+        "--format",
+        "parquet",
+    )
+    assert result.exit_code == 0, result.output
+    assert sorted(path.name for path in output_dir.iterdir()) == [
+        f"{name}.parquet" for name in ("aggregate", "dst", "hour", "src")
+    ]
+    for path in output_dir.iterdir():
+        assert pd.read_parquet(path)["count"].sum() == 2000
+
+
+def test_analyze_time_range(run, log_path):
+    everything = read_csv(run("analyze", log_path, "--no-geo"))
+    everything["min"] = pd.to_datetime(everything["min"])
+    since, until = "2025-02-01 00:00:00", "2025-02-01 06:00:00"
+
+    selected = read_csv(
+        run(
+            "analyze",
+            log_path,
+            "--no-geo",
+            "--since",
+            since,
+            "--until",
+            until,
+        )
+    )
+    expected = everything[
+        (everything["min"] >= since) & (everything["min"] < until)
+    ]
+    assert 0 < len(selected) == len(expected) < len(everything)
+    assert selected["count"].sum() == expected["count"].sum()
+
+    # 汇总表按时间范围重新汇总
+    hour = read_csv(
+        run(
+            "analyze",
+            log_path,
+            "--no-geo",
+            "--table",
+            "hour",
+            "--since",
+            since,
+        )
+    )
+    assert (
+        hour["count"].sum()
+        == everything.loc[everything["min"] >= since, "count"].sum()
+    )
+
+
+def test_analyze_partial(run, log_path, tmp_path):
+    result = run("analyze", log_path, "--partial", tmp_path / "host.parquet")
+    assert result.exit_code == 1
+    assert PARTIAL_SUFFIX in result.output
+
+    output = tmp_path / f"host{PARTIAL_SUFFIX}"
+    result = run("analyze", log_path, "--partial", output)
+    assert result.exit_code == 0, result.output
+    assert read_partial_meta(output)["sources"][0]["rows"] > 0
+
+
+def test_analyze_errors(run, log_path, tmp_path):
+    result = run("analyze", tmp_path / "missing.log", "--no-geo")
+    assert result.exit_code == 1
+
+    result = run("analyze", log_path, "--no-geo", "--filter", "host:a.com")
+    assert result.exit_code == 1
+
+    result = run("analyze", log_path, "--db-path", tmp_path / "missing.BIN")
+    assert result.exit_code == 1
+    assert "IP2Location" in result.output
+
+
+def test_log_file_defaults_to_serve(run, log_path, tmp_path, monkeypatch):
+    import streamlit.web.cli as stcli
+
+    launched = []
+    monkeypatch.setattr(stcli, "main", lambda: launched.append(sys.argv))
+    monkeypatch.setattr(sys, "argv", sys.argv)
+    monkeypatch.setattr(os, "environ", dict(os.environ))
+    db_path = tmp_path / "DB11.BIN"
+    db_path.touch()
+
+    result = run(log_path, "--db-path", db_path, "--workers", 2)
+    assert result.exit_code == 0, result.output
+    assert launched[0][:2] == ["streamlit", "run"]
+    assert launched[0][2].endswith("app.py")
+    assert os.environ["READER_LOG_FILE"] == str(log_path)
+    assert os.environ["READER_WORKERS"] == "2"
+
+    # 不带参数时同样执行 serve，提示需要指定日志文件
+    result = run()
+    assert result.exit_code == 1
+    assert "--demo" in result.output
+    assert "analyze" in run("--help").output
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from v2log.filters import compile_filter
+
+MINUTE = 60 * 10**9
+
+
+def block(*rows):
+    """构造 parse_block 格式的数据，每行为 (时间, src, dst)"""
+    minutes = np.array(
+        [pd.Timestamp(time).value // MINUTE for time, _, _ in rows]
+    )
+    return (
+        minutes,
+        [src for _, src, _ in rows],
+        [dst for _, _, dst in rows],
+        np.ones(len(rows), dtype=np.int64),
+    )
+
+
+ROWS = block(
+    ("2025-01-01 07:59", "10.1.2.3", "example.com"),
+    ("2025-01-01 08:00", "10.1.2.3", "www.Example.com"),
+    ("2025-01-01 09:30", "192.168.1.5", "badexample.com"),
+    ("2025-01-01 11:59", "192.168.1.5", "www.youtube.com"),
+    ("2025-01-01 12:00", "2001:db8::1", "a.b.example.com"),
+)
+
+
+@pytest.mark.parametrize("expression", [None, "", "   "])
+def test_empty_expression(expression):
+    assert compile_filter(expression) is None
+
+
+@pytest.mark.parametrize(
+    "expression, normalized",
+    [
+        (
+            "src:10.0.0.1/8 dst:B.com,*.a.com",
+            "dst:*.a.com,b.com src:10.0.0.0/8",
+        ),
+        ("dst:a.com,,A.com", "dst:a.com"),
+        ("!dst:a.com", "-dst:a.com"),
+        ("src:1.2.3.4/32,::1", "src:1.2.3.4,::1"),
+        (
+            'time:"2025-01-01 08:00..2025-01-01 12:00"',
+            "time:2025-01-01T08:00:00..2025-01-01T12:00:00",
+        ),
+        ("time:2025-01-01_08:00..", "time:2025-01-01T08:00:00.."),
+        ("Country:China,JAPAN", "country:china,japan"),
+    ],
+)
+def test_normalized(expression, normalized):
+    assert compile_filter(expression).normalized == normalized
+
+
+def test_equivalent_expressions_share_cache_key():
+    first = compile_filter("dst:b.com,a.com -src:10.0.0.0/8")
+    second = compile_filter("!src:10.1.2.3/8   DST:A.com,b.com")
+    assert first.normalized == second.normalized
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "host:a.com",
+        "dst:",
+        "dst",
+        "src:999.1.1.1",
+        "src:10.0.0.0/40",
+        "time:2025-01-01",
+        "time:..",
+        "time:tomorrow..",
+        'dst:"unclosed',
+    ],
+)
+def test_invalid_expression(expression):
+    with pytest.raises(ValueError):
+        compile_filter(expression)
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        ("dst:*.example.com", [0, 1, 4]),
+        ("dst:example.com", [0]),
+        ("dst:*.example.com,*.youtube.com", [0, 1, 3, 4]),
+        ("-dst:*.example.com", [2, 3]),
+        ("src:10.0.0.0/8", [0, 1]),
+        ("src:2001:db8::/32,192.168.1.5", [2, 3, 4]),
+        ('time:"2025-01-01 08:00..2025-01-01 12:00"', [1, 2, 3]),
+        ("time:..2025-01-01_08:00", [0]),
+        ("time:2025-01-01_11:59:30..", [4]),
+        ("dst:*.example.com src:10.0.0.0/8", [0, 1]),
+        ("dst:nothing.com", []),
+    ],
+)
+def test_apply(expression, expected):
+    minutes, srcs, dsts, counts = compile_filter(expression).apply(*ROWS)
+    assert list(minutes) == list(ROWS[0][expected])
+    assert srcs == [ROWS[1][i] for i in expected]
+    assert dsts == [ROWS[2][i] for i in expected]
+    assert len(counts) == len(expected)
+
+
+def test_country_without_geo():
+    log_filter = compile_filter("country:china")
+    assert log_filter.needs_geo
+    with pytest.raises(ValueError):
+        log_filter.apply(*ROWS)
+
+
+def test_country_filter_requires_geolocation(make_analyzer):
+    with pytest.raises(ValueError):
+        make_analyzer(log_filter="country:china")
+
+
+def test_filter_is_applied_while_parsing(
+    log_lines, make_log, make_analyzer, assert_same_frame
+):
+    path = make_log(log_lines(500))
+    everything = make_analyzer("all").process_log_file(path)
+    filtered = make_analyzer(
+        "filtered", log_filter="dst:*.example1.com src:10.0.1.0/24"
+    ).process_log_file(path)
+
+    expected = everything[
+        everything["dst"].astype(str).str.endswith(".example1.com")
+        & everything["src"].astype(str).str.startswith("10.0.1.")
+    ]
+    assert len(filtered)
+    assert_same_frame(filtered, expected)
@@ -0,0 +1,30 @@
+from v2log.follow import LogFollower
+
+
+def test_follower_matches_incremental_result(
+    log_lines, make_log, make_analyzer, assert_same_frame
+):
+    lines = log_lines(3000)
+    path = make_log(lines[:1000])
+    analyzer = make_analyzer()
+    follower = LogFollower(analyzer, path, poll_interval=3600)
+    follower.start()
+    version = follower.version
+
+    with path.open("a") as f:
+        f.write("".join(lines[1000:]))
+    assert follower.poll()
+    assert follower.version > version
+    assert not follower.poll()
+    assert int(follower.snapshot()["count"].sum()) == 3000
+
+    follower.stop()
+    reference = make_analyzer("reference").process_log_file(path)
+    assert_same_frame(follower.snapshot(), reference)
+    # 停止时保存的状态由增量模式继续使用
+    offset, aggregated_data = analyzer.load_incremental_state(path)
+    assert offset == path.stat().st_size
+    assert_same_frame(aggregated_data.to_frame(), reference)
+    assert_same_frame(
+        make_analyzer().process_log_file(path, incremental=True), reference
+    )
@@ -0,0 +1,205 @@
+import bisect
+import ipaddress
+import os
+import random
+import struct
+
+import IP2Location
+import numpy as np
+import pytest
+
+from v2log.geo import DEFAULT_LOCATION, MAX_IPV4, MAX_IPV6, GeoLocator
+
+COUNTRIES = [
+    ("US", "United States of America"),
+    ("CN", "China"),
+    ("DE", "Germany"),
+    ("-", "-"),
+]
+CITIES = ["Mountain View", "Hangzhou", "Berlin", "-", "Shanghai"]
+COLUMNS = 8
+HEADER_SIZE = 64
+
+
+def pack_string(text, width=None):
+    data = text.encode()
+    if width is not None:
+        data = data.ljust(width, b"\0")
+    return bytes([len(text)]) + data
+
+
+def ipv4_index(starts):
+    """每个 /16 前缀对应的行号范围 (low, high)，与官方生成的索引格式一致"""
+    index = bytearray()
+    # 末尾一行只是结束地址，不是区间
+    ranges = starts[:-1]
+    for prefix in range(2**16):
+        low = bisect.bisect_right(ranges, prefix << 16) - 1
+        high = bisect.bisect_right(ranges, (prefix << 16) | 0xFFFF) - 1
+        index += struct.pack("<2I", low, high)
+    return index
+
+
+def build_db11(path, ipv4_starts, ipv6_starts, seed=0):
+    """生成 DB11 格式的数据库文件，只填写经纬度、国家、城市四个字段
+
+    ipv4_starts/ipv6_starts 为各区间的起始地址，须从0开始递增，
+    表末尾另有一行作为最后一个区间的结束地址。
+    """
+    rng = random.Random(seed)
+    ipv4_starts = list(ipv4_starts) + [MAX_IPV4]
+    ipv6_starts = list(ipv6_starts) + [MAX_IPV6] if ipv6_starts else []
+    ipv4_size = len(ipv4_starts) * COLUMNS * 4
+    ipv6_size = len(ipv6_starts) * (COLUMNS * 4 + 12)
+    index_addr = HEADER_SIZE
+    ipv4_addr = index_addr + 2**16 * 8
+    ipv6_addr = ipv4_addr + ipv4_size
+    strings_addr = ipv6_addr + ipv6_size
+
+    strings = bytearray()
+    countries, cities = {}, {}
+    for short, long in COUNTRIES:
+        countries[short] = strings_addr + len(strings)
+        strings += pack_string(short, 2) + pack_string(long)
+    for city in CITIES:
+        cities[city] = strings_addr + len(strings)
+        strings += pack_string(city)
+    empty = strings_addr + len(strings)
+    strings += b"\0"
+
+    def columns(row):
+        country = COUNTRIES[row % len(COUNTRIES)][0]
+        city = CITIES[row % len(CITIES)]
+        known = country != "-"
+        return struct.pack(
+            "<IIIffII",
+            countries[country],
+            empty,
+            cities[city],
+            rng.uniform(-80, 80) if known else 0.0,
+            rng.uniform(-170, 170) if known else 0.0,
+            empty,
+            empty,
+        )
+
+    body = ipv4_index(ipv4_starts)
+    for row, start in enumerate(ipv4_starts):
+        body += struct.pack("<I", start) + columns(row)
+    for row, start in enumerate(ipv6_starts):
+        body += start.to_bytes(16, "little") + columns(row)
+
+    header = struct.pack(
+        "<5B6I3B",
+        11,
+        COLUMNS,
+        25,
+        1,
+        1,
+        len(ipv4_starts) - 1,
+        ipv4_addr + 1,
+        max(len(ipv6_starts) - 1, 0),
+        ipv6_addr + 1 if ipv6_starts else 0,
+        index_addr + 1,
+        0,
+        1,
+        1,
+        0,
+    ).ljust(HEADER_SIZE, b"\0")
+    path.write_bytes(header + body + strings)
+    return path
+
+
+def reference_location(database, ip):
+    """官方库的查询结果，转换为 GeoLocator 的格式"""
+    try:
+        record = database.get_all(ip)
+        return {
+            "x": np.float32(record.latitude),
+            "y": np.float32(record.longitude),
+            "country": record.country_long,
+            "city": record.city,
+        }
+    except Exception:
+        return DEFAULT_LOCATION.copy()
+
+
+def sample_ips(ipv4_starts, ipv6_starts, rng):
+    ips = ["0.0.0.0", "0.0.0.1", "255.255.255.254", "255.255.255.255"]
+    for start in ipv4_starts[1:]:
+        ips += [
+            str(ipaddress.IPv4Address(start - 1)),
+            str(ipaddress.IPv4Address(start)),
+        ]
+    ips += [
+        str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(300)
+    ]
+
+    ips += ["::", "::1", "ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff"]
+    for start in ipv6_starts[1:]:
+        ips += [
+            str(ipaddress.IPv6Address(start - 1)),
+            str(ipaddress.IPv6Address(start)),
+        ]
+    ips += [
+        str(ipaddress.IPv6Address(rng.getrandbits(128))) for _ in range(100)
+    ]
+    # 映射到IPv4的IPv6地址按IPv4查询
+    ips += [
+        "::ffff:1.2.3.4",
+        "2002:102:304::1",
+        "2001:0:4136:e378:8000:63bf:3fff:fdd2",
+    ]
+    # 无效地址返回默认值
+    ips += ["", "garbage", "1.2", "1.2.3.256", " 1.2.3.4", "2001:db8::g"]
+    return ips
+
+
+@pytest.mark.parametrize("with_ipv6", [True, False])
+def test_engines_match_ip2location(tmp_path, with_ipv6):
+    rng = random.Random(3)
+    ipv4_starts = [0] + sorted(rng.sample(range(1, MAX_IPV4), 400))
+    ipv6_starts = (
+        [0] + sorted(rng.getrandbits(126) << 2 for _ in range(40))
+        if with_ipv6
+        else []
+    )
+    path = build_db11(tmp_path / "DB11.BIN", ipv4_starts, ipv6_starts)
+    ips = sample_ips(ipv4_starts, ipv6_starts, rng)
+
+    database = IP2Location.IP2Location(str(path))
+    expected = {ip: reference_location(database, ip) for ip in ips}
+    database.close()
+    # 确认样本覆盖了已知和未知的地址
+    countries = {location["country"] for location in expected.values()}
+    assert {"China", "-", "Unknown"} <= countries
+
+    for engine in GeoLocator.ENGINES:
+        with GeoLocator(path, engine=engine) as locator:
+            assert locator.locate_many(ips) == expected
+        with GeoLocator(path, engine=engine) as locator:
+            assert {ip: locator.locate(ip) for ip in ips} == expected
+            for location in locator.cache.values():
+                assert type(location["x"]) is np.float32
+
+
+def test_handles_and_persisted_cache(tmp_path):
+    path = build_db11(tmp_path / "DB11.BIN", [0, 2**24, 2**31], [0, 2**64])
+    persist_dir = tmp_path / "cache"
+    persist_dir.mkdir()
+
+    with GeoLocator(path, engine="mmap", persist_dir=persist_dir) as locator:
+        # mmap 引擎不打开文件句柄，也不加载官方库
+        assert locator._f is None and locator._database is None
+        locations = locator.locate_many(["1.2.3.4", "2001:db8::1"])
+        locator.save()
+    assert locator.engine is None
+
+    with GeoLocator(path, persist_dir=persist_dir) as locator:
+        assert locator._database is None
+        assert dict(locator.cache) == locations
+
+    # 数据库文件更新后不再使用旧的缓存
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    with GeoLocator(path, persist_dir=persist_dir) as locator:
+        assert not locator.cache
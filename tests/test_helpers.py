@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from v2log.utils.helpers import (
+    MAX_MAP_POINTS,
+    MAX_TIMELINE_BUCKETS,
+    OTHER_SERIES,
+    bin_map_markers,
+    prepare_timeline_data,
+    timeline_frequency,
+)
+
+
+def random_markers(rows, seed=0):
+    """随机生成按城市汇总的地图标记，坐标为 (纬度, 经度)"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "city": [f"city{i}" for i in range(rows)],
+            "x": rng.uniform(-80, 80, rows),
+            "y": rng.uniform(-170, 170, rows),
+            "count": rng.integers(1, 1000, rows),
+        }
+    )
+
+
+def test_bin_merges_weighted_centroid():
+    markers = pd.DataFrame(
+        {
+            "city": ["a", "b", "c"],
+            "x": [10.0, 10.4, -40.0],
+            "y": [20.0, 20.8, 100.0],
+            "count": [1, 3, 5],
+        }
+    )
+    binned = bin_map_markers(markers, zoom=0).sort_values("city")
+    assert binned["city"].tolist() == ["b", "c"]
+    assert binned["count"].tolist() == [4, 5]
+    assert binned["cities"].tolist() == [2, 1]
+    np.testing.assert_allclose(binned["x"], [10.3, -40.0])
+    np.testing.assert_allclose(binned["y"], [20.6, 100.0])
+
+
+@pytest.mark.parametrize("zoom", [0, 3, 8, 20])
+def test_bin_keeps_total_count(zoom):
+    markers = random_markers(1500)
+    binned = bin_map_markers(markers, zoom)
+    assert binned["count"].sum() == markers["count"].sum()
+    assert binned["cities"].sum() == len(markers)
+    # 格子内的中心位于合并的标记之间
+    assert binned["x"].between(-80, 80).all()
+    assert binned["y"].between(-170, 170).all()
+
+
+def test_bin_count_grows_with_zoom():
+    markers = random_markers(1500)
+    sizes = [len(bin_map_markers(markers, zoom)) for zoom in range(12)]
+    assert sizes == sorted(sizes)
+    assert sizes[0] < sizes[-1] == len(markers)
+
+
+@pytest.mark.parametrize("max_points", [10, MAX_MAP_POINTS])
+def test_bin_caps_marker_count(max_points):
+    markers = random_markers(MAX_MAP_POINTS * 2)
+    binned = bin_map_markers(markers, zoom=20, max_points=max_points)
+    assert len(binned) == max_points
+    # 保留访问量最大的标记
+    assert (
+        sorted(binned["count"], reverse=True)
+        == sorted(markers["count"], reverse=True)[:max_points]
+    )
+
+
+def minute_city(minutes, cities, seed=0):
+    """随机生成按 (分钟, 城市) 汇总的数据，城市的访问量依次递减"""
+    rng = np.random.default_rng(seed)
+    rows = minutes * 4
+    city = rng.zipf(1.5, rows) % cities
+    return pd.DataFrame(
+        {
+            "min": pd.Timestamp("2025-01-01 00:03")
+            + pd.to_timedelta(np.sort(rng.integers(0, minutes, rows)), "min"),
+            "city": pd.Categorical(
+                [f"city{i}" for i in city],
+                categories=[f"city{i}" for i in range(cities)],
+            ),
+            "count": rng.integers(1, 10, rows),
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "span, freq",
+    [
+        ("0min", "1min"),
+        ("298min", "1min"),
+        ("299min", "5min"),
+        ("2D", "1h"),
+        ("30D", "1D"),
+        ("298D", "1D"),
+        ("299D", "2D"),
+        ("598D", "3D"),
+        ("10000D", "34D"),
+    ],
+)
+def test_timeline_frequency(span, freq):
+    assert timeline_frequency(pd.Timedelta(span)) == freq
+
+
+@pytest.mark.parametrize("minutes", [1, 299, 1500, 60 * 24 * 400])
+@pytest.mark.parametrize("offset", range(5))
+def test_timeline_bucket_limit(minutes, offset):
+    start = pd.Timestamp("2025-01-01 23:55") + pd.Timedelta(offset, "min")
+    df = pd.DataFrame(
+        {
+            "min": [start, start + pd.Timedelta(minutes, "min")],
+            "city": ["a", "b"],
+            "count": [1, 2],
+        }
+    )
+    timeline = prepare_timeline_data(df)
+    assert len(timeline) <= MAX_TIMELINE_BUCKETS
+    assert timeline["total"].sum() == 3
+
+
+@pytest.mark.parametrize("minutes", [100, 3000, 60 * 24 * 30])
+def test_timeline_series_limit(minutes):
+    df = minute_city(minutes, cities=40)
+    df.loc[df.index[::13], "city"] = None
+    timeline = prepare_timeline_data(df, top_n=5, max_buckets=50)
+
+    assert len(timeline) <= 50
+    totals = df.groupby("city", observed=True)["count"].sum()
+    top = totals.sort_values(ascending=False, kind="stable").index[:5]
+    assert list(timeline.columns) == [*top, OTHER_SERIES, "total"]
+    # 其余城市和缺失值归入"其他"，总数不变
+    for city in top:
+        assert timeline[city].sum() == totals[city]
+    assert timeline[OTHER_SERIES].sum() == (
+        df["count"].sum() - totals[top].sum()
+    )
+    assert timeline["total"].sum() == df["count"].sum()
+    assert (timeline["total"] == timeline.iloc[:, :-1].sum(axis=1)).all()
+
+
+def test_timeline_few_cities():
+    df = minute_city(100, cities=3)
+    timeline = prepare_timeline_data(df, top_n=10)
+    # 没有需要合并的城市时不显示"其他"
+    assert sorted(timeline.columns[:-1]) == ["city0", "city1", "city2"]
+    assert timeline.columns[-1] == "total"
+
+
+def test_timeline_empty():
+    df = minute_city(10, cities=3).iloc[:0]
+    assert prepare_timeline_data(df).empty
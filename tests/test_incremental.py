@@ -0,0 +1,280 @@
+import functools
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from v2log import cache
+from v2log.parser import SETTLE_SECONDS, iter_blocks
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    """按 4KB 读取日志，小文件也会分为多个批次并写入断点"""
+    monkeypatch.setattr(
+        "v2log.analyzer.iter_blocks",
+        functools.partial(iter_blocks, block_size=4096),
+    )
+
+
+def settle(path):
+    """把修改时间调到 SETTLE_SECONDS 之前，视为已写完"""
+    past = time.time() - SETTLE_SECONDS - 1
+    os.utime(path, (past, past))
+
+
+def append(path, lines):
+    with path.open("a") as f:
+        f.write("".join(lines))
+
+
+def rebuilt(make_analyzer, path, name="reference"):
+    return make_analyzer(name).process_log_file(path, use_cache=False)
+
+
+def assert_same_rollups(actual, expected):
+    assert sorted(actual) == sorted(expected)
+    for name, table in expected.items():
+        keys = [c for c in table.columns if c != "count"]
+        pd.testing.assert_frame_equal(
+            actual[name]
+            .astype({key: str for key in keys if key != "min"})
+            .sort_values(keys, ignore_index=True),
+            table.astype(
+                {key: str for key in keys if key != "min"}
+            ).sort_values(keys, ignore_index=True),
+            check_dtype=False,
+        )
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_resume_after_interruption(
+    small_blocks,
+    log_lines,
+    make_log,
+    make_analyzer,
+    assert_same_frame,
+    incremental,
+):
+    path = make_log(log_lines(2000))
+    batches = []
+
+    def interrupt(batch):
+        batches.append(batch)
+        if len(batches) == 3:
+            raise Interrupted
+
+    analyzer = make_analyzer(batch_size=100)
+    with pytest.raises(Interrupted):
+        analyzer.process_log_file(
+            path, batch_callback=interrupt, incremental=incremental
+        )
+
+    progress = []
+    result = make_analyzer(batch_size=100).process_log_file(
+        path,
+        incremental=incremental,
+        progress_callback=lambda value, text: progress.append(value),
+    )
+    assert_same_frame(result, rebuilt(make_analyzer, path))
+    # 从断点继续，不从头解析
+    assert 0 < progress[0] < 1
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_checkpoint_segments_are_merged(
+    small_blocks,
+    monkeypatch,
+    log_lines,
+    make_log,
+    make_analyzer,
+    assert_same_frame,
+    incremental,
+):
+    monkeypatch.setattr("v2log.analyzer.MAX_CHECKPOINT_SEGMENTS", 3)
+    path = make_log(log_lines(4000))
+    batches = []
+
+    def interrupt(batch):
+        batches.append(batch)
+        if len(batches) == 12:
+            raise Interrupted
+
+    analyzer = make_analyzer(batch_size=100)
+    with pytest.raises(Interrupted):
+        analyzer.process_log_file(
+            path, batch_callback=interrupt, incremental=incremental
+        )
+    state_path = (
+        analyzer.get_state_path(path)
+        if incremental
+        else analyzer.get_cache_path(path).with_suffix(".temp.pkl")
+    )
+    segments = analyzer.load_cache(state_path)["segments"]
+    assert 0 < len(segments) <= 3
+    assert sorted(analyzer._checkpoint_segments(state_path)) == sorted(
+        state_path.with_name(name) for name in segments
+    )
+
+    result = make_analyzer(batch_size=100).process_log_file(
+        path, incremental=incremental
+    )
+    assert_same_frame(result, rebuilt(make_analyzer, path))
+
+
+def test_append_merges_into_touched_partitions(
+    log_lines, make_log, make_analyzer, assert_same_frame
+):
+    lines = log_lines(6000)
+    path = make_log(lines[:4000])
+    analyzer = make_analyzer()
+    analyzer.process_log_file(path, incremental=True)
+    analyzer.get_rollups(path, incremental=True)
+    frame_path = analyzer._result_frame_path(path, True)
+    before = {
+        entry["file"]: (frame_path / entry["file"]).stat().st_mtime_ns
+        for entry in cache.read_manifest(frame_path)["partitions"]
+    }
+
+    append(path, lines[4000:])
+    batches = []
+    result = analyzer.process_log_file(
+        path, incremental=True, batch_callback=batches.append
+    )
+
+    reference = make_analyzer("reference")
+    assert_same_frame(result, reference.process_log_file(path))
+    # 回调只收到新增的数据
+    assert sum(int(batch["count"].sum()) for batch in batches) == 2000
+    assert_same_rollups(
+        analyzer.get_rollups(path, incremental=True),
+        reference.get_rollups(path),
+    )
+    assert list(analyzer.get_search_index(path, incremental=True).values) == (
+        list(reference.get_search_index(path).values)
+    )
+
+    partitions = cache.read_manifest(frame_path)["partitions"]
+    unchanged = [
+        entry["file"]
+        for entry in partitions
+        if before.get(entry["file"])
+        == (frame_path / entry["file"]).stat().st_mtime_ns
+    ]
+    assert unchanged == [f"2025-01{cache.FRAME_SUFFIX}"]
+    assert len(partitions) > len(before)
+
+
+def test_time_range_reads_saved_result(log_lines, make_log, make_analyzer):
+    path = make_log(log_lines(3000))
+    analyzer = make_analyzer()
+    everything = analyzer.process_log_file(path, incremental=True)
+    start, end = pd.Timestamp("2025-02-01"), pd.Timestamp("2025-02-01 06:00")
+    selected = analyzer.process_log_file(
+        path,
+        incremental=True,
+        columns=["min", "count"],
+        time_range=(start, end),
+    )
+    expected = everything[
+        (everything["min"] >= start) & (everything["min"] < end)
+    ]
+    assert list(selected.columns) == ["min", "count"]
+    assert int(selected["count"].sum()) == int(expected["count"].sum()) > 0
+    assert analyzer.get_time_bounds(path, incremental=True) == (
+        everything["min"].min(),
+        everything["min"].max(),
+    )
+
+
+def test_final_line_without_newline(log_lines, make_log, make_analyzer):
+    lines = log_lines(100)
+    path = make_log(lines[:-1] + [lines[-1].rstrip("\n")])
+    analyzer = make_analyzer()
+
+    # 文件刚写入时最后一行可能尚未写完
+    result = analyzer.process_log_file(path, incremental=True)
+    assert int(result["count"].sum()) == 99
+
+    settle(path)
+    result = analyzer.process_log_file(path, incremental=True)
+    assert int(result["count"].sum()) == 100
+
+    # 之后补上换行和新行，已计入的行不会重复计数
+    append(path, ["\n", lines[0]])
+    settle(path)
+    result = analyzer.process_log_file(path, incremental=True)
+    assert int(result["count"].sum()) == 101
+
+
+@pytest.mark.parametrize("change", ["truncate", "rewrite", "rotate"])
+def test_rebuild_when_file_is_replaced(
+    log_lines, make_log, make_analyzer, assert_same_frame, change
+):
+    path = make_log(log_lines(1500))
+    analyzer = make_analyzer()
+    analyzer.process_log_file(path, incremental=True)
+
+    if change == "truncate":
+        make_log(log_lines(1500)[:500])
+    elif change == "rewrite":
+        make_log(log_lines(1500, seed=7))
+    else:
+        path.rename(path.with_name("access.log.1"))
+        make_log(log_lines(800, seed=3))
+
+    assert_same_frame(
+        analyzer.process_log_file(path, incremental=True),
+        rebuilt(make_analyzer, path),
+    )
+
+
+def test_compact_merges_closed_months(
+    log_lines, make_log, make_analyzer, assert_same_frame
+):
+    lines = log_lines(6000)
+    path = make_log(lines[:300])
+    analyzer = make_analyzer()
+    analyzer.process_log_file(path, incremental=True)
+    append(path, lines[300:])
+    analyzer.process_log_file(path, incremental=True)
+    analyzer.get_rollups(path, incremental=True)
+
+    frame_path = analyzer._result_frame_path(path, True)
+    files = [
+        entry["file"]
+        for entry in cache.read_manifest(frame_path)["partitions"]
+    ]
+    assert files[0].startswith("2025-01-31")
+
+    compacted = analyzer.compact(path)
+    files = [
+        entry["file"]
+        for entry in cache.read_manifest(frame_path)["partitions"]
+    ]
+    assert compacted == [f"2025-01{cache.FRAME_SUFFIX}"]
+    assert files[0] == compacted[0]
+    assert sorted(p.name for p in frame_path.iterdir()) == sorted(
+        files + [cache.MANIFEST_NAME, cache.SCHEMA_NAME]
+    )
+    assert analyzer.compact(path) == []
+
+    assert_same_frame(
+        make_analyzer().process_log_file(path, incremental=True),
+        rebuilt(make_analyzer, path),
+    )
+    # 汇总表在整理后仍然有效，不需要重新计算
+    assert cache.frame_mtime_ns(frame_path) <= min(
+        p.stat().st_mtime_ns for p in frame_path.parent.glob("*.rollup-*")
+    )
+
+
+def test_compact_without_result(log_lines, make_log, make_analyzer):
+    path = make_log(log_lines(10))
+    with pytest.raises(FileNotFoundError):
+        make_analyzer().compact(path)
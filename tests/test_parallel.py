@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from v2log.parser import split_file_ranges
+
+
+def test_split_file_ranges_align_to_lines(log_lines, make_log):
+    path = make_log(log_lines(2000))
+    data = path.read_bytes()
+    parts = 7
+
+    # 按字节均分的位置大多落在行中间
+    targets = [len(data) * i // parts for i in range(1, parts)]
+    assert any(data[target - 1] != ord("\n") for target in targets)
+
+    ranges = split_file_ranges(path, parts)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+        assert data[start - 1] == ord("\n")
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+@pytest.mark.parametrize(
+    "log_filter", [None, "dst:*.example1.com,*.example2.com -src:10.0.2.0/24"]
+)
+def test_parallel_equals_serial(
+    log_lines, make_log, make_analyzer, log_filter, incremental
+):
+    path = make_log(log_lines(5000))
+    serial = make_analyzer("serial", log_filter=log_filter).process_log_file(
+        path, incremental=incremental
+    )
+    parallel = make_analyzer(
+        "parallel", workers=3, log_filter=log_filter
+    ).process_log_file(path, incremental=incremental)
+
+    assert len(serial)
+    # 行按键排序，分类取值按首次出现的顺序，两者完全相同
+    pd.testing.assert_frame_equal(parallel, serial)
@@ -0,0 +1,111 @@
+import pytest
+from click.testing import CliRunner
+
+from v2log.cli import main
+from v2log.partial import (
+    PARTIAL_SUFFIX,
+    iter_partial_chunks,
+    merge_partials,
+    partial_rows,
+    read_partial_meta,
+)
+
+
+@pytest.fixture
+def host_logs(log_lines, make_log):
+    """三台主机的日志，时间范围相互重叠，部分 (min, src, dst) 重复"""
+    return [
+        make_log(log_lines(count, seed=seed), f"host{seed}.log")
+        for seed, count in enumerate((800, 600, 1000))
+    ]
+
+
+def export(make_analyzer, paths, tmp_path, **kwargs):
+    partials = []
+    for path in paths:
+        output = tmp_path / f"{path.stem}{PARTIAL_SUFFIX}"
+        make_analyzer(path.stem, **kwargs).export_partial(path, output)
+        partials.append(output)
+    return partials
+
+
+@pytest.mark.parametrize("rows", [7, 100, 1_000_000])
+def test_merge_equals_single_run(
+    host_logs, make_log, make_analyzer, assert_same_frame, tmp_path, rows
+):
+    partials = export(make_analyzer, host_logs, tmp_path)
+    output = tmp_path / f"all{PARTIAL_SUFFIX}"
+    meta = merge_partials(partials, output, rows)
+
+    combined = make_log(
+        [line for path in host_logs for line in path.open()], "all.log"
+    )
+    expected = make_analyzer("single").process_log_file(combined)
+    merged = make_analyzer("merged").process_log_file(output)
+    assert_same_frame(merged, expected)
+    assert partial_rows(output) == len(expected)
+    assert [source["rows"] for source in meta["sources"]] == [
+        partial_rows(path) for path in partials
+    ]
+    assert read_partial_meta(output) == meta
+
+
+def test_merge_is_associative(
+    host_logs, make_analyzer, assert_same_frame, tmp_path
+):
+    first, second, third = export(make_analyzer, host_logs, tmp_path)
+    pair = tmp_path / f"pair{PARTIAL_SUFFIX}"
+    merge_partials([first, second], pair, 50)
+    nested = tmp_path / f"nested{PARTIAL_SUFFIX}"
+    merge_partials([pair, third], nested, 50)
+    flat = tmp_path / f"flat{PARTIAL_SUFFIX}"
+    merge_partials([first, second, third], flat, 50)
+
+    assert_same_frame(
+        make_analyzer("nested").process_log_file(nested),
+        make_analyzer("flat").process_log_file(flat),
+    )
+    assert len(read_partial_meta(nested)["sources"]) == 3
+
+
+def test_merge_rejects_different_filters(host_logs, make_analyzer, tmp_path):
+    plain = export(make_analyzer, host_logs[:1], tmp_path)
+    filtered = export(
+        make_analyzer, host_logs[1:2], tmp_path, log_filter="dst:*.com"
+    )
+    with pytest.raises(ValueError):
+        merge_partials(plain + filtered, tmp_path / f"x{PARTIAL_SUFFIX}")
+
+
+def test_parquet_requires_pyarrow(
+    host_logs, make_analyzer, assert_same_frame, tmp_path, monkeypatch
+):
+    partials = export(make_analyzer, host_logs[:2], tmp_path)
+    expected = tmp_path / f"expected{PARTIAL_SUFFIX}"
+    merge_partials(partials, expected)
+    reference = make_analyzer("parquet").process_log_file(expected)
+
+    monkeypatch.setattr("v2log.partial.pq", None)
+    with pytest.raises(ValueError, match="pyarrow"):
+        read_partial_meta(partials[0])
+    with pytest.raises(ValueError, match="pyarrow"):
+        partial_rows(partials[0])
+    with pytest.raises(ValueError, match="pyarrow"):
+        next(iter_partial_chunks(partials[0]))
+    result = CliRunner().invoke(
+        main, ["merge", *map(str, partials), "-o", str(expected)]
+    )
+    assert result.exit_code == 1
+    assert "pyarrow" in result.output
+
+    # 未安装 pyarrow 时以 pickle 格式保存和合并
+    pickled = [
+        path.with_name(f"{path.stem}.partial.pkl") for path in host_logs
+    ]
+    for path, output in zip(host_logs[:2], pickled):
+        make_analyzer(path.stem).export_partial(path, output)
+    output = tmp_path / "all.partial.pkl"
+    merge_partials(pickled[:2], output, 100)
+    assert_same_frame(
+        make_analyzer("pickled").process_log_file(output), reference
+    )
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from v2log.search import SUFFIX_PREFIX, SearchIndex, index_path
+
+VALUES = [
+    "example.com",
+    "www.Example.com",
+    "a.b.EXAMPLE.com",
+    "badexample.com",
+    "example.com.evil.net",
+    "s1.example1.com",
+    "youtube.com",
+    "i.ytimg.com",
+    "a+b.com",
+    "x.y",
+    "com",
+    "1.2.3.4",
+    "2001:db8::1",
+    "bücher.de",
+    "",
+]
+TERMS = [
+    "exa",
+    "EXAMPLE",
+    "example.com",
+    "e.c",
+    "a+b",
+    "1.2.3",
+    "::",
+    "bü",
+    "com",
+    "ple.co",
+    "youtubex",
+    "ex",
+    "m",
+    "",
+    "  tube ",
+]
+SUFFIX_TERMS = [
+    "*.example.com",
+    "*.Example.COM",
+    "*.com",
+    "*.ample.com",
+    "*.example1.com",
+    "*.y",
+    "*.nothing.org",
+]
+
+
+def expected_mask(series: pd.Series, term: str) -> np.ndarray:
+    """不使用索引的匹配结果"""
+    term = term.strip().lower()
+    lowered = series.astype("string").str.lower()
+    if term.startswith(SUFFIX_PREFIX):
+        domain = term[len(SUFFIX_PREFIX) :]
+        matched = (lowered == domain) | lowered.str.endswith("." + domain)
+    else:
+        matched = lowered.str.contains(term, regex=False)
+    return matched.fillna(False).to_numpy(dtype=bool)
+
+
+@pytest.fixture
+def column():
+    """包含重复取值和缺失值的分类列"""
+    rng = np.random.default_rng(0)
+    values = rng.choice(np.array(VALUES, dtype=object), 300)
+    values[::17] = None
+    return pd.Series(values, dtype="category")
+
+
+@pytest.mark.parametrize("term", TERMS + SUFFIX_TERMS)
+def test_match_equals_scan(term):
+    index = SearchIndex(VALUES)
+    np.testing.assert_array_equal(
+        index.match(term), expected_mask(pd.Series(VALUES), term)
+    )
+
+
+@pytest.mark.parametrize("term", TERMS + SUFFIX_TERMS)
+def test_filter_mask_equals_scan(column, term):
+    # 列中部分取值不在索引中，例如索引建立后新增的数据
+    index = SearchIndex(VALUES[::2])
+    expected = expected_mask(column, term)
+    np.testing.assert_array_equal(index.filter_mask(column, term), expected)
+    np.testing.assert_array_equal(
+        index.filter_mask(column.astype(object), term), expected
+    )
+
+
+def test_suffix_matches_bare_domain():
+    index = SearchIndex(VALUES)
+    assert list(index.values[index.match("*.example.com")]) == [
+        "example.com",
+        "www.Example.com",
+        "a.b.EXAMPLE.com",
+    ]
+
+
+def test_save_and_load(tmp_path, column):
+    index = SearchIndex(VALUES)
+    path = index_path(tmp_path / "access.frame.parts")
+    assert path == tmp_path / "access.frame.search.pkl"
+    index.save(path)
+
+    loaded = SearchIndex.load(path)
+    assert len(loaded) == len(index)
+    for term in TERMS + SUFFIX_TERMS:
+        np.testing.assert_array_equal(loaded.match(term), index.match(term))
+        np.testing.assert_array_equal(
+            loaded.filter_mask(column, term), index.filter_mask(column, term)
+        )
@@ -0,0 +1,148 @@
+import gzip
+import lzma
+import os
+
+import pytest
+
+from v2log import sources
+from v2log.cache import FRAME_SUFFIX
+from v2log.sources import (
+    compression_of,
+    expand_sources,
+    open_source,
+    rotation_index,
+)
+
+COMPRESSORS = {
+    "gzip": gzip.compress,
+    "xz": lzma.compress,
+}
+if sources.zstd is not None:
+    COMPRESSORS["zstd"] = lambda data: sources.zstd.compress(data)
+
+
+@pytest.mark.parametrize("kind", [None, *COMPRESSORS])
+def test_open_source(tmp_path, log_lines, kind):
+    data = "".join(log_lines(500)).encode()
+    # 按文件头识别，与扩展名无关
+    path = tmp_path / "access.log.gz"
+    path.write_bytes(COMPRESSORS[kind](data) if kind else data)
+
+    assert compression_of(path) == kind
+    stream, raw = open_source(path)
+    with raw, stream:
+        assert stream.read() == data
+        assert raw.tell() == path.stat().st_size
+
+
+def test_zstd_without_library(tmp_path, monkeypatch):
+    path = tmp_path / "access.log"
+    path.write_bytes(b"\x28\xb5\x2f\xfd" + bytes(16))
+    assert compression_of(path) == "zstd"
+
+    monkeypatch.setattr(sources, "zstd", None)
+    with pytest.raises(ValueError, match="zstandard"):
+        open_source(path)
+
+
+@pytest.mark.parametrize(
+    "name, index",
+    [
+        ("access.log", 0),
+        ("access.log.1", 1),
+        ("access.log.2.gz", 2),
+        ("access.log.10.zst", 10),
+        ("access.log-20250101.gz", 0),
+    ],
+)
+def test_rotation_index(name, index):
+    assert rotation_index(name) == index
+
+
+def test_expand_sources_order(tmp_path):
+    names = [
+        "access.log",
+        "access.log.1",
+        "access.log.2.gz",
+        "access.log.10.gz",
+        "access.log-20250101",
+        "access.log-20250102",
+    ]
+    for age, name in enumerate(reversed(names)):
+        path = tmp_path / name
+        path.write_text(name)
+        os.utime(path, ns=(0, (len(names) - age) * 10**9))
+    (tmp_path / "access.log.d").mkdir()
+
+    # 带序号的文件从旧到新，其余按修改时间排序
+    assert [p.name for p in expand_sources(tmp_path / "access.log*")] == [
+        "access.log.10.gz",
+        "access.log.2.gz",
+        "access.log.1",
+        "access.log",
+        "access.log-20250101",
+        "access.log-20250102",
+    ]
+    assert expand_sources(tmp_path / "access.log") == [tmp_path / "access.log"]
+    assert expand_sources(tmp_path / "missing*") == []
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """记录被解析的文件名"""
+    names = []
+
+    def spy(path):
+        names.append(path.name)
+        return open_source(path)
+
+    monkeypatch.setattr("v2log.analyzer.open_source", spy)
+    return names
+
+
+def write_gzip(path, lines):
+    path.write_bytes(gzip.compress("".join(lines).encode()))
+
+
+def test_rotation_reuses_file_caches(
+    tmp_path, log_lines, make_analyzer, assert_same_frame, parsed
+):
+    lines = log_lines(4000)
+    write_gzip(tmp_path / "access.log.1.gz", lines[:1000])
+    (tmp_path / "access.log").write_text("".join(lines[1000:2000]))
+    pattern = tmp_path / "access.log*"
+    analyzer = make_analyzer()
+
+    def check(step, expected_parsed):
+        parsed.clear()
+        result = analyzer.process_log_file(pattern)
+        assert sorted(parsed) == expected_parsed
+        assert_same_frame(
+            result, make_analyzer(f"fresh-{step}").process_log_file(pattern)
+        )
+        # 已不在输入中的文件的缓存被删除
+        set_path = analyzer.get_source_set_path(pattern)
+        caches = set_path.parent.glob(f"{set_path.stem}.src-*{FRAME_SUFFIX}")
+        assert len(list(caches)) == len(expand_sources(pattern))
+
+    check("initial", ["access.log", "access.log.1.gz"])
+
+    # 轮转：旧文件改名（delaycompress），新建的文件需要解析
+    os.rename(tmp_path / "access.log.1.gz", tmp_path / "access.log.2.gz")
+    os.rename(tmp_path / "access.log", tmp_path / "access.log.1")
+    (tmp_path / "access.log").write_text("".join(lines[2000:2500]))
+    check("rotate", ["access.log"])
+
+    # 新文件追加内容
+    with (tmp_path / "access.log").open("a") as f:
+        f.write("".join(lines[2500:4000]))
+    check("append", ["access.log"])
+
+    # 压缩上一个文件，只有压缩后的文件需要解析
+    old = tmp_path / "access.log.1"
+    write_gzip(tmp_path / "access.log.1.gz", lines[1000:2000])
+    old.unlink()
+    check("compress", ["access.log.1.gz"])
+
+    check("unchanged", [])
+    assert int(analyzer.process_log_file(pattern)["count"].sum()) == 4000
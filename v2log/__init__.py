@@ -2,13 +2,18 @@
 
 __version__ = "0.1.0"
 
-from v2log.analyzer import IPAnalyzer
-from v2log.utils import filter_dataframe
-from v2log.components import (
-    create_refresh_button,
-    display_data_and_map,
-    display_statistics,
-)
+import importlib
+
+# 所有导出的名称在首次访问时才导入对应模块：
+# 命令行 --help 不加载 pandas，作为库使用或无界面分析时
+# 不加载界面组件依赖的 streamlit、folium、plotly
+_LAZY_ATTRIBUTES = {
+    "IPAnalyzer": "v2log.analyzer",
+    "filter_dataframe": "v2log.utils",
+    "create_refresh_button": "v2log.components",
+    "display_data_and_map": "v2log.components",
+    "display_statistics": "v2log.components",
+}
 
 __all__ = [
     "IPAnalyzer",
@@ -17,3 +22,14 @@ __all__ = [
     "display_data_and_map",
     "display_statistics",
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name])
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted([*globals(), *_LAZY_ATTRIBUTES])
@@ -0,0 +1,291 @@
+import shutil
+import tempfile
+import weakref
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 待合并缓冲区达到该行数时排序归并一次
+BUFFER_SIZE = 1_000_000
+# 每行 (minute, src, dst, count) 占用的字节数
+ROW_BYTES = 4 + 4 + 4 + 8
+KEY_FIELDS = ("minutes", "srcs", "dsts", "counts")
+
+
+def intern_names(symbols: dict, names) -> np.ndarray:
+    """把名称登记到符号表，返回对应的整数ID数组"""
+    return np.fromiter(
+        (symbols.setdefault(name, len(symbols)) for name in names),
+        dtype=np.int32,
+        count=len(names),
+    )
+
+
+def reduce_keys(minutes, srcs, dsts, counts):
+    """按 (minute, src, dst) 排序并合并相同键的计数"""
+    if len(counts) == 0:
+        return minutes, srcs, dsts, counts
+
+    order = np.lexsort((dsts, srcs, minutes))
+    minutes, srcs, dsts = minutes[order], srcs[order], dsts[order]
+    counts = counts[order]
+
+    starts = np.flatnonzero(
+        np.concatenate(
+            (
+                [True],
+                (minutes[1:] != minutes[:-1])
+                | (srcs[1:] != srcs[:-1])
+                | (dsts[1:] != dsts[:-1]),
+            )
+        )
+    )
+    return (
+        minutes[starts],
+        srcs[starts],
+        dsts[starts],
+        np.add.reduceat(counts, starts),
+    )
+
+
+def merge_runs(runs, chunk_rows=BUFFER_SIZE):
+    """k 路归并多个已按键排序的 (minutes, srcs, dsts, counts) 分段
+
+    每次取各分段中不晚于同一分钟边界的行合并，边界取各分段往后
+    chunk_rows 行处分钟数的最小值，同一分钟的行总在同一次合并中，
+    结果与把全部分段拼接后调用 reduce_keys 相同。
+    分段可以是内存映射的数组，内存占用与 chunk_rows 和分段数成正比。
+    """
+    positions = [0] * len(runs)
+    results = []
+    while True:
+        active = [
+            i for i, run in enumerate(runs) if positions[i] < len(run[0])
+        ]
+        if not active:
+            break
+        boundary = min(
+            runs[i][0][min(positions[i] + chunk_rows, len(runs[i][0])) - 1]
+            for i in active
+        )
+        parts = []
+        for i in active:
+            start = positions[i]
+            end = start + int(
+                np.searchsorted(runs[i][0][start:], boundary, side="right")
+            )
+            parts.append([np.asarray(column[start:end]) for column in runs[i]])
+            positions[i] = end
+        results.append(
+            reduce_keys(*(np.concatenate(column) for column in zip(*parts)))
+        )
+
+    if not results:
+        return tuple(np.asarray(column[:0]) for column in runs[0])
+    # 逐列拼接并释放各次的结果，峰值内存不到结果的两倍
+    columns = [list(column) for column in zip(*results)]
+    del results
+    merged = []
+    while columns:
+        merged.append(np.concatenate(columns.pop(0)))
+    return tuple(merged)
+
+
+class Aggregator:
+    """整数编码的 (min, src, dst) -> count 聚合表
+
+    分钟保存为 epoch 分钟整数，src/dst 通过本文件的符号表映射为整数ID，
+    计数保存在 NumPy 数组中。新数据先进入缓冲区，
+    积累到 buffer_size 行且不少于已归并的行数后统一排序归并，
+    避免为每个键创建Python对象，归并的总开销随数据量线性增长。
+
+    设置 memory_limit（字节）后，归并后的数组超过该大小时写入
+    spill_dir 下的临时文件（已排序的分段）并清空，to_arrays 时
+    再 k 路归并所有分段，结果与全部在内存中聚合相同。
+    符号表和最终结果仍在内存中，memory_limit 只约束聚合过程中的数组。
+    """
+
+    def __init__(
+        self, buffer_size=BUFFER_SIZE, memory_limit=None, spill_dir=None
+    ):
+        self.buffer_size = buffer_size
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self.src_ids = {}
+        self.dst_ids = {}
+        self.minutes = np.empty(0, dtype=np.int32)
+        self.srcs = np.empty(0, dtype=np.int32)
+        self.dsts = np.empty(0, dtype=np.int32)
+        self.counts = np.empty(0, dtype=np.int64)
+        self._pending = []
+        self._pending_rows = 0
+        # 已写入磁盘的分段，每个分段为内存映射的四个数组
+        self._runs = []
+        self._spill_path = None
+        self._cleanup = None
+
+    def __getstate__(self):
+        # 传给其他进程前先合并磁盘上的分段，临时文件不随对象传递
+        self._merge_runs()
+        state = self.__dict__.copy()
+        state.update(_runs=[], _spill_path=None, _cleanup=None)
+        return state
+
+    @property
+    def nbytes(self) -> int:
+        """内存中已归并和待归并数组占用的字节数"""
+        return (len(self.counts) + self._pending_rows) * ROW_BYTES
+
+    @property
+    def src_names(self) -> list:
+        return list(self.src_ids)
+
+    @property
+    def dst_names(self) -> list:
+        return list(self.dst_ids)
+
+    def __len__(self):
+        self._consolidate()
+        self._merge_runs()
+        return len(self.counts)
+
+    def add(self, minutes, src_codes, src_names, dst_codes, dst_names, counts):
+        """合并一批使用局部编码的数据
+
+        src_codes/dst_codes 是相对 src_names/dst_names 的下标，
+        名称会先映射到本聚合表的符号表。
+        """
+        if len(counts) == 0:
+            return
+        src_map = intern_names(self.src_ids, src_names)
+        dst_map = intern_names(self.dst_ids, dst_names)
+        self._pending.append(
+            (
+                np.asarray(minutes, dtype=np.int32),
+                src_map[src_codes],
+                dst_map[dst_codes],
+                np.asarray(counts, dtype=np.int64),
+            )
+        )
+        self._pending_rows += len(counts)
+        if self._pending_rows >= max(self.buffer_size, len(self.counts)) or (
+            self.memory_limit is not None and self.nbytes > self.memory_limit
+        ):
+            self._consolidate()
+
+    def add_block(self, minutes, srcs, dsts, counts):
+        """合并 parse_block 的解析结果"""
+        src_codes, src_names = pd.factorize(np.asarray(srcs, dtype=object))
+        dst_codes, dst_names = pd.factorize(np.asarray(dsts, dtype=object))
+        self.add(minutes, src_codes, src_names, dst_codes, dst_names, counts)
+
+    def update(self, other: "Aggregator"):
+        """合并另一张聚合表（例如子进程的部分结果）"""
+        minutes, srcs, dsts, counts = other.to_arrays()
+        self.add(minutes, srcs, other.src_names, dsts, other.dst_names, counts)
+
+    def to_arrays(self):
+        """返回按键排序后的 (minutes, srcs, dsts, counts) 数组"""
+        self._consolidate()
+        self._merge_runs()
+        return self.minutes, self.srcs, self.dsts, self.counts
+
+    def _consolidate(self):
+        if not self._pending:
+            return
+        minutes, srcs, dsts, counts = zip(
+            (self.minutes, self.srcs, self.dsts, self.counts), *self._pending
+        )
+        self.minutes, self.srcs, self.dsts, self.counts = reduce_keys(
+            np.concatenate(minutes),
+            np.concatenate(srcs),
+            np.concatenate(dsts),
+            np.concatenate(counts),
+        )
+        self._pending = []
+        self._pending_rows = 0
+        if self.memory_limit is not None and self.nbytes > self.memory_limit:
+            self._spill()
+
+    def _spill(self):
+        """把已归并的数组作为一个有序分段写入磁盘"""
+        if self._spill_path is None:
+            if self.spill_dir is not None:
+                Path(self.spill_dir).mkdir(parents=True, exist_ok=True)
+            self._spill_path = Path(
+                tempfile.mkdtemp(prefix="v2log-spill-", dir=self.spill_dir)
+            )
+            # 对象被回收或进程退出时删除临时文件
+            self._cleanup = weakref.finalize(
+                self, shutil.rmtree, self._spill_path, True
+            )
+
+        run = []
+        for field in KEY_FIELDS:
+            path = self._spill_path / f"{len(self._runs)}.{field}.npy"
+            np.save(path, getattr(self, field))
+            run.append(np.load(path, mmap_mode="r"))
+            setattr(self, field, getattr(self, field)[:0])
+        self._runs.append(tuple(run))
+
+    def _merge_runs(self):
+        """归并磁盘上的分段和内存中的数据，并删除临时文件"""
+        if not self._runs:
+            return
+        self._consolidate()
+        runs = [*self._runs, (self.minutes, self.srcs, self.dsts, self.counts)]
+        self.minutes, self.srcs, self.dsts, self.counts = merge_runs(
+            runs, self.buffer_size
+        )
+        self._runs = []
+        self._cleanup()
+        self._spill_path = self._cleanup = None
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> "Aggregator":
+        """从结果DataFrame还原聚合表"""
+        aggregator = cls()
+        aggregator.add_frame(frame)
+        return aggregator
+
+    def add_frame(self, frame: pd.DataFrame):
+        """合并结果DataFrame中的 (min, src, dst, count)"""
+        if frame.empty:
+            return
+
+        src = (
+            frame["src"].astype("category").cat.remove_unused_categories().cat
+        )
+        dst = (
+            frame["dst"].astype("category").cat.remove_unused_categories().cat
+        )
+        self.add(
+            frame["min"].dt.as_unit("s").astype("int64").to_numpy() // 60,
+            src.codes.to_numpy(),
+            src.categories,
+            dst.codes.to_numpy(),
+            dst.categories,
+            frame["count"].to_numpy(),
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """返回只含 (min, src, dst, count) 的DataFrame，按键排序
+
+        直接由整数编码的数组构建，src/dst 为分类类型。
+        """
+        minutes, srcs, dsts, counts = self.to_arrays()
+        return pd.DataFrame(
+            {
+                "min": (minutes.astype(np.int64) * 60_000_000).astype(
+                    "datetime64[us]"
+                ),
+                "src": pd.Categorical.from_codes(
+                    srcs, categories=self.src_names
+                ),
+                "dst": pd.Categorical.from_codes(
+                    dsts, categories=self.dst_names
+                ),
+                "count": counts,
+            }
+        )
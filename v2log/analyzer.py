@@ -1,68 +1,140 @@
+import glob
+import hashlib
+import os
 import pickle
 import re
-import subprocess
-from collections import defaultdict
-from datetime import datetime
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 
-import IP2Location
-import numpy as np
 import pandas as pd
 
+from v2log.aggregate import Aggregator
+from v2log.cache import (
+    FRAME_SUFFIX,
+    PARTITION_SUFFIX,
+    compact_partitioned,
+    frame_mtime_ns,
+    load_frame,
+    merge_partitioned,
+    read_manifest,
+    remove_frame,
+    save_frame,
+    select_frame,
+)
+from v2log.filters import compile_filter
+from v2log.geo import DEFAULT_CACHE_SIZE, DEFAULT_LOCATION, GeoLocator
+from v2log.partial import (
+    is_partial,
+    iter_partial_chunks,
+    partial_meta,
+    partial_rows,
+    write_partial,
+)
+from v2log.parser import (
+    LOG_PATTERN,
+    SETTLE_SECONDS,
+    aggregate_range,
+    aggregate_source,
+    complete_lines_end,
+    iter_blocks,
+    parse_block,
+    parse_log_line,
+    prefix_hash,
+    split_file_ranges,
+)
+from v2log.rollup import (
+    ROLLUP_KEYS,
+    build_rollups,
+    load_rollups,
+    merge_rollups,
+    rollup_path,
+    save_rollups,
+)
+from v2log.search import SearchIndex, index_path
+from v2log.sources import (
+    expand_sources,
+    is_source_set,
+    only_appended,
+    open_source,
+    source_key,
+    sources_fingerprint,
+)
+
+# 断点中增量批次文件数的上限，超过后合并为一个文件
+MAX_CHECKPOINT_SEGMENTS = 64
+
 
 class IPAnalyzer:
     # 定义类级别的常量
     COLUMNS = ["min", "src", "dst", "count", "x", "y", "country", "city"]
-    DEFAULT_LOCATION = {
-        "x": np.float32(0),
-        "y": np.float32(0),
-        "country": "Unknown",
-        "city": "Unknown",
-    }
+    # 不做地理定位时的结果列
+    AGGREGATE_COLUMNS = ["min", "src", "dst", "count"]
+    DEFAULT_LOCATION = DEFAULT_LOCATION
 
     def __init__(
         self,
         db_path=Path("IP2LOCATION-LITE-DB11.BIN"),
         cache_dir=Path.home() / ".accesslogreader" / "cache",
         batch_size=100000,
+        workers=1,
+        geo_cache_size=DEFAULT_CACHE_SIZE,
+        persist_geo_cache=True,
+        geo_engine="file",
+        geolocate=True,
+        log_filter=None,
+        memory_limit_mb=None,
     ):
-        self.ip_database = IP2Location.IP2Location(str(db_path))
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # IP地理位置查询层，缓存有界并可跨运行持久化；
+        # geolocate 为 False 时只做聚合，不需要数据库
+        self.geo = None
+        if geolocate:
+            self.geo = GeoLocator(
+                db_path,
+                cache_size=geo_cache_size,
+                persist_dir=self.cache_dir if persist_geo_cache else None,
+                engine=geo_engine,
+            )
         self.batch_size = batch_size
-        self.ip_location_cache = {}
-        self.log_pattern = re.compile(
-            r"(\d{4}/\d{2}/\d{2} \d{2}:\d{2}):\d{2} ([\d\.]+):\d+ accepted "
-            r"tcp:([\w\.-]+):"
+        # workers <= 0 表示使用全部CPU核心
+        self.workers = workers if workers > 0 else os.cpu_count() or 1
+        self.log_pattern = LOG_PATTERN
+        # 过滤表达式在解析阶段生效，过滤后的结果使用单独的缓存
+        self.log_filter = compile_filter(log_filter, self.geo)
+        if self.log_filter is not None and (
+            self.log_filter.needs_geo and self.geo is None
+        ):
+            raise ValueError("country 过滤需要开启地理定位")
+        # 聚合数组的内存上限，超出后把有序分段写入缓存目录，最后再归并；
+        # 多进程处理时每个进程各自使用该上限
+        self.memory_limit = (
+            int(memory_limit_mb * 1024**2) if memory_limit_mb else None
         )
 
-    def get_file_lines(self, file_path: Path) -> int:
-        """使用系统命令快速获取文件行数"""
-        try:
-            # 对于Unix/Linux系统
-            result = subprocess.run(
-                ["wc", "-l", str(file_path)], capture_output=True, text=True
-            )
-            return int(result.stdout.split()[0])
-        except (subprocess.SubprocessError, ValueError, IndexError):
-            try:
-                # 对于Windows系统
-                result = subprocess.run(
-                    ["find", "/c", "/v", "", str(file_path)],
-                    capture_output=True,
-                    text=True,
-                    shell=True,
-                )
-                return int(result.stdout.split()[-1])
-            except (subprocess.SubprocessError, ValueError, IndexError):
-                # 如果命令行方法都失败了，使用文件大小估算
-                return file_path.stat().st_size // 100  # 使用 Path.stat()
-
     def get_cache_path(self, log_file_path: Path) -> Path:
         """获取缓存文件路径"""
         last_modified = log_file_path.stat().st_mtime
-        cache_name = f"{log_file_path.stem}_{int(last_modified)}.pkl"
-        return self.cache_dir / cache_name
+        cache_name = f"{log_file_path.stem}_{int(last_modified)}"
+        return (
+            self.cache_dir / f"{cache_name}{self._cache_tag}{PARTITION_SUFFIX}"
+        )
+
+    @property
+    def _cache_tag(self) -> str:
+        """不做地理定位或带过滤条件的结果使用单独的缓存文件
+
+        过滤条件按规范化后的表达式区分，语义相同的表达式共用缓存。
+        """
+        tag = "" if self.geo is not None else ".nogeo"
+        if self.log_filter is not None:
+            filter_key = hashlib.sha1(
+                self.log_filter.normalized.encode()
+            ).hexdigest()[:12]
+            tag += f".f{filter_key}"
+        return tag
 
     def save_cache(self, data, cache_path: Path):
         """保存缓存数据"""
@@ -77,85 +149,305 @@ class IPAnalyzer:
         except Exception:  # 处理所有可能的文件读取错误
             return None
 
-    def get_location(self, ip):
-        # 先检查缓存
-        if ip in self.ip_location_cache:
-            return self.ip_location_cache[ip]
-
+    def load_frame_cache(
+        self, cache_path: Path, columns=None, time_range=None
+    ):
+        """加载列式缓存的分析结果，只读取需要的列和时间范围"""
         try:
-            rec = self.ip_database.get_all(ip)
-            location = {
-                "x": np.float32(rec.latitude),
-                "y": np.float32(rec.longitude),
-                "country": rec.country_long,
-                "city": rec.city,
-            }
-        except Exception:
-            location = self.DEFAULT_LOCATION.copy()
-
-        # 保存到缓存
-        self.ip_location_cache[ip] = location
-        return location
+            return load_frame(cache_path, columns, time_range)
+        except Exception:  # 处理所有可能的文件读取错误
+            return None
+
+    def get_rollups(self, log_file_path: Path, incremental=False):
+        """获取最近一次分析结果的汇总表
+
+        汇总表与结果文件保存在一起，不存在或已过期时从结果文件重新计算。
+        """
+        frame_path = self._result_frame_path(log_file_path, incremental)
+        if not frame_path.exists():
+            return None
+
+        rollups = load_rollups(frame_path)
+        if rollups is None:
+            frame = self.load_frame_cache(frame_path)
+            if frame is None:
+                return None
+            rollups = build_rollups(frame)
+            save_rollups(rollups, frame_path)
+        return rollups
+
+    def get_search_index(self, log_file_path: Path, incremental=False):
+        """获取最近一次分析结果中 dst 列的搜索索引
+
+        索引与结果文件保存在一起，不存在或已过期时重新建立。
+        """
+        frame_path = self._result_frame_path(log_file_path, incremental)
+        if not frame_path.exists():
+            return None
+
+        index = self._fresh_index(frame_path)
+        if index is not None:
+            return index
+
+        frame = self.load_frame_cache(frame_path, ["dst"])
+        if frame is None:
+            return None
+        index = SearchIndex(frame["dst"].astype("category").cat.categories)
+        index.save(index_path(frame_path))
+        return index
+
+    def _fresh_index(self, frame_path: Path):
+        """读取不比结果文件旧的搜索索引，不存在、已过期或损坏时返回None"""
+        path = index_path(frame_path)
+        if path.exists() and path.stat().st_mtime_ns >= frame_mtime_ns(
+            frame_path
+        ):
+            try:
+                return SearchIndex.load(path)
+            except Exception:  # 索引损坏时重新建立
+                pass
+        return None
+
+    def compact(self, log_file_path: Path, incremental=True) -> list:
+        """把已保存结果中已结束的天和月各合并为一个分区
+
+        追加数据时不会改写已有分区，分区文件过多时显式调用，见
+        compact_partitioned。合并前仍是最新的汇总表和搜索索引内容不变，
+        只更新修改时间。返回新写入的分区文件名。
+        """
+        frame_path = self._result_frame_path(Path(log_file_path), incremental)
+        if read_manifest(frame_path) is None:
+            raise FileNotFoundError(f"没有已保存的分析结果: {log_file_path}")
+
+        frame_mtime = frame_mtime_ns(frame_path)
+        views = [rollup_path(frame_path, name) for name in ROLLUP_KEYS]
+        views.append(index_path(frame_path))
+        fresh = [
+            path
+            for path in views
+            if path.exists() and path.stat().st_mtime_ns >= frame_mtime
+        ]
+
+        compacted = compact_partitioned(frame_path)
+        for path in fresh:
+            os.utime(path)
+        return compacted
+
+    def _result_frame_path(self, log_file_path: Path, incremental) -> Path:
+        """分析结果的列式文件路径"""
+        log_file_path = Path(log_file_path)
+        if is_partial(log_file_path):
+            return self.get_cache_path(log_file_path)
+        if is_source_set(log_file_path):
+            return self.get_source_set_path(log_file_path)
+        if incremental:
+            return self._checkpoint_frame_path(
+                self.get_state_path(log_file_path)
+            )
+        return self.get_cache_path(log_file_path)
+
+    def get_time_bounds(self, log_file_path: Path, incremental=False):
+        """最近一次分析结果的时间范围 (最早, 最晚)，尚未分析时返回None
+
+        只读取分区清单，不读取数据。
+        """
+        frame_path = self._result_frame_path(log_file_path, incremental)
+        manifest = read_manifest(frame_path)
+        if not manifest or not manifest["partitions"]:
+            return None
+        partitions = manifest["partitions"]
+        return (
+            pd.Timestamp(partitions[0]["min"]),
+            pd.Timestamp(partitions[-1]["max"]),
+        )
+
+    def _save_result_views(self, final_df, frame_path: Path):
+        """在结果文件旁保存仪表盘汇总表和搜索索引"""
+        save_rollups(build_rollups(final_df), frame_path)
+        SearchIndex(final_df["dst"].cat.categories).save(
+            index_path(frame_path)
+        )
+
+    def _new_aggregator(self) -> Aggregator:
+        """创建保存总结果的聚合表，设置了内存上限时可写入磁盘"""
+        return Aggregator(
+            memory_limit=self.memory_limit, spill_dir=self.cache_dir
+        )
+
+    @property
+    def ip_database(self):
+        """官方库的查询对象，按需打开"""
+        return self.geo.database if self.geo is not None else None
+
+    @property
+    def ip_location_cache(self):
+        return self.geo.cache if self.geo is not None else {}
+
+    def get_location(self, ip):
+        return self.geo.locate(ip)
 
     def parse_log_line(self, line):
         """解析单行日志"""
-        match = self.log_pattern.match(line)
-        if match:
-            minute_str, source_ip, destination = match.groups()
-            # 跳过本地回环地址相关的记录
-            is_loopback = "127.0.0.1" in (source_ip, destination) or (
-                destination.replace(".", "").isdigit()
-                and destination == "127.0.0.1"
+        return parse_log_line(line, self.log_pattern)
+
+    def process_block(self, text, aggregated_data):
+        """批量处理一段日志文本，返回有效记录数"""
+        block = parse_block(text)
+        if self.log_filter is not None:
+            block = self.log_filter.apply(*block)
+        minutes, srcs, dsts, counts = block
+        aggregated_data.add_block(minutes, srcs, dsts, counts)
+        return int(counts.sum())
+
+    def _load_cache_data(self, log_file_path, temp_cache_path):
+        """加载缓存数据"""
+        # 尝试加载临时缓存，偏移量前的内容哈希一致时才从断点继续
+        if temp_cache_path.exists():
+            checkpoint = self._load_checkpoint(log_file_path, temp_cache_path)
+            if checkpoint is not None:
+                return checkpoint
+
+        return 0, self._new_aggregator()
+
+    def _load_checkpoint(self, log_file_path, temp_cache_path):
+        """加载断点，返回 (偏移量, 聚合数据)，断点失效时返回None"""
+        temp_data = self._load_state(log_file_path, temp_cache_path)
+        if temp_data is None:
+            return None
+
+        # 断点由一份完整的聚合结果和之后追加的各批次增量组成
+        aggregated_data = self._new_aggregator()
+        if temp_data.get("frame", True):
+            frame = self.load_frame_cache(
+                self._checkpoint_frame_path(temp_cache_path),
+                self.AGGREGATE_COLUMNS,
             )
-            if is_loopback:
+            if frame is None:
                 return None
+            aggregated_data.add_frame(frame)
+        if not self._load_segments(
+            temp_cache_path, temp_data, aggregated_data
+        ):
+            return None
 
-            return dict(
-                zip(
-                    ["min", "src", "dst"],
-                    [
-                        datetime.strptime(minute_str, "%Y/%m/%d %H:%M"),
-                        source_ip,
-                        destination,
-                    ],
-                )
+        return temp_data["offset"], aggregated_data
+
+    def _load_state(self, log_file_path, temp_cache_path):
+        """读取断点文件，断点失效或缺少聚合结果时返回None"""
+        temp_data = self.load_cache(temp_cache_path)
+        if temp_data is None or not self._is_valid_checkpoint(
+            log_file_path, temp_data
+        ):
+            return None
+        if temp_data.get("frame", True) and not read_manifest(
+            self._checkpoint_frame_path(temp_cache_path)
+        ):
+            return None
+        return temp_data
+
+    def _load_segments(self, temp_cache_path, temp_data, aggregated_data):
+        """把断点中各批次增量合并到聚合数据，任一批次无法读取时返回False"""
+        for name in temp_data.get("segments", []):
+            frame = self.load_frame_cache(
+                temp_cache_path.with_name(name), self.AGGREGATE_COLUMNS
             )
-        return None
+            if frame is None:
+                return False
+            aggregated_data.add_frame(frame)
+        return True
 
-    def _process_line(self, line, aggregated_data, ip_records):
-        """处理单行日志"""
-        if not (parsed := self.parse_log_line(line.strip())):
-            return 0
+    def _checkpoint_frame_path(self, temp_cache_path: Path) -> Path:
+        """断点中聚合数据对应的按时间分区的结果路径"""
+        return temp_cache_path.with_name(
+            f"{temp_cache_path.stem}.frame{PARTITION_SUFFIX}"
+        )
 
-        key = (parsed["min"], parsed["src"], parsed["dst"])
-        aggregated_data[key] += 1
+    def _checkpoint_segment_path(self, temp_cache_path: Path, index) -> Path:
+        """断点中第 index 个增量批次的列式文件路径"""
+        return temp_cache_path.with_name(
+            f"{temp_cache_path.stem}.seg{index:05d}{FRAME_SUFFIX}"
+        )
 
-        # 获取IP地理位置信息
-        src_ip = parsed["src"]
-        if src_ip not in ip_records:
-            ip_records[src_ip] = self.get_location(src_ip)
+    def _checkpoint_segments(self, temp_cache_path: Path) -> list:
+        """磁盘上已有的增量批次文件"""
+        pattern = f"{glob.escape(temp_cache_path.stem)}.seg*{FRAME_SUFFIX}"
+        return list(temp_cache_path.parent.glob(pattern))
 
-        return 1
+    def _clear_checkpoint(self, temp_cache_path: Path):
+        """删除断点及其全部数据文件"""
+        for path in [
+            temp_cache_path,
+            self._checkpoint_frame_path(temp_cache_path),
+            *self._checkpoint_segments(temp_cache_path),
+        ]:
+            remove_frame(path)
 
-    def _load_cache_data(self, temp_cache_path, cache_path, use_cache):
-        """加载缓存数据"""
-        # 尝试加载临时缓存
-        if temp_cache_path.exists():
-            temp_data = self.load_cache(temp_cache_path)
-            if temp_data is not None:
-                return (
-                    temp_data["line_number"],
-                    defaultdict(int, temp_data["aggregated"]),
-                    temp_data["ip_records"],
-                )
+    def _is_valid_checkpoint(self, log_file_path, temp_data):
+        """检查断点的偏移量与哈希是否仍与日志文件一致"""
+        offset = temp_data.get("offset")
+        stat = log_file_path.stat()
+        if offset is None or offset > stat.st_size:
+            return False
+        # 文件被轮转（inode变化）时断点失效
+        if temp_data.get("inode", stat.st_ino) != stat.st_ino:
+            return False
+        with log_file_path.open("rb") as f:
+            return prefix_hash(f, offset) == temp_data.get("prefix_hash")
 
-        # 如果存在完整缓存且不是强制刷新
-        if use_cache and cache_path.exists():
-            cached_data = self.load_cache(cache_path)
-            if cached_data is not None:
-                return 0, defaultdict(int), {}
+    def get_state_path(self, log_file_path: Path) -> Path:
+        """获取增量状态文件路径，只与日志路径有关，不随修改时间变化"""
+        path_key = hashlib.sha1(
+            str(log_file_path.absolute()).encode()
+        ).hexdigest()[:12]
+        return (
+            self.cache_dir
+            / f"{log_file_path.stem}_{path_key}{self._cache_tag}.state.pkl"
+        )
 
-        return 0, defaultdict(int), {}
+    def load_incremental_state(self, log_file_path: Path):
+        """读取增量模式保存的聚合数据
+
+        返回 (偏移量, 聚合数据)，没有保存的状态或日志已被截断、轮转时
+        返回None。跟踪模式用它从上次的位置继续。
+        """
+        log_file_path = Path(log_file_path)
+        return self._load_checkpoint(
+            log_file_path, self.get_state_path(log_file_path)
+        )
+
+    def save_incremental_state(
+        self, aggregated_data, log_file_path: Path, offset, append_only=True
+    ):
+        """保存聚合数据作为增量模式的状态，之后从 offset 继续处理
+
+        append_only 表示聚合数据是在已保存的状态上追加得到的，
+        此时只重写有变化的分区。地理位置缓存一并保存。
+        """
+        log_file_path = Path(log_file_path)
+        self._save_checkpoint(
+            aggregated_data,
+            self.get_state_path(log_file_path),
+            log_file_path,
+            offset,
+            append_only=append_only,
+        )
+        self.save_geo_cache()
+
+    def get_source_set_path(self, pattern) -> Path:
+        """多文件或压缩输入的分析结果路径，只与输入的路径或模式有关"""
+        pattern = Path(pattern)
+        path_key = hashlib.sha1(str(pattern.absolute()).encode()).hexdigest()[
+            :12
+        ]
+        name = re.sub(r"[^\w.-]", "_", pattern.name)
+        return (
+            self.cache_dir
+            / f"{name}_{path_key}{self._cache_tag}.set{PARTITION_SUFFIX}"
+        )
+
+    def _source_cache_path(self, set_path: Path, key: str) -> Path:
+        """单个文件聚合结果的缓存路径，按文件内容的标识区分"""
+        return set_path.with_name(f"{set_path.stem}.src-{key}{FRAME_SUFFIX}")
 
     def process_log_file(
         self,
@@ -163,135 +455,785 @@ class IPAnalyzer:
         use_cache=True,
         progress_callback=None,
         batch_callback=None,
+        incremental=False,
+        columns=None,
+        time_range=None,
     ):
-        """处理日志文件"""
+        """处理日志文件
+
+        incremental 为 True 时只解析上次处理之后追加的内容，
+        并合并到已保存的聚合结果中。
+        columns 和 time_range 用于只返回需要的列和 [start, end) 时间范围，
+        命中缓存时直接下推到缓存文件读取。
+        log_file_path 为 glob 模式或压缩文件时按文件分段处理，
+        见 _process_sources；为部分聚合结果文件时见 _process_partial。
+        """
         log_file_path = Path(log_file_path)
+        process = self._select_processor(log_file_path, incremental)
+        result = process(
+            log_file_path,
+            use_cache,
+            progress_callback,
+            batch_callback,
+            columns,
+            time_range,
+        )
+        self.save_geo_cache()
+        return result
+
+    def save_geo_cache(self):
+        """保存地理位置缓存，每次运行结束时调用一次，而不是每批之后"""
+        if self.geo is not None:
+            self.geo.save()
+
+    def close(self):
+        """保存地理位置缓存并关闭数据库文件"""
+        if self.geo is not None:
+            self.geo.save()
+            self.geo.close()
+
+    def _select_processor(self, log_file_path: Path, incremental):
+        """按输入的类型选择处理方式，各方式的参数相同"""
+        if is_partial(log_file_path):
+            return self._process_partial
+        if is_source_set(log_file_path):
+            return self._process_sources
+        if incremental:
+            return self._process_incremental
+        return self._process_full
+
+    def _cached_result(
+        self,
+        cache_path: Path,
+        columns,
+        time_range,
+        progress_callback=None,
+        batch_callback=None,
+    ):
+        """读取已保存的结果并通知回调，缓存不可用时返回None"""
+        cached_data = self.load_frame_cache(cache_path, columns, time_range)
+        if cached_data is not None:
+            if progress_callback:
+                progress_callback(1.0, "从缓存加载完成")
+            if batch_callback:
+                batch_callback(cached_data)
+        return cached_data
+
+    def _process_full(
+        self,
+        log_file_path,
+        use_cache,
+        progress_callback,
+        batch_callback,
+        columns,
+        time_range,
+    ):
+        """完整处理整个日志文件，中断时从断点继续"""
         cache_path = self.get_cache_path(log_file_path)
         temp_cache_path = cache_path.with_suffix(".temp.pkl")
 
         # 加载缓存
-        start_line, aggregated_data, ip_records = self._load_cache_data(
-            temp_cache_path, cache_path, use_cache
+        start_offset, aggregated_data = self._load_cache_data(
+            log_file_path, temp_cache_path
         )
 
         # 如果有完整缓存数据，直接返回
-        if use_cache and cache_path.exists() and start_line == 0:
-            cached_data = self.load_cache(cache_path)
+        if use_cache and cache_path.exists() and start_offset == 0:
+            cached_data = self._cached_result(
+                cache_path,
+                columns,
+                time_range,
+                progress_callback,
+                batch_callback,
+            )
             if cached_data is not None:
-                if progress_callback:
-                    progress_callback(1.0, "从缓存加载完成")
-                if batch_callback:
-                    batch_callback(cached_data)
                 return cached_data
 
-        total_lines = self.get_file_lines(log_file_path)
-        processed_count = 0
-        current_line = 0
-        update_interval = self.batch_size / 10
-
-        with log_file_path.open("r") as f:
-            # 跳过已处理的行
-            for _ in range(start_line):
-                next(f)
-                current_line += 1
-
-            while True:
-                try:
-                    line = next(f)
-                    current_line += 1
-
-                    processed_count += self._process_line(
-                        line, aggregated_data, ip_records
+        end_offset = log_file_path.stat().st_size
+        if start_offset == 0:
+            # 从头处理时清除失效的断点，避免新批次追加到旧数据之后
+            self._clear_checkpoint(temp_cache_path)
+        if self.workers > 1 and start_offset == 0:
+            aggregated_data = self._process_parallel(
+                log_file_path, end_offset, progress_callback, batch_callback
+            )
+        else:
+            self._process_range(
+                log_file_path,
+                start_offset,
+                end_offset,
+                aggregated_data,
+                progress_callback,
+                batch_callback,
+                temp_cache_path,
+            )
+
+        # 处理完成
+        final_df = self.create_dataframe(aggregated_data)
+        save_frame(final_df, cache_path)
+        self._save_result_views(final_df, cache_path)
+        self._clear_checkpoint(temp_cache_path)
+
+        if progress_callback:
+            progress_callback(1.0, "处理完成")
+
+        return select_frame(final_df, columns, time_range)
+
+    def _process_incremental(
+        self,
+        log_file_path,
+        use_cache,
+        progress_callback,
+        batch_callback,
+        columns,
+        time_range,
+    ):
+        """增量处理：从上次的偏移量继续解析新追加的内容
+
+        新增的聚合数据只合并到所在的分区，不读取其余分区；
+        此时 batch_callback 只接收新增的数据。
+        文件被截断、轮转或改写时从头重建。
+        """
+        state_path = self.get_state_path(log_file_path)
+        state = (
+            self._load_state(log_file_path, state_path) if use_cache else None
+        )
+        if state is None:
+            return self._rebuild_incremental(
+                log_file_path,
+                state_path,
+                progress_callback,
+                batch_callback,
+                columns,
+                time_range,
+            )
+
+        start_offset = state["offset"]
+        end_offset = self._complete_end(log_file_path, start_offset)
+        aggregated_data = self._new_aggregator()
+        # 没有新内容时直接读取列式结果，只解码需要的部分
+        if end_offset == start_offset and not state.get("segments"):
+            result = self._cached_result(
+                self._checkpoint_frame_path(state_path),
+                columns,
+                time_range,
+                progress_callback,
+                batch_callback,
+            )
+        elif self._load_segments(state_path, state, aggregated_data):
+            self._process_range(
+                log_file_path,
+                start_offset,
+                end_offset,
+                aggregated_data,
+                progress_callback,
+                batch_callback,
+                state_path,
+            )
+            result = self._merge_increment(
+                aggregated_data,
+                state_path,
+                log_file_path,
+                end_offset,
+                columns,
+                time_range,
+            )
+        else:
+            result = None
+
+        if result is None:
+            # 已保存的结果无法读取或合并时从头重建
+            return self._rebuild_incremental(
+                log_file_path,
+                state_path,
+                progress_callback,
+                batch_callback,
+                columns,
+                time_range,
+            )
+        if progress_callback:
+            progress_callback(1.0, "处理完成")
+        return result
+
+    def _rebuild_incremental(
+        self,
+        log_file_path,
+        state_path,
+        progress_callback,
+        batch_callback,
+        columns,
+        time_range,
+    ):
+        """从头解析日志，保存增量处理的状态和按时间分区的结果"""
+        self._clear_checkpoint(state_path)
+        end_offset = self._complete_end(log_file_path, 0)
+        if self.workers > 1 and end_offset:
+            aggregated_data = self._process_parallel(
+                log_file_path, end_offset, progress_callback, batch_callback
+            )
+        else:
+            aggregated_data = self._new_aggregator()
+            self._process_range(
+                log_file_path,
+                0,
+                end_offset,
+                aggregated_data,
+                progress_callback,
+                batch_callback,
+                state_path,
+            )
+
+        final_df = self.create_dataframe(aggregated_data)
+        self._save_checkpoint(
+            aggregated_data, state_path, log_file_path, end_offset, final_df
+        )
+        self._save_result_views(
+            final_df, self._checkpoint_frame_path(state_path)
+        )
+
+        if progress_callback:
+            progress_callback(1.0, "处理完成")
+        return select_frame(final_df, columns, time_range)
+
+    def _merge_increment(
+        self,
+        aggregated_data,
+        state_path,
+        log_file_path,
+        end_offset,
+        columns,
+        time_range,
+    ):
+        """把新增的聚合数据合并到已保存的结果，只重写涉及的分区
+
+        汇总表和搜索索引在合并前是最新的才在其上累加，否则留待使用时重建。
+        返回合并后所需的列和时间范围，分区无法读取时返回None。
+        """
+        frame_path = self._checkpoint_frame_path(state_path)
+        delta = self.create_dataframe(aggregated_data)
+        rollups = index = None
+        # 首次处理中断后继续时还没有保存的结果，delta 即为全部数据
+        if read_manifest(frame_path) is not None:
+            rollups = load_rollups(frame_path)
+            index = self._fresh_index(frame_path)
+        try:
+            merge_partitioned(delta, frame_path)
+        except Exception:  # 分区文件损坏时由调用方从头重建
+            return None
+        self._commit_checkpoint(state_path, log_file_path, end_offset)
+
+        if not delta.empty:
+            if rollups is not None:
+                save_rollups(merge_rollups(rollups, delta), frame_path)
+            if index is not None:
+                self._merge_index(index, delta["dst"], frame_path)
+        return self.load_frame_cache(frame_path, columns, time_range)
+
+    def _merge_index(self, index, dsts, frame_path: Path):
+        """只在出现新的 dst 时重建搜索索引，否则只更新修改时间"""
+        path = index_path(frame_path)
+        names = dsts.cat.categories
+        if names.isin(index.values).all():
+            os.utime(path)
+        else:
+            SearchIndex(index.values.union(names)).save(path)
+
+    def _complete_end(self, log_file_path: Path, start_offset) -> int:
+        """本次增量处理的结束位置，末尾尚未写完的行留到下次处理
+
+        文件超过 SETTLE_SECONDS 未修改时认为已经写完，
+        最后一行即使没有换行也一并处理。
+        """
+        stat = log_file_path.stat()
+        settled = time.time() - stat.st_mtime >= SETTLE_SECONDS
+        with log_file_path.open("rb") as f:
+            return complete_lines_end(f, start_offset, settled)
+
+    def _process_sources(
+        self,
+        pattern,
+        use_cache,
+        progress_callback,
+        batch_callback,
+        columns,
+        time_range,
+    ):
+        """处理轮转或压缩的日志，每个文件的聚合结果单独缓存
+
+        文件按内容标识（inode、大小、修改时间）缓存，轮转改名后仍然命中，
+        通常只有最新的文件需要重新处理。需要处理的多个文件由多个进程
+        并行解压和解析，进度按已读取的压缩字节数计算。
+        """
+        sources = expand_sources(pattern)
+        if not sources:
+            raise FileNotFoundError(f"没有匹配的日志文件: {pattern}")
+        set_path = self.get_source_set_path(pattern)
+        meta_path = set_path.with_suffix(".pkl")
+        keys = [source_key(path) for path in sources]
+
+        # 所有文件都未变化时直接读取合并后的结果
+        meta = self.load_cache(meta_path) if use_cache else None
+        if meta is not None and meta.get("sources") == keys:
+            cached_data = self._cached_result(
+                set_path,
+                columns,
+                time_range,
+                progress_callback,
+                batch_callback,
+            )
+            if cached_data is not None:
+                return cached_data
+
+        aggregated_data = self._new_aggregator()
+        pending = self._load_source_caches(
+            set_path,
+            sources,
+            keys,
+            use_cache,
+            aggregated_data,
+            batch_callback,
+        )
+        self._merge_pending_sources(
+            pending, aggregated_data, progress_callback, batch_callback
+        )
+
+        final_df = self.create_dataframe(aggregated_data)
+        # 只新增了文件或文件追加了内容时，结果只是在原结果上累加，
+        # 未变化的分区不必重写
+        append_only = meta is not None and only_appended(
+            meta.get("sources", []), keys
+        )
+        save_frame(final_df, set_path, append_only=append_only)
+        self._save_result_views(final_df, set_path)
+        self.save_cache({"sources": keys}, meta_path)
+        self._remove_stale_sources(set_path, keys)
+
+        if progress_callback:
+            progress_callback(1.0, "处理完成")
+
+        return select_frame(final_df, columns, time_range)
+
+    def _load_source_caches(
+        self,
+        set_path,
+        sources,
+        keys,
+        use_cache,
+        aggregated_data,
+        batch_callback,
+    ) -> list:
+        """把已缓存的各文件结果合并到 aggregated_data
+
+        返回需要重新处理的 [(文件, 缓存路径)]。
+        """
+        pending = []
+        for path, key in zip(sources, keys):
+            cache_path = self._source_cache_path(set_path, key)
+            frame = None
+            if use_cache and cache_path.exists():
+                frame = self.load_frame_cache(
+                    cache_path, self.AGGREGATE_COLUMNS
+                )
+            if frame is None:
+                pending.append((path, cache_path))
+                continue
+            partial = Aggregator.from_frame(frame)
+            aggregated_data.update(partial)
+            if batch_callback:
+                batch_callback(self.create_dataframe(partial))
+        return pending
+
+    def _merge_pending_sources(
+        self, pending, aggregated_data, progress_callback, batch_callback
+    ):
+        """处理未缓存的文件，保存各自的结果并合并到 aggregated_data"""
+        total_size = sum(path.stat().st_size for path, _ in pending)
+        done_size = 0
+        for (path, cache_path), partial in zip(
+            pending, self._aggregate_sources(pending, progress_callback)
+        ):
+            save_frame(self._aggregate_frame(partial), cache_path)
+            aggregated_data.update(partial)
+            if batch_callback:
+                batch_callback(self.create_dataframe(partial))
+            done_size += path.stat().st_size
+            self._update_progress(progress_callback, done_size, total_size)
+
+    def _remove_stale_sources(self, set_path: Path, keys):
+        """删除已不在输入中的文件的缓存"""
+        current = {self._source_cache_path(set_path, key) for key in keys}
+        source_glob = f"{glob.escape(set_path.stem)}.src-*{FRAME_SUFFIX}"
+        for path in set_path.parent.glob(source_glob):
+            if path not in current:
+                path.unlink()
+
+    def _process_partial(
+        self,
+        partial_path,
+        use_cache,
+        progress_callback,
+        batch_callback,
+        columns,
+        time_range,
+    ):
+        """打开部分聚合结果（通常是多台主机合并后的结果）
+
+        按块读取并套用本次的过滤条件，补充地理位置后与普通日志的结果
+        一样缓存，并生成汇总表和搜索索引。
+        """
+        cache_path = self.get_cache_path(partial_path)
+        if use_cache and cache_path.exists():
+            cached_data = self._cached_result(
+                cache_path,
+                columns,
+                time_range,
+                progress_callback,
+                batch_callback,
+            )
+            if cached_data is not None:
+                return cached_data
+
+        rows = partial_rows(partial_path)
+        aggregated_data = self._new_aggregator()
+        done = 0
+        for chunk in iter_partial_chunks(partial_path):
+            if self.log_filter is not None:
+                minutes = (
+                    chunk["min"].dt.as_unit("s").astype("int64").to_numpy()
+                    // 60
+                )
+                aggregated_data.add_block(
+                    *self.log_filter.apply(
+                        minutes,
+                        list(chunk["src"]),
+                        list(chunk["dst"]),
+                        chunk["count"].to_numpy(),
                     )
+                )
+            else:
+                aggregated_data.add_frame(chunk)
+            done += len(chunk)
+            if progress_callback and rows:
+                progress_callback(
+                    min(done / rows, 0.99), f"读取中... ({done}/{rows} 行)"
+                )
+
+        final_df = self.create_dataframe(aggregated_data)
+        save_frame(final_df, cache_path)
+        self._save_result_views(final_df, cache_path)
+        if batch_callback:
+            batch_callback(final_df)
+
+        if progress_callback:
+            progress_callback(1.0, "处理完成")
+
+        return select_frame(final_df, columns, time_range)
+
+    def export_partial(self, log_file_path, output_path, use_cache=True):
+        """分析日志并保存为部分聚合结果文件，供 merge_partials 合并
+
+        结果只含 (min, src, dst, count)，地理位置在合并后打开时再补充。
+        """
+        log_file_path = Path(log_file_path)
+        frame = self.process_log_file(
+            log_file_path,
+            use_cache=use_cache,
+            incremental=True,
+            columns=self.AGGREGATE_COLUMNS,
+        )
+        if is_partial(log_file_path):
+            fingerprint = None
+        else:
+            fingerprint = sources_fingerprint(log_file_path)
+        meta = partial_meta(
+            frame, log_file_path.absolute(), fingerprint, self.log_filter
+        )
+        write_partial(frame, Path(output_path), meta)
+        return meta
 
-                    if processed_count >= self.batch_size:
-                        self._process_batch(
-                            aggregated_data,
-                            ip_records,
-                            batch_callback,
-                            temp_cache_path,
-                            current_line,
-                        )
-                        processed_count = 0
+    def _aggregate_sources(self, pending, progress_callback=None):
+        """按顺序逐个返回各文件的聚合结果，多个文件时并行处理"""
+        paths = [path for path, _ in pending]
+        if self.workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(paths))
+            ) as executor:
+                yield from executor.map(
+                    aggregate_source,
+                    paths,
+                    repeat(self.log_filter),
+                    repeat(self.memory_limit),
+                    repeat(self.cache_dir),
+                )
+            return
 
+        total_size = sum(path.stat().st_size for path in paths)
+        done_size = 0
+        for path in paths:
+            partial = self._new_aggregator()
+            stream, raw = open_source(path)
+            with raw, stream:
+                for data in iter_blocks(stream):
+                    self.process_block(
+                        data.decode("utf-8", errors="replace"), partial
+                    )
                     self._update_progress(
-                        progress_callback,
-                        current_line,
-                        total_lines,
-                        update_interval,
+                        progress_callback, done_size + raw.tell(), total_size
                     )
+            done_size += path.stat().st_size
+            yield partial
 
-                except StopIteration:
-                    break
+    def _process_range(
+        self,
+        log_file_path,
+        start_offset,
+        end_offset,
+        aggregated_data,
+        progress_callback,
+        batch_callback,
+        temp_cache_path,
+    ):
+        """串行解析文件的 [start_offset, end_offset) 区间
 
-        # 处理完成
-        final_df = self._create_dataframe(aggregated_data, ip_records)
-        self.save_cache(final_df, cache_path)
+        batch_callback 只接收每批新增的聚合数据，各批次之和即为最终结果。
+        """
+        processed_count = 0
+        current_offset = start_offset
+        # 上一批之后新增的聚合数据
+        batch_data = Aggregator()
 
-        if temp_cache_path.exists():
-            temp_cache_path.unlink()
+        if batch_callback and start_offset > 0:
+            # 从断点继续时先发送已有的结果
+            batch_callback(self.create_dataframe(aggregated_data))
 
-        if progress_callback:
-            progress_callback(1.0, "处理完成")
+        with log_file_path.open("rb") as f:
+            # 直接定位到断点，无需重新读取已处理的内容
+            f.seek(start_offset)
 
-        return final_df
+            for data in iter_blocks(f, end_offset):
+                current_offset += len(data)
+                processed_count += self.process_block(
+                    data.decode("utf-8", errors="replace"),
+                    batch_data,
+                )
+
+                if processed_count >= self.batch_size:
+                    self._process_batch(
+                        aggregated_data,
+                        batch_data,
+                        batch_callback,
+                        temp_cache_path,
+                        log_file_path,
+                        current_offset,
+                    )
+                    batch_data = Aggregator()
+                    processed_count = 0
+
+                self._update_progress(
+                    progress_callback, current_offset, end_offset
+                )
+
+        # 最后不足一批的数据由调用方随最终结果一起保存
+        if processed_count:
+            self._process_batch(aggregated_data, batch_data, batch_callback)
+
+    def _process_parallel(
+        self,
+        log_file_path: Path,
+        end_offset,
+        progress_callback=None,
+        batch_callback=None,
+    ):
+        """多进程分段解析日志，合并各段的聚合结果"""
+        # 分段数多于进程数，便于负载均衡和进度汇报
+        ranges = split_file_ranges(log_file_path, self.workers * 4, end_offset)
+        aggregated_data = self._new_aggregator()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            partials = executor.map(
+                aggregate_range,
+                repeat(log_file_path),
+                [start for start, _ in ranges],
+                [end for _, end in ranges],
+                repeat(self.log_filter),
+                repeat(self.memory_limit),
+                repeat(self.cache_dir),
+            )
+            # 按文件顺序合并，符号表中 src/dst 的顺序与串行处理相同；
+            # 行的顺序由 reduce_keys 按 (min, src, dst) 排序，与合并顺序无关
+            for done, partial in enumerate(partials, start=1):
+                aggregated_data.update(partial)
+                if batch_callback:
+                    batch_callback(self.create_dataframe(partial))
+                if progress_callback:
+                    progress_callback(
+                        done / len(ranges),
+                        f"并行处理中... ({done}/{len(ranges)})",
+                    )
+
+        return aggregated_data
 
     def _process_batch(
         self,
         aggregated_data,
-        ip_records,
+        batch_data,
         batch_callback,
-        temp_cache_path,
-        current_line,
+        temp_cache_path=None,
+        log_file_path=None,
+        current_offset=None,
     ):
-        """处理批量日志"""
-        temp_df = self._create_dataframe(aggregated_data, ip_records)
+        """处理一批日志：合并到总结果，回调并追加断点都只涉及本批新增数据"""
+        aggregated_data.update(batch_data)
         if batch_callback:
-            batch_callback(temp_df)
+            batch_callback(self.create_dataframe(batch_data))
+
+        if temp_cache_path is not None:
+            self._append_checkpoint(
+                batch_data, temp_cache_path, log_file_path, current_offset
+            )
+
+    def _append_checkpoint(
+        self, batch_data, temp_cache_path, log_file_path, current_offset
+    ):
+        """追加断点：只写入本批新增的聚合数据，不重写已保存的部分"""
+        temp_data = self.load_cache(temp_cache_path) or {"frame": False}
+        segments = temp_data.get("segments", [])
+        segment_path = self._checkpoint_segment_path(
+            temp_cache_path, self._next_segment_index(segments)
+        )
+        # 中间断点只需聚合数据，地理位置在处理完成后再补充
+        save_frame(self._aggregate_frame(batch_data), segment_path)
+        segments = segments + [segment_path.name]
+        stale = []
+        if len(segments) > MAX_CHECKPOINT_SEGMENTS:
+            merged = self._merge_segments(temp_cache_path, segments)
+            stale = [name for name in segments if name not in merged]
+            segments = merged
+        self._write_checkpoint_meta(
+            temp_cache_path,
+            log_file_path,
+            current_offset,
+            frame=temp_data.get("frame", True),
+            segments=segments,
+        )
+        for name in stale:
+            (temp_cache_path.parent / name).unlink()
+
+    def _next_segment_index(self, segments) -> int:
+        """下一个增量批次的序号，合并后的批次之后继续递增，文件名不会重复"""
+        if not segments:
+            return 0
+        return int(segments[-1].rsplit(".seg", 1)[1].split(".")[0]) + 1
+
+    def _merge_segments(self, temp_cache_path, segments) -> list:
+        """把各增量批次合并为一个文件，返回新的批次列表
+
+        长时间运行的断点不会无限增加文件，读取断点时也只需读取一个文件。
+        原文件在断点文件更新后由调用方删除。
+        """
+        aggregated_data = self._new_aggregator()
+        if not self._load_segments(
+            temp_cache_path, {"segments": segments}, aggregated_data
+        ):
+            return segments
+        segment_path = self._checkpoint_segment_path(
+            temp_cache_path, self._next_segment_index(segments)
+        )
+        save_frame(self._aggregate_frame(aggregated_data), segment_path)
+        return [segment_path.name]
+
+    def _save_checkpoint(
+        self,
+        aggregated_data,
+        temp_cache_path,
+        log_file_path,
+        current_offset,
+        temp_df=None,
+        append_only=False,
+    ):
+        """保存完整断点
+
+        聚合数据按时间分区单独保存，并替换之前追加的增量批次。
+        append_only 表示聚合数据是在上次保存的断点上追加得到的，
+        此时只重写有变化的分区。
+        """
+        if temp_df is None:
+            temp_df = self.create_dataframe(aggregated_data)
+        save_frame(
+            temp_df,
+            self._checkpoint_frame_path(temp_cache_path),
+            append_only=append_only,
+        )
 
-        # 保存临时缓存
+        self._commit_checkpoint(temp_cache_path, log_file_path, current_offset)
+
+    def _commit_checkpoint(
+        self, temp_cache_path, log_file_path, current_offset
+    ):
+        """聚合结果已包含各增量批次后更新偏移量，再删除这些批次"""
+        segments = self._checkpoint_segments(temp_cache_path)
+        self._write_checkpoint_meta(
+            temp_cache_path, log_file_path, current_offset
+        )
+        for path in segments:
+            path.unlink()
+
+    def _write_checkpoint_meta(
+        self,
+        temp_cache_path,
+        log_file_path,
+        current_offset,
+        frame=True,
+        segments=(),
+    ):
+        """写入断点文件
+
+        断点文件只记录字节偏移量、inode、偏移量之前内容的哈希以及
+        数据文件列表，校验断点时无需读取聚合数据。
+        """
+        with log_file_path.open("rb") as f:
+            offset_hash = prefix_hash(f, current_offset)
         temp_cache = {
-            "aggregated": dict(aggregated_data),
-            "ip_records": ip_records,
-            "line_number": current_line,
+            "offset": current_offset,
+            "prefix_hash": offset_hash,
+            "inode": log_file_path.stat().st_ino,
+            "frame": frame,
+            "segments": list(segments),
         }
         self.save_cache(temp_cache, temp_cache_path)
 
-    def _update_progress(
-        self, progress_callback, current_line, total_lines, update_interval
-    ):
+    def _update_progress(self, progress_callback, current_size, total_size):
         """更新进度"""
-        if progress_callback and current_line % update_interval == 0:
-            progress = current_line / total_lines
+        if progress_callback:
+            progress = min(current_size / max(total_size, 1), 1.0)
             progress_callback(
                 progress,
-                f"处理中... ({current_line}/{total_lines})",
+                f"处理中... ({current_size / 1024 ** 2:.1f}MB"
+                f"/{total_size / 1024 ** 2:.1f}MB)",
             )
 
-    def _create_dataframe(self, aggregated_data, ip_records):
-        """从聚合数据创建DataFrame"""
-        if not aggregated_data:
-            return pd.DataFrame(columns=self.COLUMNS)
-
-        records = []
-        for (minute, ip, dest), count in aggregated_data.items():
-            location = ip_records[ip]
-            records.append(
-                dict(
-                    zip(
-                        self.COLUMNS,
-                        [
-                            minute,
-                            ip,
-                            dest,
-                            count,
-                            location["x"],
-                            location["y"],
-                            location["country"],
-                            location["city"],
-                        ],
-                    )
-                )
-            )
+    def _aggregate_frame(self, aggregated_data):
+        """从聚合数据创建只含 (min, src, dst, count) 的DataFrame"""
+        return aggregated_data.to_frame()
+
+    def create_dataframe(self, aggregated_data):
+        """从聚合数据创建结果DataFrame，需要时补充地理位置列"""
+        df = self._aggregate_frame(aggregated_data)
+        if self.geo is None:
+            return df
+        return self._attach_locations(df)
 
-        return pd.DataFrame(records, columns=self.COLUMNS)
+    def _attach_locations(self, df):
+        """对不重复的 src 统一查询地理位置，再按 src 的分类编码展开到各行"""
+        src = df["src"].cat
+        locations = self.geo.locate_columns(src.categories)
+
+        codes = src.codes.to_numpy()
+        for field in ("x", "y"):
+            df[field] = locations[field][codes]
+        for field in ("country", "city"):
+            values = pd.Categorical(locations[field])
+            df[field] = pd.Categorical.from_codes(
+                values.codes[codes], categories=values.categories
+            )
+        return df
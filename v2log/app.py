@@ -1,4 +1,5 @@
 import os
+import time
 from pathlib import Path
 
 import streamlit as st
@@ -10,7 +11,13 @@ from v2log.components import (
     create_refresh_button,
     display_data_and_map,
     display_statistics,
+    select_time_range,
 )
+from v2log.follow import LogFollower
+from v2log.memo import clear_memo, get_frame_memo
+from v2log.partial import is_partial, read_partial_meta
+from v2log.rollup import build_rollups
+from v2log.sources import sources_fingerprint
 from v2log.utils import filter_dataframe
 
 st.set_page_config(page_title="访问日志分析器", layout="wide")
@@ -19,48 +26,235 @@ st.set_page_config(page_title="访问日志分析器", layout="wide")
 LOG_FILE = Path(os.environ["READER_LOG_FILE"])
 DB_PATH = Path(os.environ["READER_DB_PATH"])
 FILTER = os.environ.get("READER_FILTER", "")
+WORKERS = int(os.environ.get("READER_WORKERS", "1"))
+FOLLOW = os.environ.get("READER_FOLLOW") == "1"
+REFRESH_INTERVAL = float(os.environ.get("READER_REFRESH_INTERVAL", "2"))
+GEO_ENGINE = os.environ.get("READER_GEO_ENGINE", "file")
+# 聚合过程的内存上限（MB），为空时全部在内存中聚合
+MEMORY_LIMIT_MB = float(os.environ.get("READER_MEMORY_LIMIT_MB") or 0)
+# 页面用到的列，读取列式缓存时只解码这些列
+VIEW_COLUMNS = ["min", "src", "dst", "count", "x", "y", "city"]
 
 
 @st.cache_resource
 def get_analyzer():
-    return IPAnalyzer(db_path=DB_PATH, batch_size=10000 * 10 * 4)
+    return IPAnalyzer(
+        db_path=DB_PATH,
+        batch_size=10000 * 10 * 4,
+        workers=WORKERS,
+        geo_engine=GEO_ENGINE,
+        log_filter=FILTER,
+        memory_limit_mb=MEMORY_LIMIT_MB or None,
+    )
 
 
-def load_data(log_file, use_cache=True):
-    """加载数据"""
+@st.cache_resource
+def get_follower():
+    """跟踪模式下所有会话共享同一个后台读取线程"""
+    return LogFollower(get_analyzer(), LOG_FILE).start()
+
+
+def load_data(
+    log_file,
+    use_cache=True,
+    progress_callback=None,
+    batch_callback=None,
+    time_range=None,
+):
+    """加载数据，只解析上次分析之后追加的日志
+
+    time_range 为 [start, end) 时间范围，只读取与其重叠的分区。
+    """
     analyzer = get_analyzer()
-    return analyzer.process_log_file(log_file, use_cache=use_cache)
+    return analyzer.process_log_file(
+        log_file,
+        use_cache=use_cache,
+        progress_callback=progress_callback,
+        batch_callback=batch_callback,
+        incremental=True,
+        columns=VIEW_COLUMNS,
+        time_range=time_range,
+    )
 
 
-def main():
-    """主程序入口"""
-    # 处理刷新逻辑
-    should_refresh = create_refresh_button()
-    if should_refresh:
+def data_fingerprint(log_file) -> str:
+    """日志文件及分析配置的指纹，日志追加、改写或轮转后随之变化
+
+    状态文件名中包含了过滤条件和是否做地理定位，
+    多个文件的输入包含每个文件的 inode、大小和修改时间。
+    """
+    state_name = get_analyzer().get_state_path(log_file).name
+    return f"{state_name}:{sources_fingerprint(log_file)}"
+
+
+def search_data(key, df, search_term, index=None):
+    """过滤并汇总搜索结果，相同数据和搜索词的结果直接取缓存"""
+
+    def compute():
+        filtered_df = filter_dataframe(df, search_term, index=index)
+        return filtered_df, build_rollups(filtered_df)
+
+    return get_frame_memo().get((key, "search", search_term), compute)
+
+
+def load_dashboard_data(use_cache=True, time_range=None):
+    """分析日志并读取汇总表和搜索索引
+
+    解析过程中显示进度，并逐批预览最新的数据。
+    保存的汇总表对应全部数据，选择了时间范围时对该范围重新汇总。
+    """
+    progress = ProgressComponents()
+    handler = BatchUpdateHandler(progress.data_container)
+    df = load_data(
+        LOG_FILE,
+        use_cache=use_cache,
+        progress_callback=progress.update,
+        batch_callback=handler.update,
+        time_range=time_range,
+    )
+    progress.clear()
+    if time_range is None:
+        rollups = get_analyzer().get_rollups(LOG_FILE, incremental=True)
+    else:
+        rollups = build_rollups(df)
+    index = get_analyzer().get_search_index(LOG_FILE, incremental=True)
+    return df, rollups, index
+
+
+def display_dashboard(df, search_term, rollups=None, index=None, key=None):
+    """显示数据、地图和统计信息
+
+    各图表和统计读取汇总表，搜索时通过 dst 索引过滤，
+    并对过滤后的数据重新汇总一次。key 标识当前数据，
+    传入时过滤结果和各图表数据按 key 和搜索词缓存。
+    """
+    if search_term:
+        if key is None:
+            filtered_df = filter_dataframe(df, search_term, index=index)
+            rollups = build_rollups(filtered_df)
+        else:
+            filtered_df, rollups = search_data(key, df, search_term, index)
+            key = f"{key}|search:{search_term}"
+        display_data_and_map(
+            filtered_df, search_mode=True, rollups=rollups, key=key
+        )
+    else:
+        filtered_df = df
+        display_data_and_map(filtered_df, search_mode=False)
+
+    # 显示统计信息
+    display_statistics(filtered_df, rollups, key)
+
+
+@st.fragment(run_every=REFRESH_INTERVAL)
+def watch_follower(version):
+    """定时检查后台线程的数据版本，有新数据时才重新运行页面
+
+    数据未变化时只刷新这一行状态，表格、地图和图表保持不变，
+    日志空闲时页面刷新几乎不占用CPU。
+    """
+    follower = get_follower()
+    if follower.version != version:
+        st.rerun()
+    if follower.last_update:
+        st.caption(
+            "实时跟踪中，最近更新: "
+            + time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(follower.last_update)
+            )
+        )
+
+
+def display_live_dashboard(search_term):
+    """跟踪模式：显示后台线程当前的聚合结果"""
+    follower = get_follower()
+    # 先读版本号，快照至少与该版本一样新，缓存不会落后于数据
+    version = follower.version
+    key = f"live:{data_fingerprint(LOG_FILE)}:{version}"
+    watch_follower(version)
+    display_dashboard(
+        follower.snapshot(),
+        search_term,
+        follower.rollups(),
+        follower.search_index(),
+        key,
+    )
+
+
+def display_source_info():
+    """显示过滤条件，打开合并结果时显示各主机的日志来源"""
+    log_filter = get_analyzer().log_filter
+    if log_filter is not None:
+        st.caption(f"过滤条件: {log_filter.normalized}")
+    if is_partial(LOG_FILE):
+        meta = read_partial_meta(LOG_FILE)
+        hosts = sorted({source["host"] for source in meta["sources"]})
+        st.caption(
+            f"合并结果: {len(meta['sources'])} 份日志，"
+            f"来自 {', '.join(hosts)}"
+        )
+        if meta["filter"]:
+            st.caption(f"各主机分析时的过滤条件: {meta['filter']}")
+
+
+def display_follow_mode():
+    """跟踪模式：启动共享的后台读取线程，页面定时刷新"""
+    with st.spinner("正在加载数据..."):
+        get_follower()
+    search_term = st.text_input("搜索网站:", "")
+    display_live_dashboard(search_term)
+
+
+def load_selected_data():
+    """按刷新按钮和所选时间范围加载数据
+
+    返回 (数据, 汇总表, 搜索索引, 缓存键)，出错时显示错误并返回None。
+    """
+    if create_refresh_button():
         st.session_state.refresh_data = True
 
-    # 加载数据
+    # 已分析过时先选择时间范围，只读取需要的分区
+    analyzer = get_analyzer()
+    bounds = analyzer.get_time_bounds(LOG_FILE, incremental=True)
+    time_range = select_time_range(bounds) if bounds is not None else None
+
     try:
         use_cache = not st.session_state.get("refresh_data", False)
-        with st.spinner("正在加载数据..."):
-            df = load_data(LOG_FILE, use_cache=use_cache)
+        if not use_cache:
+            clear_memo()
+        key = data_fingerprint(LOG_FILE)
+        if time_range is not None:
+            key = f"{key}|{time_range[0]}..{time_range[1]}"
+        df, rollups, index = get_frame_memo().get(
+            key, lambda: load_dashboard_data(use_cache, time_range)
+        )
         if "refresh_data" in st.session_state:
             del st.session_state.refresh_data
     except Exception as e:
         st.error(f"加载数据时出错: {str(e)}")
+        return None
+
+    # 第一次分析完成后重新运行一次，显示时间范围选择
+    if bounds is None and analyzer.get_time_bounds(LOG_FILE, incremental=True):
+        st.rerun()
+    return df, rollups, index, key
+
+
+def main():
+    """主程序入口"""
+    display_source_info()
+    if FOLLOW:
+        display_follow_mode()
+        return
+
+    loaded = load_selected_data()
+    if loaded is None:
         return
+    df, rollups, index, key = loaded
 
     # 搜索框
     search_term = st.text_input("搜索网站:", "")
-    if search_term:
-        filtered_df = filter_dataframe(df, search_term)
-        display_data_and_map(filtered_df, search_mode=True)
-    else:
-        filtered_df = df
-        display_data_and_map(filtered_df, search_mode=False)
-
-    # 显示统计信息
-    display_statistics(filtered_df)
+    display_dashboard(df, search_term, rollups, index, key)
 
 
 if __name__ == "__main__":
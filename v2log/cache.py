@@ -0,0 +1,455 @@
+import json
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 未安装 pyarrow 时回退到 pickle
+    pa = pq = None
+
+# 重复度高的字符串列使用分类类型，Parquet 中对应字典编码
+CATEGORY_COLUMNS = ["src", "dst", "country", "city"]
+# 每个行组的行数，行组统计信息用于按时间过滤
+ROW_GROUP_SIZE = 1_000_000
+FRAME_SUFFIX = ".parquet" if pq is not None else ".pkl"
+# 按时间分区保存的结果为目录，每个分区一个文件，另有一份分区清单
+PARTITION_SUFFIX = ".parts"
+MANIFEST_NAME = "manifest.json"
+SCHEMA_NAME = f"schema{FRAME_SUFFIX}"
+# 分区粒度（由粗到细）及对应的分区文件名格式
+PARTITION_FORMATS = {"M": "%Y-%m", "D": "%Y-%m-%d", "h": "%Y-%m-%dT%H"}
+PARTITION_FREQ = "D"
+# 合并新增结果时按这些列判断是否为同一行
+MERGE_KEYS = ["min", "src", "dst"]
+
+
+def to_categorical(df: pd.DataFrame) -> pd.DataFrame:
+    """将字符串列转换为分类类型"""
+    columns = {
+        column: "category"
+        for column in CATEGORY_COLUMNS
+        if column in df.columns and df[column].dtype != "category"
+    }
+    return df.astype(columns) if columns else df
+
+
+def select_frame(
+    df: pd.DataFrame, columns=None, time_range=None
+) -> pd.DataFrame:
+    """在内存中按列和时间范围筛选，与读取缓存时的下推语义一致"""
+    if time_range is not None:
+        start, end = time_range
+        mask = pd.Series(True, index=df.index)
+        if start is not None:
+            mask &= df["min"] >= pd.Timestamp(start)
+        if end is not None:
+            mask &= df["min"] < pd.Timestamp(end)
+        df = df[mask].reset_index(drop=True)
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+def concat_frames(frames: list) -> pd.DataFrame:
+    """拼接列相同的多个DataFrame，分类列合并各自的取值而不退化为字符串"""
+    if len(frames) == 1:
+        return frames[0]
+    data = {}
+    for column in frames[0].columns:
+        series = [frame[column] for frame in frames]
+        if isinstance(series[0].dtype, pd.CategoricalDtype):
+            data[column] = union_categoricals(series)
+        else:
+            data[column] = np.concatenate([item.to_numpy() for item in series])
+    return pd.DataFrame(data)
+
+
+def save_frame(df: pd.DataFrame, path: Path, append_only=False):
+    """保存分析结果DataFrame
+
+    path 以 PARTITION_SUFFIX 结尾时按时间分区保存，见 save_partitioned。
+    """
+    if Path(path).suffix == PARTITION_SUFFIX:
+        save_partitioned(df, path, append_only=append_only)
+        return
+
+    df = to_categorical(df)
+    if Path(path).suffix == ".parquet":
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE)
+    else:
+        with Path(path).open("wb") as f:
+            pickle.dump(df, f)
+
+
+def load_frame(path: Path, columns=None, time_range=None) -> pd.DataFrame:
+    """读取分析结果DataFrame
+
+    columns 指定只读取的列，time_range 为 (start, end) 左闭右开的时间范围，
+    Parquet 格式下两者都下推到文件读取，只解码需要的列和行组；
+    按时间分区保存的结果只读取与时间范围重叠的分区。
+    """
+    if Path(path).suffix == PARTITION_SUFFIX:
+        return load_partitioned(path, columns, time_range)
+    if Path(path).suffix != ".parquet":
+        with Path(path).open("rb") as f:
+            return select_frame(pickle.load(f), columns, time_range)
+
+    filters = []
+    if time_range is not None:
+        start, end = time_range
+        if start is not None:
+            filters.append(("min", ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append(("min", "<", pd.Timestamp(end)))
+
+    table = pq.read_table(
+        path,
+        columns=list(columns) if columns is not None else None,
+        filters=filters or None,
+    )
+    return table.to_pandas()
+
+
+def _manifest_matches(manifest, freq) -> bool:
+    """分区清单是否按 freq 分区，且记录了各分区的粒度"""
+    return (
+        manifest is not None
+        and manifest["freq"] == freq
+        and all("unit" in entry for entry in manifest["partitions"])
+    )
+
+
+def read_manifest(directory: Path):
+    """读取分区清单，不存在或已损坏时返回None"""
+    try:
+        with (Path(directory) / MANIFEST_NAME).open() as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def frame_mtime_ns(path: Path) -> int:
+    """结果的修改时间，分区保存的结果以分区清单为准"""
+    path = Path(path)
+    if path.suffix == PARTITION_SUFFIX:
+        path = path / MANIFEST_NAME
+    return path.stat().st_mtime_ns
+
+
+def remove_frame(path: Path):
+    """删除结果文件或分区目录"""
+    path = Path(path)
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def _replace_frame(df: pd.DataFrame, path: Path):
+    """先写入临时文件再替换，读取方不会读到写了一半的文件"""
+    temp_path = path.with_name(f".tmp-{path.name}")
+    save_frame(df, temp_path)
+    os.replace(temp_path, path)
+
+
+def partition_keys(times: np.ndarray, freq=PARTITION_FREQ) -> tuple:
+    """整体保存或合并分区时每行所属分区的起始时间和粒度
+
+    最新数据所在的月按 freq 分区（freq 为小时时，当天之前的按天），
+    更早的月份各合并为一个分区，一年的数据只有几十个分区文件。
+    返回 (起始时间数组, 粒度数组)，粒度为 PARTITION_FORMATS 的键的序号。
+    """
+    units = list(PARTITION_FORMATS)
+    finest = units.index(freq)
+    keys = times.astype(f"datetime64[{freq}]").astype(times.dtype)
+    levels = np.full(len(times), finest)
+    # 由细到粗覆盖：已结束的天按天，已结束的月按月
+    for level in range(finest - 1, -1, -1):
+        unit = units[level]
+        floors = times.astype(f"datetime64[{unit}]")
+        closed = floors < times[-1].astype(f"datetime64[{unit}]")
+        keys[closed] = floors[closed].astype(times.dtype)
+        levels[closed] = level
+    return keys, levels
+
+
+def assign_partitions(times: np.ndarray, partitions, freq=PARTITION_FREQ):
+    """追加数据时每行所属分区的起始时间和粒度
+
+    落在已有分区时间范围内的行归入该分区，已有分区的边界保持不变；
+    其余的行按 freq 新建分区，不会与已有分区重叠。
+    返回值与 partition_keys 相同。
+    """
+    units = list(PARTITION_FORMATS)
+    keys = times.astype(f"datetime64[{freq}]").astype(times.dtype)
+    levels = np.full(len(times), units.index(freq))
+    if not partitions:
+        return keys, levels
+
+    starts = np.array([entry["start"] for entry in partitions], "M8[us]")
+    ends = np.array([entry["end"] for entry in partitions], "M8[us]")
+    index = np.searchsorted(starts.astype(times.dtype), times, "right") - 1
+    covered = index >= 0
+    covered[covered] = times[covered] < ends[index[covered]]
+    index = index[covered]
+    keys[covered] = starts[index].astype(times.dtype)
+    levels[covered] = np.array(
+        [units.index(entry["unit"]) for entry in partitions]
+    )[index]
+    return keys, levels
+
+
+def _split_partitions(df: pd.DataFrame, keys, levels):
+    """按分区切分已按时间排序的行，依次返回 (分区的行, 起始时间, 粒度)"""
+    if not len(df):
+        return
+    units = list(PARTITION_FORMATS)
+    starts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    bounds = [0, *starts, len(df)]
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        unit = units[levels[begin]]
+        yield df.iloc[begin:end], np.datetime64(keys[begin], unit), unit
+
+
+def _partition_entry(part: pd.DataFrame, start, unit) -> dict:
+    """分区清单中的一项，start 为 unit 精度的分区起始时间"""
+    name = pd.Timestamp(start).strftime(PARTITION_FORMATS[unit])
+    return {
+        "file": f"{name}{FRAME_SUFFIX}",
+        "unit": unit,
+        "start": pd.Timestamp(start).isoformat(),
+        "end": pd.Timestamp(start + 1).isoformat(),
+        "min": part["min"].iloc[0].isoformat(),
+        "max": part["min"].iloc[-1].isoformat(),
+        "rows": len(part),
+        "count": int(part["count"].sum()),
+    }
+
+
+def _write_partition(part: pd.DataFrame, path: Path):
+    """写入一个分区，只保存该分区用到的分类取值"""
+    part = part.assign(
+        **{
+            column: part[column].cat.remove_unused_categories()
+            for column in part.select_dtypes("category").columns
+        }
+    )
+    _replace_frame(part, path)
+
+
+def _write_manifest(directory: Path, freq, partitions):
+    """替换分区清单，之后删除已不在清单中的分区文件"""
+    partitions = sorted(partitions, key=lambda entry: entry["start"])
+    temp_manifest = directory / f".{MANIFEST_NAME}.tmp"
+    temp_manifest.write_text(
+        json.dumps({"freq": freq, "partitions": partitions}, indent=1)
+    )
+    os.replace(temp_manifest, directory / MANIFEST_NAME)
+
+    keep = {entry["file"] for entry in partitions}
+    keep.update((MANIFEST_NAME, SCHEMA_NAME))
+    for path in directory.iterdir():
+        if path.name not in keep:
+            path.unlink()
+
+
+def _sorted_by_time(df: pd.DataFrame) -> pd.DataFrame:
+    df = to_categorical(df)
+    if not df["min"].is_monotonic_increasing:
+        df = df.sort_values("min", kind="stable", ignore_index=True)
+    return df
+
+
+def save_partitioned(
+    df: pd.DataFrame, directory: Path, freq=PARTITION_FREQ, append_only=False
+):
+    """按时间分区保存结果，并写入各分区的行数和时间范围清单
+
+    整体保存时的分区方式见 partition_keys。append_only 为 True 表示
+    df 只是在上次保存的结果上累加了计数，此时按 assign_partitions
+    沿用已有的分区，行数和计数之和都没有变化的分区即没有变化，
+    保留原文件，通常只需重写最新的分区。
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    df = _sorted_by_time(df)
+
+    previous = {}
+    manifest = read_manifest(directory) if append_only else None
+    times = df["min"].to_numpy()
+    if _manifest_matches(manifest, freq):
+        previous = {entry["file"]: entry for entry in manifest["partitions"]}
+        keys, levels = assign_partitions(times, manifest["partitions"], freq)
+    else:
+        keys, levels = partition_keys(times, freq) if len(df) else ([], [])
+
+    partitions = []
+    for part, start, unit in _split_partitions(df, keys, levels):
+        entry = _partition_entry(part, start, unit)
+        old = previous.get(entry["file"])
+        if (
+            old is None
+            or (old["rows"], old["count"]) != (entry["rows"], entry["count"])
+            or not (directory / entry["file"]).exists()
+        ):
+            _write_partition(part, directory / entry["file"])
+        partitions.append(entry)
+
+    # 保存列结构，时间范围内没有分区时返回同样列的空表
+    _replace_frame(
+        df.iloc[:0].astype(
+            {
+                column: pd.CategoricalDtype(dtype.categories[:0])
+                for column, dtype in df.dtypes.items()
+                if isinstance(dtype, pd.CategoricalDtype)
+            }
+        ),
+        directory / SCHEMA_NAME,
+    )
+    _write_manifest(directory, freq, partitions)
+
+
+def _merge_rows(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """合并同一分区的已有行和新增行，相同 (min, src, dst) 的计数相加
+
+    两者各自没有重复的键且都按时间排序，早于新增行最早时间的已有行
+    不会重复，只对其余的行分组求和，其余列（地理位置）取已有行的值。
+    """
+    split = int(
+        np.searchsorted(old["min"].to_numpy(), new["min"].to_numpy()[0])
+    )
+    tail = concat_frames([old.iloc[split:], new[list(old.columns)]])
+    aggregations = {
+        column: "sum" if column == "count" else "first"
+        for column in tail.columns
+        if column not in MERGE_KEYS
+    }
+    tail = (
+        tail.groupby(MERGE_KEYS, observed=True, sort=False, as_index=False)
+        .agg(aggregations)
+        .sort_values("min", kind="stable")
+    )
+    return concat_frames([old.iloc[:split], tail[list(old.columns)]])
+
+
+def merge_partitioned(
+    delta: pd.DataFrame, directory: Path, freq=PARTITION_FREQ
+):
+    """把新增的结果合并到按时间分区保存的结果中
+
+    只读取和重写 delta 所在的分区，其余分区和分区边界都不变，
+    新的时间段按 freq 新建分区。没有已保存的结果时与 save_partitioned 相同。
+    """
+    directory = Path(directory)
+    manifest = read_manifest(directory)
+    if not _manifest_matches(manifest, freq):
+        save_partitioned(delta, directory, freq)
+        return
+    if delta.empty:
+        return
+
+    delta = _sorted_by_time(delta)
+    partitions = {entry["file"]: entry for entry in manifest["partitions"]}
+    keys, levels = assign_partitions(
+        delta["min"].to_numpy(), manifest["partitions"], freq
+    )
+    for part, start, unit in _split_partitions(delta, keys, levels):
+        entry = _partition_entry(part, start, unit)
+        path = directory / entry["file"]
+        if entry["file"] in partitions:
+            part = _merge_rows(load_frame(path), part)
+            entry = _partition_entry(part, start, unit)
+        _write_partition(part, path)
+        partitions[entry["file"]] = entry
+    _write_manifest(directory, freq, list(partitions.values()))
+
+
+def compact_partitioned(directory: Path) -> list:
+    """把已结束的月（按小时分区时还有已结束的天）各合并为一个分区
+
+    追加数据只会新建 freq 粒度的分区，已有分区不会被改写；分区文件过多时
+    显式调用本函数，合并后的分区方式与整体保存时相同，数据不变。
+    返回新写入的分区文件名。
+    """
+    directory = Path(directory)
+    manifest = read_manifest(directory)
+    if manifest is None or not manifest["partitions"]:
+        return []
+
+    units = list(PARTITION_FORMATS)
+    partitions = manifest["partitions"]
+    # 以最新数据的时间为准判断各分区所在的天和月是否已经结束
+    times = np.array(
+        [entry["start"] for entry in partitions] + [partitions[-1]["max"]],
+        "M8[us]",
+    )
+    groups = {}
+    for entry, level in zip(
+        partitions, partition_keys(times, manifest["freq"])[1]
+    ):
+        unit = units[min(level, units.index(entry["unit"]))]
+        start = np.datetime64(entry["start"]).astype(f"datetime64[{unit}]")
+        groups.setdefault((start, unit), []).append(entry)
+
+    compacted = []
+    entries = []
+    for (start, unit), group in groups.items():
+        if len(group) == 1 and group[0]["unit"] == unit:
+            entries.append(group[0])
+            continue
+        part = concat_frames(
+            [load_frame(directory / entry["file"]) for entry in group]
+        )
+        entry = _partition_entry(part, start, unit)
+        _write_partition(part, directory / entry["file"])
+        entries.append(entry)
+        compacted.append(entry["file"])
+    if compacted:
+        _write_manifest(directory, manifest["freq"], entries)
+    return compacted
+
+
+def load_partitioned(directory: Path, columns=None, time_range=None):
+    """读取分区保存的结果，只读取与 [start, end) 时间范围重叠的分区"""
+    directory = Path(directory)
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"没有分区清单: {directory}")
+
+    start, end = time_range if time_range is not None else (None, None)
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    paths = [
+        directory / entry["file"]
+        for entry in manifest["partitions"]
+        if (start is None or pd.Timestamp(entry["max"]) >= start)
+        and (end is None or pd.Timestamp(entry["min"]) < end)
+    ]
+
+    if not paths:
+        return load_frame(directory / SCHEMA_NAME, columns)
+    if FRAME_SUFFIX != ".parquet":
+        return concat_frames(
+            [load_frame(path, columns, time_range) for path in paths]
+        )
+
+    # 多个分区作为一个数据集读取，各分区的字典编码在转换时统一
+    filters = []
+    if start is not None:
+        filters.append(("min", ">=", start))
+    if end is not None:
+        filters.append(("min", "<", end))
+    table = pq.read_table(
+        [str(path) for path in paths],
+        columns=list(columns) if columns is not None else None,
+        filters=filters or None,
+    )
+    return table.to_pandas()
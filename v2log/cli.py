@@ -4,29 +4,113 @@ from pathlib import Path
 from typing import Optional
 
 import click
-import streamlit.web.cli as stcli
 
 # 添加父目录到 Python 路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from v2log.utils.generator import create_demo_log
-
 # 获取包内data目录
 DEFAULT_DB_PATH = Path(__file__).parent / "data" / "IP2LOCATION-LITE-DB11.BIN"
+# 无界面分析可输出的表：分钟级聚合结果和各汇总表
+TABLES = ["aggregate", "dst", "city", "src", "hour", "minute_city"]
+
+
+class DefaultGroup(click.Group):
+    """第一个参数不是子命令时执行默认子命令，兼容 v2log access.log 的用法"""
+
+    def __init__(self, *args, default=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default = default
+
+    def parse_args(self, ctx, args):
+        if not args or (args[0] not in self.commands and args[0] != "--help"):
+            args = [self.default, *args]
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultGroup, default="serve")
+def main():
+    """Access Log Reader - 分析访问日志
 
+    默认启动可视化页面（serve），analyze 子命令只做分析并输出结果。
+    """
 
-@click.command()
-@click.argument("log_file", type=click.Path(exists=True), required=False)
-@click.option("--filter", "-f", help='过滤规则，例如: "dst:*.google.com"')
+
+@main.command()
+@click.argument("log_file", required=False)
+@click.option(
+    "--filter",
+    "-f",
+    help='过滤规则，例如: "dst:*.google.com src:10.0.0.0/8"，'
+    "字段可选 dst、src、time、country",
+)
 @click.option("--db-path", type=click.Path(), help="IP2Location数据库路径")
 @click.option("--demo", is_flag=True, help="使用示例日志文件")
-def main(
+@click.option(
+    "--workers",
+    "-w",
+    type=int,
+    default=1,
+    show_default=True,
+    help="解析日志的进程数，0 表示使用全部CPU核心",
+)
+@click.option("--follow", is_flag=True, help="持续跟踪日志，实时刷新页面")
+@click.option(
+    "--interval",
+    type=float,
+    default=2.0,
+    show_default=True,
+    help="跟踪模式下页面刷新间隔（秒）",
+)
+@click.option(
+    "--geo-engine",
+    type=click.Choice(["file", "mmap"]),
+    default="file",
+    show_default=True,
+    help="IP地理位置查询引擎，mmap 为内存映射的批量查询",
+)
+@click.option(
+    "--memory-limit",
+    type=float,
+    help="聚合过程的内存上限（MB），超出时把中间结果写入缓存目录，"
+    "用于数据量超出内存的日志",
+)
+@click.option(
+    "--memo-entries",
+    type=int,
+    default=32,
+    show_default=True,
+    help="页面计算结果的缓存条目数",
+)
+@click.option(
+    "--memo-memory",
+    type=float,
+    default=2048,
+    show_default=True,
+    help="页面缓存的数据占用内存上限（MB）",
+)
+def serve(
     log_file: Optional[str],
     filter: Optional[str],
     db_path: Optional[str],
     demo: bool,
+    workers: int,
+    follow: bool,
+    interval: float,
+    geo_engine: str,
+    memory_limit: Optional[float],
+    memo_entries: int,
+    memo_memory: float,
 ):
-    """Access Log Reader - 分析访问日志"""
+    """启动可视化页面分析访问日志
+
+    LOG_FILE 可以是压缩文件（gzip/xz/zstd）或 glob 模式，如 "access.log*"，
+    也可以是 merge 子命令合并后的部分聚合结果（*.partial.parquet）。
+    """
+    from v2log.filters import compile_filter
+    from v2log.partial import is_partial
+    from v2log.sources import expand_sources, is_source_set
+    from v2log.utils.generator import create_demo_log
+
     # 处理 demo 模式
     if demo:
         click.echo("生成示例日志数据...")
@@ -35,6 +119,12 @@ def main(
     elif not log_file:
         click.echo("错误: 请指定日志文件路径或使用 --demo 参数")
         sys.exit(1)
+    elif not expand_sources(log_file):
+        click.echo(f"错误: 未找到日志文件: {log_file}")
+        sys.exit(1)
+    elif follow and (is_source_set(log_file) or is_partial(log_file)):
+        click.echo("错误: 跟踪模式只支持单个未压缩的日志文件")
+        sys.exit(1)
 
     # 使用指定的数据库路径或默认路径
     db_path = Path(db_path) if db_path else DEFAULT_DB_PATH
@@ -42,22 +132,308 @@ def main(
         click.echo(f"错误: 未找到IP2Location数据库: {db_path}")
         sys.exit(1)
 
+    # 过滤表达式有误时在启动前报错
+    try:
+        compile_filter(filter)
+    except ValueError as e:
+        click.echo(f"错误: {e}")
+        sys.exit(1)
+
     # 设置环境变量
     os.environ["READER_LOG_FILE"] = str(Path(log_file).absolute())
     os.environ["READER_DB_PATH"] = str(db_path)
+    os.environ["READER_WORKERS"] = str(workers)
+    os.environ["READER_FOLLOW"] = "1" if follow else "0"
+    os.environ["READER_REFRESH_INTERVAL"] = str(interval)
+    os.environ["READER_GEO_ENGINE"] = geo_engine
+    if memory_limit:
+        os.environ["READER_MEMORY_LIMIT_MB"] = str(memory_limit)
+    os.environ["READER_MEMO_ENTRIES"] = str(memo_entries)
+    os.environ["READER_MEMO_MEMORY_MB"] = str(memo_memory)
     if filter:
         os.environ["READER_FILTER"] = filter
 
-    # 启动Streamlit应用
-    import v2log.app
+    # 启动Streamlit应用，只在这里导入界面相关的依赖
+    import streamlit.web.cli as stcli
 
-    # 获取 reader.app 模块的路径
-    app_path = Path(v2log.app.__file__).absolute()
+    # 页面脚本由 streamlit 执行，这里只需要路径，无需导入
+    app_path = (Path(__file__).parent / "app.py").absolute()
 
     # 使用 streamlit cli 启动
     sys.argv = ["streamlit", "run", str(app_path)]
     sys.exit(stcli.main())
 
 
+@main.command()
+@click.argument("log_file")
+@click.option("--filter", "-f", help="过滤规则，语法与页面模式相同")
+@click.option("--db-path", type=click.Path(), help="IP2Location数据库路径")
+@click.option(
+    "--no-geo", is_flag=True, help="不做地理定位，无需IP2Location数据库"
+)
+@click.option(
+    "--geo-engine",
+    type=click.Choice(["file", "mmap"]),
+    default="file",
+    show_default=True,
+    help="IP地理位置查询引擎",
+)
+@click.option(
+    "--workers",
+    "-w",
+    type=int,
+    default=1,
+    show_default=True,
+    help="解析日志的进程数，0 表示使用全部CPU核心",
+)
+@click.option(
+    "--memory-limit",
+    type=float,
+    help="聚合过程的内存上限（MB），超出时把中间结果写入缓存目录，"
+    "用于数据量超出内存的日志",
+)
+@click.option(
+    "--table",
+    type=click.Choice(TABLES),
+    default="aggregate",
+    show_default=True,
+    help="输出的表，aggregate 为分钟级聚合结果，其余为汇总表",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["csv", "json", "parquet"]),
+    default="csv",
+    show_default=True,
+    help="输出格式",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    default="-",
+    show_default=True,
+    help="输出文件，- 表示标准输出",
+)
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False),
+    help="将聚合结果和全部汇总表分别写入该目录，忽略 --table 和 --output",
+)
+@click.option(
+    "--since",
+    type=click.DateTime(),
+    help="只输出该时间及之后的数据，只读取需要的分区",
+)
+@click.option("--until", type=click.DateTime(), help="只输出该时间之前的数据")
+@click.option(
+    "--partial",
+    "partial_output",
+    type=click.Path(dir_okay=False),
+    help="保存为部分聚合结果文件（*.partial.parquet），供 merge 子命令合并，"
+    "不做地理定位，忽略其他输出选项",
+)
+@click.option(
+    "--full", is_flag=True, help="不使用已保存的结果，重新解析整个日志"
+)
+def analyze(
+    log_file: str,
+    filter: Optional[str],
+    db_path: Optional[str],
+    no_geo: bool,
+    geo_engine: str,
+    workers: int,
+    memory_limit: Optional[float],
+    table: str,
+    output_format: str,
+    output: str,
+    output_dir: Optional[str],
+    since,
+    until,
+    partial_output: Optional[str],
+    full: bool,
+):
+    """无界面分析日志，将聚合结果或汇总表写入文件或标准输出
+
+    LOG_FILE 可以是压缩文件（gzip/xz/zstd）或 glob 模式，如 "access.log*"，
+    轮转的每个文件单独缓存。
+
+    与页面模式共用增量结果，定时任务中重复运行时只解析新追加的日志。
+    不导入 streamlit、folium、plotly。
+    """
+    if partial_output is not None:
+        _check_partial_path(partial_output)
+        # 地理位置在合并后打开时再补充
+        no_geo = True
+
+    analyzer = _create_analyzer(
+        db_path,
+        no_geo,
+        workers=workers,
+        geo_engine=geo_engine,
+        log_filter=filter,
+        memory_limit_mb=memory_limit,
+    )
+    log_file = Path(log_file)
+    try:
+        if partial_output is not None:
+            analyzer.export_partial(log_file, partial_output, not full)
+            return
+        tables = _analysis_tables(
+            analyzer, log_file, not full, _time_range(since, until)
+        )
+    except (FileNotFoundError, ValueError) as e:
+        raise click.ClickException(str(e))
+    finally:
+        analyzer.close()
+    _write_tables(tables, table, output, output_dir, output_format)
+
+
+def _check_partial_path(path):
+    """部分聚合结果的文件名需以 PARTIAL_SUFFIX 结尾"""
+    from v2log.partial import PARTIAL_SUFFIX, is_partial
+
+    if not is_partial(path):
+        raise click.ClickException(
+            f"部分聚合结果的文件名需以 {PARTIAL_SUFFIX} 结尾: {path}"
+        )
+
+
+def _create_analyzer(db_path: Optional[str], no_geo: bool, **kwargs):
+    """创建无界面使用的分析器，数据库或过滤表达式有误时报错"""
+    from v2log.analyzer import IPAnalyzer
+
+    db_path = Path(db_path) if db_path else DEFAULT_DB_PATH
+    if not no_geo and not db_path.exists():
+        raise click.ClickException(f"未找到IP2Location数据库: {db_path}")
+    try:
+        return IPAnalyzer(db_path=db_path, geolocate=not no_geo, **kwargs)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+
+def _time_range(since, until):
+    """--since/--until 对应的 [start, end) 时间范围，都未指定时为None"""
+    if since is None and until is None:
+        return None
+    return since, until
+
+
+def _analysis_tables(analyzer, log_file: Path, use_cache, time_range) -> dict:
+    """分析日志，返回分钟级聚合结果和各汇总表"""
+    aggregate = analyzer.process_log_file(
+        log_file,
+        use_cache=use_cache,
+        incremental=True,
+        time_range=time_range,
+    )
+    tables = {"aggregate": aggregate}
+    if time_range is None:
+        tables.update(analyzer.get_rollups(log_file, incremental=True) or {})
+    else:
+        # 保存的汇总表对应全部数据，指定时间范围时重新汇总
+        from v2log.rollup import build_rollups
+
+        tables.update(build_rollups(aggregate))
+    return tables
+
+
+def _write_tables(tables: dict, table, output, output_dir, output_format):
+    """写出 table 指定的表，指定 output_dir 时写出全部表"""
+    from v2log.export import EXPORT_FORMATS, write_export
+
+    try:
+        if output_dir is None:
+            if table not in tables:
+                raise click.ClickException(
+                    f"没有 {table} 汇总表，不做地理定位时不含城市相关的汇总表"
+                )
+            write_export(tables[table], output, output_format)
+            return
+
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        for name, df in tables.items():
+            path = Path(output_dir) / f"{name}{EXPORT_FORMATS[output_format]}"
+            write_export(df, path, output_format)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+
+@main.command()
+@click.argument(
+    "inputs",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "--output",
+    "-o",
+    required=True,
+    type=click.Path(dir_okay=False),
+    help="合并后的部分聚合结果文件（*.partial.parquet）",
+)
+@click.option(
+    "--chunk-rows",
+    type=int,
+    default=1_000_000,
+    show_default=True,
+    help="每次从每个文件读取的行数，内存占用与文件数和该值成正比",
+)
+def merge(inputs, output: str, chunk_rows: int):
+    """合并多台主机的部分聚合结果
+
+    INPUTS 为各主机上 analyze --partial 保存的文件，按时间逐块归并，
+    不会把全部文件读入内存。合并结果可以再次合并，
+    也可以直接用 v2log 打开页面或用 analyze 输出汇总表。
+    """
+    from v2log.partial import merge_partials
+
+    for path in (*inputs, output):
+        _check_partial_path(path)
+
+    try:
+        meta = merge_partials(
+            [Path(path) for path in inputs], Path(output), chunk_rows
+        )
+    except (KeyError, ValueError) as e:
+        raise click.ClickException(str(e))
+    hosts = sorted({source["host"] for source in meta["sources"]})
+    click.echo(
+        f"已合并 {len(meta['sources'])} 份日志（{', '.join(hosts)}）: {output}",
+        err=True,
+    )
+
+
+@main.command()
+@click.argument("log_file")
+@click.option("--filter", "-f", help="过滤规则，与分析时使用的相同")
+@click.option("--db-path", type=click.Path(), help="IP2Location数据库路径")
+@click.option(
+    "--no-geo", is_flag=True, help="整理 analyze --no-geo 保存的结果"
+)
+def compact(
+    log_file: str, filter: Optional[str], db_path: Optional[str], no_geo: bool
+):
+    """把已保存结果中已结束的月合并为一个分区
+
+    追加的日志按天分区保存，已有分区不会被改写；长期运行后分区文件较多时
+    用本命令整理，可以在定时任务中与 analyze 交替运行。结果数据不变。
+    """
+    analyzer = _create_analyzer(db_path, no_geo, log_filter=filter)
+    try:
+        compacted = analyzer.compact(Path(log_file))
+    except FileNotFoundError as e:
+        raise click.ClickException(str(e))
+    finally:
+        analyzer.close()
+    if not compacted:
+        click.echo("没有需要合并的分区", err=True)
+        return
+    click.echo(
+        f"已合并为 {len(compacted)} 个分区: {', '.join(compacted)}", err=True
+    )
+
+
 if __name__ == "__main__":
     main()
@@ -4,19 +4,44 @@ import folium
 import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
+from folium.plugins import FastMarkerCluster
 from plotly.subplots import make_subplots
 from streamlit_folium import folium_static
 import numpy as np
 
+from v2log.memo import memo_donut_data, memo_statistics, memo_timeline_data
 from v2log.utils import (
+    bin_map_markers,
     calculate_statistics,
     format_dataframe_for_display,
     get_map_markers,
+    get_marker_labels,
     paginate_dataframe,
     prepare_timeline_data,
     prepare_donut_data,
 )
 
+MAP_ZOOM = 4
+# 标记数超过该值时切换到大数据量模式：按网格合并后用单个图层绘制
+MAP_MARKER_LIMIT = 500
+# 大数据量模式下每个标记由浏览器端的该函数创建，数据只包含数组
+MARKER_CALLBACK = """function (row) {
+    return L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: row[2], color: "#3186cc", fill: true
+    }).bindPopup(row[3]);
+}"""
+
+
+# 时间范围的快捷选项，值为往前的时长，None 表示全部数据
+TIME_PRESETS = {
+    "全部": None,
+    "最近1小时": pd.Timedelta(hours=1),
+    "最近24小时": pd.Timedelta(hours=24),
+    "最近7天": pd.Timedelta(days=7),
+    "最近30天": pd.Timedelta(days=30),
+    "自定义": None,
+}
+
 
 class ProgressComponents:
     """进度显示组件类"""
@@ -39,21 +64,102 @@ class ProgressComponents:
 
 
 class BatchUpdateHandler:
-    """批量更新处理器类"""
+    """批量更新处理器类
 
-    def __init__(self, container):
+    接收分析过程中每批新增的数据，按 (min, src, dst) 合并计数。
+    页面只展示时间最新的一页，因此只保留这一页涉及的分钟内的行，
+    更早的行之后不会再出现在页面上，直接丢弃，内存占用与文件大小无关。
+    重绘间隔不少于 min_interval 秒；加载完成后预览区域即被清空，
+    由完整结果替代，因此间隔内最后几批不必再补绘。
+    """
+
+    KEY_COLUMNS = ["min", "src", "dst"]
+
+    def __init__(self, container, page_size=100, min_interval=1.0):
         self.container = container
+        self.page_size = page_size
+        self.min_interval = min_interval
         self.current_df = None
+        self.total_visits = 0
+        self.batches = 0
+        self._last_render = None
 
     def update(self, new_df: pd.DataFrame):
-        """更新数据和显示"""
-        if self.current_df is None:
-            self.current_df = new_df
-        else:
-            self.current_df = pd.concat([self.current_df, new_df])
-
+        """合并一批新增数据，距上次重绘足够久时刷新显示"""
+        self.batches += 1
+        self.total_visits += int(new_df["count"].sum())
+
+        new_df = self._visible_rows(new_df)
+        if self.current_df is not None:
+            new_df = pd.concat([self.current_df, new_df], ignore_index=True)
+        self.current_df = self._visible_rows(self._merge(new_df))
+
+        now = time.monotonic()
+        if (
+            self._last_render is None
+            or now - self._last_render >= self.min_interval
+        ):
+            self.render()
+
+    def render(self):
+        """显示当前保留的数据"""
         with self.container.container():
+            st.caption(
+                f"已处理 {self.batches} 批，共 {self.total_visits} 次访问"
+            )
             display_data_and_map(self.current_df)
+        self._last_render = time.monotonic()
+
+    def _merge(self, df: pd.DataFrame) -> pd.DataFrame:
+        """合并相同键的计数，其余列（地理位置）取第一个值"""
+        aggregations = {
+            column: "sum" if column == "count" else "first"
+            for column in df.columns
+            if column not in self.KEY_COLUMNS
+        }
+        return df.groupby(
+            self.KEY_COLUMNS, observed=True, sort=False, as_index=False
+        ).agg(aggregations)
+
+    def _visible_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        """保留时间最新的一页所涉及分钟内的全部行"""
+        if len(df) <= self.page_size:
+            return df
+        return df.nlargest(self.page_size, "min", keep="all")
+
+
+def select_time_range(bounds):
+    """时间范围选择，返回左闭右开的 (start, end)，选择全部时返回None
+
+    bounds 为数据的 (最早, 最晚) 时间，"最近"按数据中最晚的时间计算。
+    """
+    first, last = bounds
+    col_preset, col_dates = st.columns([1, 2])
+    with col_preset:
+        choice = st.selectbox(
+            "时间范围", list(TIME_PRESETS), key="time_preset"
+        )
+    if choice == "自定义":
+        with col_dates:
+            dates = st.date_input(
+                "日期",
+                value=(last.date(), last.date()),
+                min_value=first.date(),
+                max_value=last.date(),
+                key="time_dates",
+            )
+        # 只选了开始日期时按一天计算
+        start, end = (dates[0], dates[-1]) if dates else (last, last)
+        return (
+            pd.Timestamp(start).floor("D"),
+            pd.Timestamp(end).floor("D") + pd.Timedelta(days=1),
+        )
+
+    span = TIME_PRESETS[choice]
+    if span is None:
+        return None
+    end = last + pd.Timedelta(minutes=1)
+    return (end - span, end)
 
 
 def create_refresh_button() -> bool:
@@ -70,15 +176,24 @@ def create_refresh_button() -> bool:
             st.info(f"上次更新时间: {st.session_state.last_refresh}")
 
 
-def display_data_and_map(df: pd.DataFrame, search_mode: bool = False):
-    """显示数据表格和对应的地图"""
+def display_data_and_map(
+    df: pd.DataFrame,
+    search_mode: bool = False,
+    rollups: dict = None,
+    key: str = None,
+):
+    """显示数据表格和对应的地图
+
+    rollups 为预先计算的汇总表，key 标识当前数据，相同 key 的图表数据
+    直接取缓存。
+    """
     formatted_df = format_dataframe_for_display(df)
     total_rows = len(formatted_df)
 
     # 在搜索模式下显示时间轴和环形图
     if search_mode:
-        display_timeline(df)
-        display_donut_charts(df)
+        display_timeline(df, rollups, key)
+        display_donut_charts(df, rollups, key)
 
     # 确定要显示的数据
     if search_mode:
@@ -136,7 +251,7 @@ def display_data_and_map(df: pd.DataFrame, search_mode: bool = False):
 
     with col2:
         st.write("访问地图")
-        display_map(df[df.index.isin(display_df.index)])
+        display_map(df.loc[display_df.index])
 
 
 def display_map(df: pd.DataFrame):
@@ -154,14 +269,25 @@ def display_map(df: pd.DataFrame):
     # 创建地图
     center_lat = markers_df["x"].mean()
     center_lon = markers_df["y"].mean()
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=4)
+    m = folium.Map(location=[center_lat, center_lon], zoom_start=MAP_ZOOM)
+
+    if len(markers_df) > MAP_MARKER_LIMIT:
+        add_binned_markers(m, bin_map_markers(markers_df, MAP_ZOOM))
+        folium_static(m)
+        return
 
-    # 添加标记
-    for _, row in markers_df.iterrows():
+    # 添加标记，坐标、大小和说明都按列计算
+    radius = np.log1p(markers_df["count"].to_numpy()) * 3  # 根据访问量调整大小
+    for x, y, size, label in zip(
+        markers_df["x"].tolist(),
+        markers_df["y"].tolist(),
+        radius.tolist(),
+        get_marker_labels(markers_df).tolist(),
+    ):
         folium.CircleMarker(
-            location=[row["x"], row["y"]],
-            radius=np.log1p(row["count"]) * 3,  # 根据访问量调整大小
-            popup=f"{row['city']}: {row['count']} 次访问",
+            location=[x, y],
+            radius=size,
+            popup=label,
             color="#3186cc",
             fill=True,
         ).add_to(m)
@@ -170,12 +296,38 @@ def display_map(df: pd.DataFrame):
     folium_static(m)
 
 
-def display_statistics(df: pd.DataFrame):
+def add_binned_markers(m: folium.Map, binned: pd.DataFrame):
+    """将网格合并后的标记作为单个图层加入地图
+
+    标记数据以 [纬度, 经度, 半径, 说明] 数组的形式嵌入页面，
+    缩小到 MAP_ZOOM 以下时再由浏览器端聚合。
+    """
+    labels = get_marker_labels(binned)
+    radius = np.round(np.log1p(binned["count"].to_numpy()) * 3, 1)
+    data = list(
+        zip(
+            binned["x"].round(4).tolist(),
+            binned["y"].round(4).tolist(),
+            radius.tolist(),
+            labels.tolist(),
+        )
+    )
+    FastMarkerCluster(
+        data,
+        callback=MARKER_CALLBACK,
+        options={"disableClusteringAtZoom": MAP_ZOOM},
+    ).add_to(m)
+
+
+def display_statistics(df: pd.DataFrame, rollups: dict = None, key=None):
     """显示统计信息"""
     st.markdown("---")  # 添加分隔线
     st.subheader("统计信息")
 
-    stats = calculate_statistics(df)
+    if key is None:
+        stats = calculate_statistics(df, rollups)
+    else:
+        stats = memo_statistics(key, df, rollups)
 
     # 使用三列布局显示基本统计
     col1, col2, col3 = st.columns(3)
@@ -223,12 +375,15 @@ def display_data_table(df: pd.DataFrame, search_mode: bool = False):
         st.dataframe(paginate_dataframe(formatted_df, page_size, page))
 
 
-def display_timeline(df: pd.DataFrame):
+def display_timeline(df: pd.DataFrame, rollups: dict = None, key=None):
     """显示访问量时间轴"""
     st.subheader("访问量时间趋势")
 
     # 准备数据
-    timeline_data = prepare_timeline_data(df)
+    if key is None:
+        timeline_data = prepare_timeline_data(df, rollups)
+    else:
+        timeline_data = memo_timeline_data(key, df, rollups)
 
     # 创建图表
     fig = make_subplots(
@@ -239,7 +394,10 @@ def display_timeline(df: pd.DataFrame):
         vertical_spacing=0.12,
     )
 
-    # 添加城市访问量堆叠柱状图
+    if timeline_data.index.freqstr:
+        st.caption(f"时间粒度: {timeline_data.index.freqstr}")
+
+    # 添加城市访问量堆叠柱状图，具体数值在悬停时显示
     cities = [col for col in timeline_data.columns if col != "total"]
     for city in cities:
         fig.add_trace(
@@ -247,8 +405,6 @@ def display_timeline(df: pd.DataFrame):
                 x=timeline_data.index,
                 y=timeline_data[city],
                 name=city,
-                text=timeline_data[city],  # 显示具体数值
-                textposition="auto",  # 自动调整文本位置
             ),
             row=1,
             col=1,
@@ -291,9 +447,12 @@ def display_timeline(df: pd.DataFrame):
     st.plotly_chart(fig, use_container_width=True)
 
 
-def display_donut_charts(df: pd.DataFrame):
+def display_donut_charts(df: pd.DataFrame, rollups: dict = None, key=None):
     """显示环形图"""
-    period_data, ip_data, city_data = prepare_donut_data(df)
+    if key is None:
+        period_data, ip_data, city_data = prepare_donut_data(df, rollups)
+    else:
+        period_data, ip_data, city_data = memo_donut_data(key, df, rollups)
 
     # 创建三列布局
     col1, col2, col3 = st.columns(3)
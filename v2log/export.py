@@ -0,0 +1,40 @@
+import io
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from v2log.cache import pq
+
+# 无界面分析支持的输出格式及对应的文件扩展名
+EXPORT_FORMATS = {"csv": ".csv", "json": ".json", "parquet": ".parquet"}
+
+
+def export_frame(df: pd.DataFrame, fmt: str) -> bytes:
+    """将结果表序列化为指定格式
+
+    JSON 为记录数组，时间按 ISO 8601 格式输出；parquet 需要安装 pyarrow。
+    """
+    if fmt == "csv":
+        return df.to_csv(index=False).encode()
+    if fmt == "json":
+        return df.to_json(
+            orient="records", date_format="iso", force_ascii=False
+        ).encode()
+    if fmt == "parquet":
+        if pq is None:
+            raise ValueError("parquet 格式需要安装 pyarrow")
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    raise ValueError(f"未知的输出格式: {fmt}")
+
+
+def write_export(df: pd.DataFrame, output, fmt: str):
+    """写入文件，output 为 "-" 时写入标准输出"""
+    data = export_frame(df, fmt)
+    if str(output) == "-":
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    else:
+        Path(output).write_bytes(data)
@@ -0,0 +1,283 @@
+import abc
+import fnmatch
+import ipaddress
+import re
+import shlex
+
+import numpy as np
+import pandas as pd
+
+# 过滤表达式支持的字段
+FIELDS = ("dst", "src", "time", "country")
+# 时间范围的分隔符，两端均可省略，例如 "time:2025-01-01..2025-01-02"
+RANGE_SEPARATOR = ".."
+NEGATE_PREFIXES = ("-", "!")
+MINUTE_NS = 60 * 10**9
+
+
+class Clause(abc.ABC):
+    """过滤表达式中的一个条件，同一条件内的多个取值为"或"关系"""
+
+    field = None
+
+    def __init__(self, negate=False):
+        self.negate = negate
+
+    def mask(self, minutes, srcs, dsts, log_filter) -> np.ndarray:
+        matched = self._match(minutes, srcs, dsts, log_filter)
+        return ~matched if self.negate else matched
+
+    @abc.abstractmethod
+    def _match(self, minutes, srcs, dsts, log_filter) -> np.ndarray:
+        """返回每行是否满足条件（不考虑取反）"""
+
+    @abc.abstractmethod
+    def values(self) -> str:
+        """规范化的取值，用于 canonical"""
+
+    def canonical(self) -> str:
+        prefix = NEGATE_PREFIXES[0] if self.negate else ""
+        return f"{prefix}{self.field}:{self.values()}"
+
+
+def match_unique(values: list, predicate) -> np.ndarray:
+    """只对不重复的取值判断一次，再按编码展开到各行"""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    matched = np.fromiter(
+        (predicate(value) for value in uniques), dtype=bool, count=len(uniques)
+    )
+    return matched[codes]
+
+
+class DstClause(Clause):
+    """目标域名，支持通配符；"*.example.com" 同时匹配 example.com 本身"""
+
+    field = "dst"
+
+    def __init__(self, patterns, negate=False):
+        super().__init__(negate)
+        self.patterns = sorted({pattern.lower() for pattern in patterns})
+        regexes = []
+        for pattern in self.patterns:
+            regexes.append(fnmatch.translate(pattern))
+            if pattern.startswith("*."):
+                regexes.append(fnmatch.translate(pattern[2:]))
+        self._regex = re.compile("|".join(regexes), re.IGNORECASE)
+
+    def _match(self, minutes, srcs, dsts, log_filter):
+        return match_unique(dsts, self._regex.match)
+
+    def values(self):
+        return ",".join(self.patterns)
+
+
+class SrcClause(Clause):
+    """来源IP，取值可以是单个地址或 CIDR 网段"""
+
+    field = "src"
+
+    def __init__(self, networks, negate=False):
+        super().__init__(negate)
+        try:
+            parsed = {
+                ipaddress.ip_network(network, strict=False)
+                for network in networks
+            }
+        except ValueError as e:
+            raise ValueError(f"无效的IP或网段: {e}") from None
+        self.networks = sorted(parsed, key=lambda n: (n.version, n))
+
+    def _contains(self, ip) -> bool:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return any(address in network for network in self.networks)
+
+    def _match(self, minutes, srcs, dsts, log_filter):
+        return match_unique(srcs, self._contains)
+
+    def values(self):
+        return ",".join(
+            (
+                str(network.network_address)
+                if network.prefixlen == network.max_prefixlen
+                else str(network)
+            )
+            for network in self.networks
+        )
+
+
+class TimeClause(Clause):
+    """时间范围 [start, end)，与日志中的分钟时间直接比较"""
+
+    field = "time"
+
+    def __init__(self, start=None, end=None, negate=False):
+        super().__init__(negate)
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def parse(cls, text, negate=False):
+        if RANGE_SEPARATOR not in text:
+            raise ValueError(f"时间范围应为 start..end 的形式: {text}")
+        start, end = (
+            cls._parse_time(part) for part in text.split(RANGE_SEPARATOR, 1)
+        )
+        if start is None and end is None:
+            raise ValueError("时间范围至少需要指定开始或结束时间")
+        return cls(start, end, negate)
+
+    @staticmethod
+    def _parse_time(text):
+        text = text.strip()
+        if not text:
+            return None
+        try:
+            return pd.Timestamp(text.replace("_", " ")).tz_localize(None)
+        except ValueError:
+            raise ValueError(f"无效的时间: {text}") from None
+
+    @staticmethod
+    def _to_minute(timestamp) -> int:
+        """转换为 epoch 分钟，不足一分钟的部分向上取整"""
+        return -(-timestamp.as_unit("ns").value // MINUTE_NS)
+
+    def _match(self, minutes, srcs, dsts, log_filter):
+        matched = np.ones(len(minutes), dtype=bool)
+        if self.start is not None:
+            matched &= minutes >= self._to_minute(self.start)
+        if self.end is not None:
+            matched &= minutes < self._to_minute(self.end)
+        return matched
+
+    def values(self):
+        return RANGE_SEPARATOR.join(
+            "" if value is None else value.isoformat()
+            for value in (self.start, self.end)
+        )
+
+
+class CountryClause(Clause):
+    """来源IP所在国家，按名称匹配且不区分大小写，需要地理位置数据库"""
+
+    field = "country"
+
+    def __init__(self, names, negate=False):
+        super().__init__(negate)
+        self.names = sorted({name.strip().lower() for name in names})
+
+    def _match(self, minutes, srcs, dsts, log_filter):
+        codes, uniques = pd.factorize(np.asarray(srcs, dtype=object))
+        countries = log_filter.locator().locate_columns(list(uniques))
+        matched = np.isin(
+            np.char.lower(countries["country"].astype(str)), self.names
+        )
+        return matched[codes]
+
+    def values(self):
+        return ",".join(self.names)
+
+
+class LogFilter:
+    """编译后的过滤表达式，各条件之间为"且"关系
+
+    表达式由空格分隔的 field:value 组成，同一字段的多个取值用逗号
+    分隔（"或"关系），前缀 "-" 或 "!" 表示取反，含空格的取值可加引号：
+
+        dst:*.google.com,*.youtube.com src:10.0.0.0/8 -country:china
+        time:"2025-01-01 08:00..2025-01-01 12:00"
+
+    过滤在解析阶段、聚合和地理定位之前进行。
+    """
+
+    def __init__(self, clauses, geo=None):
+        self.clauses = clauses
+        self.geo = geo
+        self._geo_args = None
+
+    @property
+    def normalized(self) -> str:
+        """规范化的表达式，语义相同的表达式结果相同，用作缓存键"""
+        return " ".join(sorted(clause.canonical() for clause in self.clauses))
+
+    @property
+    def needs_geo(self) -> bool:
+        return any(isinstance(c, CountryClause) for c in self.clauses)
+
+    def locator(self):
+        """国家条件使用的地理位置查询，子进程中按需重新打开数据库"""
+        if self.geo is None:
+            if self._geo_args is None:
+                raise ValueError("country 过滤需要IP地理位置数据库")
+            from v2log.geo import GeoLocator
+
+            db_path, engine = self._geo_args
+            self.geo = GeoLocator(db_path, engine=engine)
+        return self.geo
+
+    def __getstate__(self):
+        # 数据库句柄不能跨进程传递，只保留重新打开所需的参数
+        state = self.__dict__.copy()
+        if self.geo is not None:
+            state["_geo_args"] = (
+                self.geo.db_path,
+                "mmap" if self.geo.engine is not None else "file",
+            )
+        state["geo"] = None
+        return state
+
+    def apply(self, minutes, srcs, dsts, counts) -> tuple:
+        """对 parse_block 的结果逐条件过滤，返回同样格式的结果"""
+        matched = np.ones(len(counts), dtype=bool)
+        for clause in self.clauses:
+            if not matched.any():
+                break
+            matched &= clause.mask(minutes, srcs, dsts, self)
+
+        if matched.all():
+            return minutes, srcs, dsts, counts
+        keep = np.flatnonzero(matched)
+        return (
+            minutes[keep],
+            [srcs[i] for i in keep],
+            [dsts[i] for i in keep],
+            counts[keep],
+        )
+
+
+def compile_filter(expression: str, geo=None):
+    """编译过滤表达式，表达式为空时返回None，语法错误时抛出 ValueError"""
+    try:
+        tokens = shlex.split(expression or "")
+    except ValueError as e:
+        raise ValueError(f"无效的过滤表达式: {e}") from None
+
+    clauses = []
+    for token in tokens:
+        negate = token.startswith(NEGATE_PREFIXES)
+        if negate:
+            token = token[1:]
+        field, _, value = token.partition(":")
+        field = field.lower()
+        if field not in FIELDS or not value:
+            raise ValueError(
+                f"无效的过滤条件: {token}，应为 field:value，"
+                f"field 可选 {', '.join(FIELDS)}"
+            )
+
+        if field == "time":
+            clauses.append(TimeClause.parse(value, negate))
+            continue
+        values = [part for part in value.split(",") if part.strip()]
+        if field == "dst":
+            clauses.append(DstClause(values, negate))
+        elif field == "src":
+            clauses.append(SrcClause(values, negate))
+        else:
+            clauses.append(CountryClause(values, negate))
+
+    if not clauses:
+        return None
+    return LogFilter(clauses, geo)
@@ -0,0 +1,170 @@
+import threading
+import time
+from pathlib import Path
+
+from v2log.aggregate import Aggregator
+from v2log.analyzer import IPAnalyzer
+from v2log.parser import complete_lines_end, iter_blocks
+from v2log.rollup import build_rollups
+from v2log.search import SearchIndex
+
+
+class LogFollower:
+    """持续跟踪日志文件，后台线程将新增行增量聚合
+
+    聚合结果与增量模式共用同一份状态文件：启动时先追上文件末尾，
+    之后按 poll_interval 检查文件大小，只在有新内容时解析，
+    文件空闲时线程只做一次 stat，几乎不占用CPU。
+    """
+
+    def __init__(
+        self,
+        analyzer: IPAnalyzer,
+        log_file_path: Path,
+        poll_interval: float = 1.0,
+        save_interval: float = 60.0,
+    ):
+        self.analyzer = analyzer
+        self.log_file_path = Path(log_file_path)
+        self.poll_interval = poll_interval
+        self.save_interval = save_interval
+
+        self.offset = 0
+        self.inode = None
+        self.aggregated_data = Aggregator()
+        # 每次聚合数据变化时递增，用于判断快照是否过期
+        self.version = 0
+        self.last_update = None
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._snapshot = None
+        self._snapshot_version = -1
+        self._rollups = None
+        self._rollups_version = -1
+        self._index = None
+        self._index_version = -1
+        self._saved_version = 0
+        # 上次保存之后是否因截断或轮转从头读取，是则保存时重写全部分区
+        self._reset = False
+
+    def start(self):
+        """追上文件末尾并启动后台读取线程"""
+        if self._thread is not None:
+            return self
+
+        # 复用增量模式解析已有内容，并从保存的状态继续
+        self.analyzer.process_log_file(self.log_file_path, incremental=True)
+        checkpoint = self.analyzer.load_incremental_state(self.log_file_path)
+        if checkpoint is not None:
+            self.offset, self.aggregated_data = checkpoint
+            self.inode = self.log_file_path.stat().st_ino
+        else:
+            self._reset = True
+        self.version += 1
+        self._saved_version = self.version
+
+        self._thread = threading.Thread(
+            target=self._run, name="v2log-follower", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止后台线程并保存状态"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._save_state()
+
+    def _run(self):
+        last_save = time.monotonic()
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.poll()
+            except OSError:
+                # 文件轮转的间隙可能暂时不存在，下次再试
+                continue
+
+            if time.monotonic() - last_save >= self.save_interval:
+                self._save_state()
+                last_save = time.monotonic()
+
+    def poll(self) -> bool:
+        """读取一次新追加的内容，返回是否有数据更新"""
+        stat = self.log_file_path.stat()
+
+        # 文件被截断或轮转时从头开始
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            with self._lock:
+                self.offset = 0
+                self.inode = stat.st_ino
+                self.aggregated_data = Aggregator()
+                self.version += 1
+                self._reset = True
+
+        if stat.st_size == self.offset:
+            return False
+
+        with self.log_file_path.open("rb") as f:
+            end_offset = complete_lines_end(f, self.offset)
+            if end_offset == self.offset:
+                return False
+
+            f.seek(self.offset)
+            for data in iter_blocks(f, end_offset):
+                with self._lock:
+                    self.analyzer.process_block(
+                        data.decode("utf-8", errors="replace"),
+                        self.aggregated_data,
+                    )
+                    self.offset += len(data)
+                    self.version += 1
+
+        self.last_update = time.time()
+        return True
+
+    def snapshot(self):
+        """返回当前聚合结果的DataFrame，数据未变化时复用上次结果"""
+        with self._lock:
+            if self._snapshot_version != self.version:
+                self._snapshot = self.analyzer.create_dataframe(
+                    self.aggregated_data
+                )
+                self._snapshot_version = self.version
+            return self._snapshot
+
+    def rollups(self):
+        """返回当前快照的汇总表，数据未变化时复用上次结果"""
+        self.snapshot()
+        with self._lock:
+            if self._rollups_version != self._snapshot_version:
+                self._rollups = build_rollups(self._snapshot)
+                self._rollups_version = self._snapshot_version
+            return self._rollups
+
+    def search_index(self):
+        """返回 dst 的搜索索引，只在出现新的 dst 时重建"""
+        with self._lock:
+            dst_count = len(self.aggregated_data.dst_ids)
+            if self._index_version != dst_count:
+                self._index = SearchIndex(self.aggregated_data.dst_names)
+                self._index_version = dst_count
+            return self._index
+
+    def _save_state(self):
+        """将当前聚合结果写回增量状态文件"""
+        with self._lock:
+            if self._saved_version == self.version or self.inode is None:
+                return
+            # 快照只在内存中更新地理位置缓存，随状态一起定期保存
+            self.analyzer.save_incremental_state(
+                self.aggregated_data,
+                self.log_file_path,
+                self.offset,
+                append_only=not self._reset,
+            )
+            self._saved_version = self.version
+            self._reset = False
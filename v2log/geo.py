@@ -0,0 +1,457 @@
+import hashlib
+import ipaddress
+import mmap
+import os
+import pickle
+import socket
+import struct
+from collections import OrderedDict
+from pathlib import Path
+
+import IP2Location
+import numpy as np
+
+# 各类型数据库中字段所在的列（与 IP2Location 官方库一致），0 表示不包含
+COUNTRY_POSITION = (0,) + (2,) * 26
+CITY_POSITION = (0, 0, 0) + (4,) * 24
+LATITUDE_POSITION = (0, 0, 0, 0, 0, 5, 5, 0) + (5,) * 19
+LONGITUDE_POSITION = (0, 0, 0, 0, 0, 6, 6, 0) + (6,) * 19
+MAX_IPV4 = 2**32 - 1
+MAX_IPV6 = 2**128 - 1
+# 映射到IPv4的IPv6地址段：6to4、Teredo、IPv4-mapped
+SIX_TO_FOUR = (0x2002 << 112, (0x2003 << 112) - 1)
+TEREDO = (0x20010000 << 96, (0x20010001 << 96) - 1)
+IPV4_MAPPED = (0xFFFF << 32, (0x10000 << 32) - 1)
+
+# LRU 缓存默认容量（IP 数）
+DEFAULT_CACHE_SIZE = 1_000_000
+DEFAULT_LOCATION = {
+    "x": np.float32(0),
+    "y": np.float32(0),
+    "country": "Unknown",
+    "city": "Unknown",
+}
+
+
+def file_identity(path: Path) -> str:
+    """由大小、修改时间和 inode 得到的文件标识，无需读取文件内容"""
+    stat = Path(path).stat()
+    key = f"{stat.st_size}-{stat.st_mtime_ns}-{stat.st_ino}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def parse_ip(ip: str) -> tuple:
+    """解析IP地址，返回 (版本, 地址整数)，规则与官方库一致，无效地址版本为0"""
+    if ":" in ip:
+        try:
+            number = int.from_bytes(
+                socket.inet_pton(socket.AF_INET6, ip), "big"
+            )
+        except (OSError, ValueError):
+            return 0, -1
+        if SIX_TO_FOUR[0] <= number <= SIX_TO_FOUR[1]:
+            return 4, (number >> 80) % 2**32
+        if TEREDO[0] <= number <= TEREDO[1]:
+            return 4, ~number % 2**32
+        if IPV4_MAPPED[0] <= number <= IPV4_MAPPED[1]:
+            return 4, number - IPV4_MAPPED[0]
+        return 6, number
+
+    if "256" in ip:
+        return 0, -1
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except (OSError, ValueError):
+        return 0, -1
+
+
+class MmapDatabase:
+    """内存映射的 IP2Location 数据库，整批IP一次性向量化查询
+
+    IPv4/IPv6 区间起始地址加载为有序数组，查询时用一次 np.searchsorted
+    定位所在区间，只解码经纬度、国家、城市四列，结果与官方库一致。
+    """
+
+    def __init__(self, db_path: Path):
+        with Path(db_path).open("rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = self._mm[:32]
+        self.db_type, db_column = header[0], header[1]
+        ipv4_count, ipv4_addr, ipv6_count, ipv6_addr = struct.unpack(
+            "<4I", header[5:21]
+        )
+
+        # 每张表多读一行，其起始地址即最后一个区间的结束地址
+        self._ipv4_rows = self._table(ipv4_addr, ipv4_count, db_column * 4)
+        self._ipv4_starts = self._ipv4_rows[:, :4].copy().view("<u4").ravel()
+        self._ipv6_rows = self._table(
+            ipv6_addr, ipv6_count, db_column * 4 + 12
+        )
+        # 128位地址转为大端字节串，按字节序比较即按数值比较
+        self._ipv6_starts = (
+            self._ipv6_rows[:, 15::-1].copy().view("S16").ravel()
+        )
+
+    def close(self):
+        """释放内存映射，之前返回的查询结果不受影响"""
+        # 先释放引用映射内存的数组，否则无法关闭
+        self._ipv4_rows = self._ipv6_rows = None
+        self._mm.close()
+
+    def _table(self, addr, count, row_size) -> np.ndarray:
+        if count == 0:
+            return np.empty((0, row_size), dtype=np.uint8)
+        return np.ndarray(
+            (count + 1, row_size),
+            dtype=np.uint8,
+            buffer=self._mm,
+            offset=addr - 1,
+        )
+
+    def lookup(self, ips) -> dict:
+        """批量查询IP，返回 x/y/country/city 四列数组，查不到时为默认值"""
+        versions, numbers = zip(*map(parse_ip, ips)) if len(ips) else ((), ())
+        versions = np.array(versions, dtype=np.int8)
+        result = {
+            "x": np.zeros(len(ips), dtype=np.float32),
+            "y": np.zeros(len(ips), dtype=np.float32),
+            "country": np.full(len(ips), DEFAULT_LOCATION["country"], object),
+            "city": np.full(len(ips), DEFAULT_LOCATION["city"], object),
+        }
+
+        ipv4 = np.flatnonzero(versions == 4)
+        if len(ipv4) and len(self._ipv4_starts):
+            ipno = np.array([numbers[i] for i in ipv4], dtype=np.uint32)
+            ipno[ipno == MAX_IPV4] -= 1
+            self._fill(result, ipv4, ipno, self._ipv4_starts, self._ipv4_rows)
+
+        ipv6 = np.flatnonzero(versions == 6)
+        if len(ipv6) and len(self._ipv6_starts):
+            ipno = np.array(
+                [
+                    min(numbers[i], MAX_IPV6 - 1).to_bytes(16, "big")
+                    for i in ipv6
+                ],
+                dtype="S16",
+            )
+            # IPv6 行的各列位于16字节地址之后
+            self._fill(
+                result,
+                ipv6,
+                ipno,
+                self._ipv6_starts,
+                self._ipv6_rows[:, 12:],
+            )
+        return result
+
+    def _fill(self, result, positions, ipno, starts, rows):
+        index = np.searchsorted(starts, ipno, side="right") - 1
+        found = (index >= 0) & (index < len(starts) - 1)
+        found[found] = ipno[found] < starts[index[found] + 1]
+        positions, rows = positions[found], rows[index[found]]
+
+        def column(positions_table, dtype):
+            position = positions_table[self.db_type]
+            offset = (position - 1) * 4
+            return rows[:, offset : offset + 4].copy().view(dtype).ravel()
+
+        for key, positions_table in (
+            ("x", LATITUDE_POSITION),
+            ("y", LONGITUDE_POSITION),
+        ):
+            if positions_table[self.db_type]:
+                values = column(positions_table, "<f4").astype(np.float64)
+                result[key][positions] = np.round(values, 6)
+        for key, positions_table, skip in (
+            ("country", COUNTRY_POSITION, 3),
+            ("city", CITY_POSITION, 0),
+        ):
+            if positions_table[self.db_type]:
+                pointers = column(positions_table, "<u4")
+                unique, inverse = np.unique(pointers, return_inverse=True)
+                names = np.array(
+                    [self._read_string(int(p) + skip) for p in unique],
+                    dtype=object,
+                )
+                result[key][positions] = names[inverse]
+
+    def _read_string(self, offset) -> str:
+        length = self._mm[offset]
+        return self._mm[offset + 1 : offset + 1 + length].decode("iso-8859-1")
+
+
+class GeoLocator:
+    """IP地理位置查询层
+
+    - 有界 LRU 缓存，容量由 cache_size 控制
+    - 指定 persist_dir 时缓存跨运行持久化，文件名包含数据库文件的
+      大小、修改时间和 inode，数据库更新后旧缓存自然失效
+    - IPv4 地址只读取经纬度、国家、城市四个字段，
+      其余地址交给官方库的 get_all 处理
+    - engine="mmap" 时改用 MmapDatabase 整批向量化查询，
+      不再打开其他文件句柄
+
+    用完后调用 close，或作为上下文管理器使用。
+    """
+
+    ENGINES = ("file", "mmap")
+
+    def __init__(
+        self,
+        db_path: Path,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        persist_dir: Path = None,
+        engine: str = "file",
+    ):
+        if engine not in self.ENGINES:
+            raise ValueError(f"未知的查询引擎: {engine}")
+
+        self.db_path = Path(db_path)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self._dirty = False
+        self._database = None
+        self._f = None
+        self.engine = None
+        if engine == "mmap":
+            self.engine = MmapDatabase(self.db_path)
+        else:
+            self._f = self.db_path.open("rb")
+            self._read_header()
+
+        self.persist_path = None
+        if persist_dir is not None:
+            db_key = file_identity(self.db_path)[:16]
+            self.persist_path = Path(persist_dir) / f"geoip_{db_key}.pkl"
+            self._load()
+
+    @property
+    def database(self):
+        """官方库的查询对象，只在查询非IPv4地址时打开"""
+        if self._database is None:
+            self._database = IP2Location.IP2Location(str(self.db_path))
+        return self._database
+
+    def close(self):
+        """关闭数据库文件，缓存仍可保存"""
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if self._database is not None:
+            self._database.close()
+            self._database = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_header(self):
+        header = self._f.read(32)
+        self._db_type, self._db_column = header[0], header[1]
+        (
+            self._ipv4_count,
+            self._ipv4_addr,
+            _,
+            _,
+            self._ipv4_index_addr,
+        ) = struct.unpack("<5I", header[5:25])
+        self._row_size = self._db_column * 4
+
+    def locate(self, ip: str) -> dict:
+        """查询单个IP"""
+        location = self.cache.get(ip)
+        if location is not None:
+            self.cache.move_to_end(ip)
+            return location
+
+        if self.engine is not None:
+            return self.locate_many([ip])[ip]
+
+        location = self._lookup(ip)
+        self._remember(ip, location)
+        return location
+
+    def locate_many(self, ips) -> dict:
+        """批量查询，先去重，未缓存的IP按地址顺序查询以提高读取局部性"""
+        result = {}
+        missing = []
+        for ip in dict.fromkeys(ips):
+            location = self.cache.get(ip)
+            if location is None:
+                missing.append(ip)
+            else:
+                self.cache.move_to_end(ip)
+                result[ip] = location
+
+        if self.engine is not None:
+            columns = self.engine.lookup(missing)
+            for ip, x, y, country, city in zip(
+                missing,
+                columns["x"],
+                columns["y"],
+                columns["country"],
+                columns["city"],
+            ):
+                location = {"x": x, "y": y, "country": country, "city": city}
+                self._remember(ip, location)
+                result[ip] = location
+            return result
+
+        for ip in sorted(missing, key=self._sort_key):
+            location = self._lookup(ip)
+            self._remember(ip, location)
+            result[ip] = location
+        return result
+
+    def locate_columns(self, ips) -> dict:
+        """批量查询，返回与 ips 对齐的 x/y/country/city 四列数组"""
+        locations = self.locate_many(ips)
+        rows = [locations[ip] for ip in ips]
+        return {
+            "x": np.array([loc["x"] for loc in rows], dtype=np.float32),
+            "y": np.array([loc["y"] for loc in rows], dtype=np.float32),
+            "country": np.array([loc["country"] for loc in rows], object),
+            "city": np.array([loc["city"] for loc in rows], object),
+        }
+
+    def _remember(self, ip, location):
+        self.cache[ip] = location
+        self._dirty = True
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    @staticmethod
+    def _sort_key(ip):
+        try:
+            return int(ipaddress.IPv4Address(ip))
+        except ValueError:
+            return MAX_IPV4 + 1
+
+    def _lookup(self, ip) -> dict:
+        try:
+            ipnum = int(ipaddress.IPv4Address(ip))
+        except ValueError:
+            return self._lookup_generic(ip)
+
+        try:
+            return self._lookup_ipv4(ipnum)
+        except (struct.error, IndexError, UnicodeDecodeError):
+            return DEFAULT_LOCATION.copy()
+
+    def _lookup_generic(self, ip) -> dict:
+        """非IPv4地址使用官方库查询"""
+        try:
+            rec = self.database.get_all(ip)
+            return {
+                "x": np.float32(rec.latitude),
+                "y": np.float32(rec.longitude),
+                "country": rec.country_long,
+                "city": rec.city,
+            }
+        except Exception:
+            return DEFAULT_LOCATION.copy()
+
+    def _read(self, offset, size):
+        self._f.seek(offset)
+        return self._f.read(size)
+
+    def _read_string(self, offset):
+        length = self._read(offset, 1)[0]
+        return self._read(offset + 1, length).decode("iso-8859-1")
+
+    def _lookup_ipv4(self, ipnum) -> dict:
+        """在IPv4区间表中二分查找，只解码需要的字段"""
+        ipno = ipnum - 1 if ipnum == MAX_IPV4 else ipnum
+        low, high = 0, self._ipv4_count
+        if self._ipv4_index_addr > 0:
+            low, high = struct.unpack(
+                "<2I",
+                self._read(self._ipv4_index_addr - 1 + ((ipno >> 16) << 3), 8),
+            )
+
+        while low <= high:
+            mid = (low + high) // 2
+            row_offset = self._ipv4_addr - 1 + mid * self._row_size
+            row = self._read(row_offset, self._row_size + 4)
+            ip_from = struct.unpack_from("<I", row)[0]
+            ip_to = struct.unpack_from("<I", row, self._row_size)[0]
+            if ip_from <= ipno < ip_to:
+                return self._decode_row(row)
+            if ipno < ip_from:
+                high = mid - 1
+            else:
+                low = mid + 1
+
+        return DEFAULT_LOCATION.copy()
+
+    def _decode_row(self, row) -> dict:
+        def column(positions):
+            position = positions[self._db_type]
+            return (position - 1) * 4 if position else None
+
+        location = DEFAULT_LOCATION.copy()
+        location["x"] = location["y"] = np.float32(0)
+
+        if (offset := column(LATITUDE_POSITION)) is not None:
+            lat = struct.unpack_from("<f", row, offset)[0]
+            location["x"] = np.float32(round(lat, 6))
+        if (offset := column(LONGITUDE_POSITION)) is not None:
+            lon = struct.unpack_from("<f", row, offset)[0]
+            location["y"] = np.float32(round(lon, 6))
+        if (offset := column(COUNTRY_POSITION)) is not None:
+            pointer = struct.unpack_from("<I", row, offset)[0]
+            location["country"] = self._read_string(pointer + 3)
+        if (offset := column(CITY_POSITION)) is not None:
+            pointer = struct.unpack_from("<I", row, offset)[0]
+            location["city"] = self._read_string(pointer)
+        return location
+
+    def _load(self):
+        """加载持久化的缓存"""
+        try:
+            with self.persist_path.open("rb") as f:
+                cached = pickle.load(f)
+        except Exception:  # 缓存不存在或已损坏时忽略
+            return
+
+        for ip, (x, y, country, city) in cached.items():
+            self.cache[ip] = {
+                "x": np.float32(x),
+                "y": np.float32(y),
+                "country": country,
+                "city": city,
+            }
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def save(self):
+        """将缓存写入磁盘，缓存未变化时跳过
+
+        先写入临时文件再替换，写入中断时不会损坏已有的缓存。
+        """
+        if self.persist_path is None or not self._dirty:
+            return
+
+        cached = {
+            ip: (
+                float(location["x"]),
+                float(location["y"]),
+                location["country"],
+                location["city"],
+            )
+            for ip, location in self.cache.items()
+        }
+        # 临时文件名包含进程号，多个进程同时保存时互不干扰
+        temp_path = self.persist_path.with_name(
+            f".tmp-{os.getpid()}-{self.persist_path.name}"
+        )
+        with temp_path.open("wb") as f:
+            pickle.dump(cached, f)
+        os.replace(temp_path, self.persist_path)
+        self._dirty = False
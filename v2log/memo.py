@@ -0,0 +1,107 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+from v2log.utils import (
+    calculate_statistics,
+    prepare_donut_data,
+    prepare_timeline_data,
+)
+
+# 页面计算结果的缓存条目数和大对象（DataFrame）占用的内存上限
+MEMO_ENTRIES = int(os.environ.get("READER_MEMO_ENTRIES", "32"))
+MEMO_MEMORY_MB = float(os.environ.get("READER_MEMO_MEMORY_MB", "2048"))
+
+
+def memory_size(value) -> int:
+    """估算结果占用的内存，只统计其中的 DataFrame/Series"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, dict):
+        return sum(memory_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(memory_size(item) for item in value)
+    return 0
+
+
+class FrameMemo:
+    """按键缓存加载和过滤后的数据，LRU 淘汰
+
+    这些结果与数据量同级，st.cache_data 每次命中都会复制一份，
+    因此直接保存对象本身，所有会话共享，调用方不能修改返回值。
+    条目数和内存占用都有上限，超出时先淘汰最久未使用的条目。
+    """
+
+    def __init__(self, max_entries=MEMO_ENTRIES, max_memory_mb=MEMO_MEMORY_MB):
+        self.max_entries = max_entries
+        self.max_bytes = int(max_memory_mb * 1024**2)
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """返回 key 对应的结果，未缓存时调用 compute 计算并保存"""
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        value = compute()
+        size = memory_size(value)
+        with self._lock:
+            if key in self.entries:
+                self._discard(key)
+            # 单个结果超出内存上限时不缓存
+            if size <= self.max_bytes and self.max_entries > 0:
+                self.entries[key] = value
+                self.sizes[key] = size
+                self.total_bytes += size
+                while (
+                    len(self.entries) > self.max_entries
+                    or self.total_bytes > self.max_bytes
+                ):
+                    self._discard(next(iter(self.entries)))
+        return value
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.total_bytes = 0
+
+    def _discard(self, key):
+        del self.entries[key]
+        self.total_bytes -= self.sizes.pop(key)
+
+
+@st.cache_resource
+def get_frame_memo() -> FrameMemo:
+    return FrameMemo()
+
+
+# 以下结果只与数据和搜索词有关，由调用方传入的 key 标识，
+# 带下划线的参数不参与哈希，避免每次重跑都对整张表计算哈希
+@st.cache_data(max_entries=MEMO_ENTRIES, show_spinner=False)
+def memo_statistics(key, _df, _rollups=None):
+    return calculate_statistics(_df, _rollups)
+
+
+@st.cache_data(max_entries=MEMO_ENTRIES, show_spinner=False)
+def memo_timeline_data(key, _df, _rollups=None):
+    return prepare_timeline_data(_df, _rollups)
+
+
+@st.cache_data(max_entries=MEMO_ENTRIES, show_spinner=False)
+def memo_donut_data(key, _df, _rollups=None):
+    return prepare_donut_data(_df, _rollups)
+
+
+def clear_memo():
+    """清除全部页面缓存，重新分析日志时调用"""
+    get_frame_memo().clear()
+    for func in (memo_statistics, memo_timeline_data, memo_donut_data):
+        func.clear()
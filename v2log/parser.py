@@ -0,0 +1,197 @@
+import hashlib
+import re
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from v2log.aggregate import Aggregator
+from v2log.sources import open_source
+
+LOG_PATTERN = re.compile(
+    r"(\d{4}/\d{2}/\d{2} \d{2}:\d{2}):\d{2} ([\d\.]+):\d+ accepted "
+    r"tcp:([\w\.-]+):"
+)
+# 多行模式下逐行匹配，行首空白等价于单行解析时的 strip()
+BLOCK_PATTERN = re.compile(r"^[^\S\n]*" + LOG_PATTERN.pattern, re.M)
+MINUTE_FORMAT = "%Y/%m/%d %H:%M"
+LOOPBACK = "127.0.0.1"
+# 批量解析时每次读取的字节数
+BLOCK_SIZE = 4 * 1024 * 1024
+# 断点校验时对偏移量之前多少字节计算哈希
+PREFIX_HASH_SIZE = 4096
+# 文件超过该秒数未修改时视为已写完，末尾没有换行的行也按完整行处理
+SETTLE_SECONDS = 2.0
+
+
+def parse_log_line(line, log_pattern=LOG_PATTERN):
+    """解析单行日志"""
+    match = log_pattern.match(line)
+    if match:
+        minute_str, source_ip, destination = match.groups()
+        # 跳过本地回环地址相关的记录
+        is_loopback = "127.0.0.1" in (source_ip, destination) or (
+            destination.replace(".", "").isdigit()
+            and destination == "127.0.0.1"
+        )
+        if is_loopback:
+            return None
+
+        return dict(
+            zip(
+                ["min", "src", "dst"],
+                [
+                    datetime.strptime(minute_str, MINUTE_FORMAT),
+                    source_ip,
+                    destination,
+                ],
+            )
+        )
+    return None
+
+
+def parse_block(text: str) -> tuple:
+    """批量解析一段日志文本，返回按 (min, src, dst) 聚合后的列
+
+    整段文本只做一次正则扫描，先按原始字符串计数，
+    再对去重后的分钟字符串统一调用一次 pd.to_datetime。
+    返回 (minutes, srcs, dsts, counts)，minutes 为 epoch 分钟整数。
+    """
+    counts = Counter(
+        key
+        for key in BLOCK_PATTERN.findall(text)
+        if LOOPBACK not in (key[1], key[2])
+    )
+    if not counts:
+        return (
+            np.empty(0, dtype=np.int64),
+            [],
+            [],
+            np.empty(0, dtype=np.int64),
+        )
+
+    minute_strs, srcs, dsts = zip(*counts)
+    minute_codes, unique_minutes = pd.factorize(
+        np.asarray(minute_strs, dtype=object)
+    )
+    epoch_minutes = (
+        pd.to_datetime(unique_minutes, format=MINUTE_FORMAT).as_unit("s").asi8
+        // 60
+    )
+
+    return (
+        epoch_minutes[minute_codes],
+        list(srcs),
+        list(dsts),
+        np.fromiter(counts.values(), dtype=np.int64, count=len(counts)),
+    )
+
+
+def iter_blocks(f, end=None, block_size=BLOCK_SIZE):
+    """从二进制文件当前位置按块读取，每块都在行尾结束
+
+    不指定 end 时读到文件末尾，f 也可以是不支持定位的解压流。
+    """
+    position = f.tell() if end is not None else 0
+    while end is None or position < end:
+        size = block_size if end is None else min(block_size, end - position)
+        data = f.read(size)
+        if not data:
+            break
+        if not data.endswith(b"\n"):
+            # 补齐到行尾，区间边界本身总在行首
+            data += f.readline()
+        position += len(data)
+        yield data
+
+
+def prefix_hash(f, offset: int, size: int = PREFIX_HASH_SIZE) -> str:
+    """计算偏移量之前一小段内容的哈希，用于确认文件未被改写"""
+    start = max(offset - size, 0)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+
+def complete_lines_end(f, start: int = 0, settled: bool = False) -> int:
+    """返回文件中最后一个完整行（以换行结尾）的结束位置
+
+    settled 为 True 表示文件已不再写入，末尾没有换行的行也算完整，
+    直接返回文件末尾。
+    """
+    f.seek(0, 2)
+    end = f.tell()
+    if settled:
+        return max(end, start)
+    while end > start:
+        chunk_start = max(end - BLOCK_SIZE, start)
+        f.seek(chunk_start)
+        newline = f.read(end - chunk_start).rfind(b"\n")
+        if newline >= 0:
+            return chunk_start + newline + 1
+        end = chunk_start
+    return start
+
+
+def split_file_ranges(
+    file_path: Path, parts: int, file_size: int = None
+) -> list:
+    """将文件按字节切分为若干段，每段边界都对齐到行首"""
+    if file_size is None:
+        file_size = Path(file_path).stat().st_size
+    if file_size == 0:
+        return []
+
+    boundaries = [0]
+    with Path(file_path).open("rb") as f:
+        for i in range(1, parts):
+            # 从目标位置的前一个字节开始读到行尾，保证边界落在行首
+            f.seek(max(file_size * i // parts - 1, boundaries[-1]))
+            f.readline()
+            position = f.tell()
+            if boundaries[-1] < position < file_size:
+                boundaries.append(position)
+    boundaries.append(file_size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def aggregate_range(
+    log_file_path: Path,
+    start: int,
+    end: int,
+    log_filter=None,
+    memory_limit=None,
+    spill_dir=None,
+) -> Aggregator:
+    """在子进程中解析并聚合文件的某个字节区间，log_filter 在聚合前过滤
+
+    memory_limit 和 spill_dir 见 Aggregator。
+    """
+    aggregator = Aggregator(memory_limit=memory_limit, spill_dir=spill_dir)
+    with Path(log_file_path).open("rb") as f:
+        f.seek(start)
+        for data in iter_blocks(f, end):
+            block = parse_block(data.decode("utf-8", errors="replace"))
+            if log_filter is not None:
+                block = log_filter.apply(*block)
+            aggregator.add_block(*block)
+
+    return aggregator
+
+
+def aggregate_source(
+    log_file_path: Path, log_filter=None, memory_limit=None, spill_dir=None
+) -> Aggregator:
+    """在子进程中流式解压、解析并聚合整个日志文件"""
+    aggregator = Aggregator(memory_limit=memory_limit, spill_dir=spill_dir)
+    stream, raw = open_source(log_file_path)
+    with raw, stream:
+        for data in iter_blocks(stream):
+            block = parse_block(data.decode("utf-8", errors="replace"))
+            if log_filter is not None:
+                block = log_filter.apply(*block)
+            aggregator.add_block(*block)
+
+    return aggregator
@@ -0,0 +1,250 @@
+import json
+import pickle
+import socket
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from v2log.aggregate import Aggregator
+from v2log.cache import FRAME_SUFFIX, pa, pq
+
+# 部分聚合结果（partial）文件：各主机分别分析日志后输出，再合并到一处
+PARTIAL_SUFFIX = f".partial{FRAME_SUFFIX}"
+PARTIAL_COLUMNS = ["min", "src", "dst", "count"]
+PARTIAL_VERSION = 1
+# Parquet 元数据中保存来源信息的键
+META_KEY = b"v2log.partial"
+# 合并时每次从每个文件读取的行数，内存占用与文件数和该值成正比
+MERGE_CHUNK_ROWS = 1_000_000
+
+
+def is_partial(path) -> bool:
+    name = Path(path).name
+    return name.endswith(".partial.parquet") or name.endswith(".partial.pkl")
+
+
+def partial_meta(
+    frame: pd.DataFrame, log_path=None, fingerprint=None, log_filter=None
+) -> dict:
+    """部分聚合结果的来源信息，合并时各文件的 sources 依次拼接"""
+    return {
+        "version": PARTIAL_VERSION,
+        "filter": log_filter.normalized if log_filter is not None else "",
+        "sources": [
+            {
+                "host": socket.gethostname(),
+                "path": str(log_path) if log_path is not None else None,
+                "fingerprint": fingerprint,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "rows": len(frame),
+            }
+        ],
+    }
+
+
+def _is_parquet(path) -> bool:
+    """是否为 parquet 格式，读写该格式需要安装 pyarrow"""
+    if Path(path).suffix != ".parquet":
+        return False
+    if pq is None:
+        raise ValueError(f"parquet 格式的部分聚合结果需要安装 pyarrow: {path}")
+    return True
+
+
+def _arrow_schema():
+    # src/dst 以普通字符串写入，各批次的分类取值不同也能写入同一文件，
+    # Parquet 本身会对其字典编码
+    return pa.schema(
+        [
+            ("min", pa.timestamp("us")),
+            ("src", pa.string()),
+            ("dst", pa.string()),
+            ("count", pa.int64()),
+        ]
+    )
+
+
+def _to_table(frame: pd.DataFrame, schema):
+    frame = frame[PARTIAL_COLUMNS].astype(
+        {"src": str, "dst": str, "count": np.int64}
+    )
+    return pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+
+
+class PartialWriter:
+    """按时间顺序逐块写入部分聚合结果"""
+
+    def __init__(self, path: Path, meta: dict):
+        self.path = Path(path)
+        self.meta = meta
+        self.rows = 0
+        if _is_parquet(self.path):
+            schema = _arrow_schema().with_metadata(
+                {META_KEY: json.dumps(meta).encode()}
+            )
+            self._writer = pq.ParquetWriter(self.path, schema)
+        else:
+            self._writer = None
+            self._chunks = []
+
+    def write(self, frame: pd.DataFrame):
+        if frame.empty:
+            return
+        self.rows += len(frame)
+        if self._writer is not None:
+            self._writer.write_table(
+                _to_table(frame, self._writer.schema),
+                row_group_size=MERGE_CHUNK_ROWS,
+            )
+        else:
+            self._chunks.append(frame[PARTIAL_COLUMNS])
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            return
+        frame = (
+            pd.concat(self._chunks, ignore_index=True)
+            if self._chunks
+            else pd.DataFrame(columns=PARTIAL_COLUMNS)
+        )
+        with self.path.open("wb") as f:
+            pickle.dump({"meta": self.meta, "frame": frame}, f)
+
+
+def write_partial(frame: pd.DataFrame, path: Path, meta: dict):
+    """保存部分聚合结果，按时间排序以便合并时逐块归并"""
+    frame = frame[PARTIAL_COLUMNS]
+    if not frame["min"].is_monotonic_increasing:
+        frame = frame.sort_values("min", kind="stable")
+    writer = PartialWriter(path, meta)
+    writer.write(frame)
+    writer.close()
+
+
+def read_partial_meta(path: Path) -> dict:
+    """只读取部分聚合结果的来源信息"""
+    if _is_parquet(path):
+        metadata = pq.read_schema(path).metadata or {}
+        return json.loads(metadata[META_KEY])
+    with Path(path).open("rb") as f:
+        return pickle.load(f)["meta"]
+
+
+def partial_rows(path: Path) -> int:
+    """部分聚合结果的总行数"""
+    if _is_parquet(path):
+        return pq.ParquetFile(path).metadata.num_rows
+    with Path(path).open("rb") as f:
+        return len(pickle.load(f)["frame"])
+
+
+def iter_partial_chunks(path: Path, rows: int = MERGE_CHUNK_ROWS):
+    """按时间顺序逐块读取部分聚合结果，src/dst 为分类类型"""
+    if _is_parquet(path):
+        parquet_file = pq.ParquetFile(path, read_dictionary=["src", "dst"])
+        for batch in parquet_file.iter_batches(batch_size=rows):
+            yield batch.to_pandas()
+        return
+
+    # 未安装 pyarrow 时只能整个读入再分块
+    with Path(path).open("rb") as f:
+        frame = pickle.load(f)["frame"]
+    for start in range(0, len(frame), rows):
+        yield frame.iloc[start : start + rows]
+
+
+class _ChunkReader:
+    """归并时对单个文件的缓冲读取"""
+
+    def __init__(self, path: Path, rows: int):
+        self._chunks = iter_partial_chunks(path, rows)
+        self.buffer = pd.DataFrame(columns=PARTIAL_COLUMNS)
+        self.exhausted = False
+
+    def fill(self):
+        """读取下一块追加到缓冲区，文件读完时返回False"""
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self.exhausted = True
+            return False
+        if self.buffer.empty:
+            self.buffer = chunk
+        else:
+            self.buffer = pd.concat([self.buffer, chunk], ignore_index=True)
+        return True
+
+    def take_before(self, boundary) -> pd.DataFrame:
+        """取出缓冲区中时间早于 boundary 的行，boundary 为None时全部取出"""
+        if boundary is None:
+            split = len(self.buffer)
+        else:
+            split = int(
+                np.searchsorted(self.buffer["min"].to_numpy(), boundary)
+            )
+        taken = self.buffer.iloc[:split]
+        self.buffer = self.buffer.iloc[split:]
+        return taken
+
+
+def _merged_meta(paths) -> dict:
+    """合并后文件的来源信息，过滤条件不同的结果不能合并"""
+    metas = [read_partial_meta(path) for path in paths]
+    filters = {meta["filter"] for meta in metas}
+    if len(filters) > 1:
+        raise ValueError(f"过滤条件不同的结果不能合并: {sorted(filters)}")
+    return {
+        "version": PARTIAL_VERSION,
+        "filter": filters.pop() if filters else "",
+        "sources": [source for meta in metas for source in meta["sources"]],
+    }
+
+
+def _take_ready(readers) -> list:
+    """取出各缓冲区中早于各缓冲区最大时间中最小值的行
+
+    这些分钟在所有文件中都已完整读到，返回其中非空的块；
+    没有可取的行时，继续读取停在边界分钟上的文件。
+    """
+    pending = [r for r in readers if not r.exhausted]
+    boundary = None
+    if pending:
+        boundary = min(r.buffer["min"].iloc[-1] for r in pending)
+    chunks = [r.take_before(boundary) for r in readers]
+    chunks = [chunk for chunk in chunks if not chunk.empty]
+    if not chunks:
+        # 缓冲区都停在同一分钟，继续读取该分钟的剩余数据
+        for reader in pending:
+            if reader.buffer["min"].iloc[-1] == boundary:
+                reader.fill()
+    return chunks
+
+
+def merge_partials(paths, output: Path, rows: int = MERGE_CHUNK_ROWS) -> dict:
+    """按时间归并多个部分聚合结果，相同 (min, src, dst) 的计数相加
+
+    各文件都按时间排序，每次只取所有文件缓冲区中都已完整读到的时间段
+    （见 _take_ready），用 Aggregator 合并后写出，
+    内存占用与文件数和 rows 成正比，与文件大小无关。
+    返回合并后文件的来源信息。
+    """
+    meta = _merged_meta(paths)
+    readers = [_ChunkReader(path, rows) for path in paths]
+    writer = PartialWriter(output, meta)
+    try:
+        while readers:
+            for reader in readers:
+                if reader.buffer.empty:
+                    reader.fill()
+            readers = [r for r in readers if not r.buffer.empty]
+
+            merged = Aggregator()
+            for chunk in _take_ready(readers):
+                merged.add_frame(chunk)
+            writer.write(merged.to_frame())
+    finally:
+        writer.close()
+
+    return meta
@@ -0,0 +1,195 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from v2log.cache import (
+    FRAME_SUFFIX,
+    concat_frames,
+    frame_mtime_ns,
+    load_frame,
+    save_frame,
+)
+
+# 仪表盘用到的汇总表及其分组列，hour 表按小时截断 min 列
+ROLLUP_KEYS = {
+    "dst": ["dst"],
+    "city": ["city"],
+    "src": ["src"],
+    "hour": ["min"],
+    "minute_city": ["min", "city"],
+}
+
+
+def group_codes(values: pd.Series) -> tuple:
+    """返回分组用的 (整数编码, 取值)，分类列和已排序的列无需哈希"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(np.int64), values.cat.categories
+
+    array = values.to_numpy()
+    if len(array) and values.is_monotonic_increasing:
+        starts = np.flatnonzero(
+            np.concatenate(([True], array[1:] != array[:-1]))
+        )
+        codes = np.zeros(len(array), dtype=np.int64)
+        codes[starts[1:]] = 1
+        return np.cumsum(codes), array[starts]
+
+    codes, labels = pd.factorize(values, sort=True)
+    return codes.astype(np.int64), labels
+
+
+def group_sum(keys: dict, counts: np.ndarray) -> pd.DataFrame:
+    """按一个或多个键对计数求和，结果按键排序
+
+    组合键的取值空间不大时直接用 np.bincount 累加，否则先对组合键编码。
+    计数都为正数，因此和不为0的位置即为出现过的键组合。
+    """
+    encoded = [group_codes(values) for values in keys.values()]
+    codes = [code for code, _ in encoded]
+    sizes = [len(labels) for _, labels in encoded]
+
+    valid = np.logical_and.reduce([code >= 0 for code in codes])
+    if not valid.all():  # 缺失值不参与分组，与 groupby 一致
+        codes = [code[valid] for code in codes]
+        counts = counts[valid]
+
+    key = np.ravel_multi_index(codes, sizes) if codes[0].size else codes[0]
+    space = int(np.prod(sizes))
+    if space <= 4 * len(key) + 1024:
+        sums = np.bincount(key, weights=counts, minlength=space)
+        present = np.flatnonzero(sums)
+        sums = sums[present]
+    else:
+        key_codes, present = pd.factorize(key, sort=True)
+        sums = np.bincount(key_codes, weights=counts)
+
+    columns = {}
+    for name, index, (_, labels) in zip(
+        keys, np.unravel_index(present, sizes), encoded
+    ):
+        if isinstance(labels, pd.Index) and not isinstance(
+            labels, pd.DatetimeIndex
+        ):
+            columns[name] = pd.Categorical.from_codes(index, labels)
+        else:
+            columns[name] = labels[index]
+    columns["count"] = sums.astype(np.int64)
+    return pd.DataFrame(columns)
+
+
+def build_rollups(df: pd.DataFrame) -> dict:
+    """对分钟级结果一次性计算各汇总表
+
+    缺少分组列（例如未做地理定位时没有 city）的汇总表会被跳过。
+    汇总表的列名与原表一致，统计函数可以直接在汇总表上计算。
+    """
+    counts = df["count"].to_numpy()
+    rollups = {}
+    for name, keys in ROLLUP_KEYS.items():
+        if not set(keys) <= set(df.columns):
+            continue
+
+        columns = {key: df[key] for key in keys}
+        if name == "hour":
+            columns["min"] = df["min"].dt.floor("h")
+        rollups[name] = group_sum(columns, counts)
+
+    if "city" in rollups and {"x", "y"} <= set(df.columns):
+        _attach_coordinates(rollups["city"], df)
+    return rollups
+
+
+def _attach_coordinates(city: pd.DataFrame, df: pd.DataFrame):
+    """地图标记使用每个城市在 df 中第一次出现时的坐标"""
+    first = (
+        df["city"]
+        .astype(str)
+        .reset_index(drop=True)
+        .drop_duplicates()
+        .pipe(lambda values: pd.Series(values.index, values.to_numpy()))
+    )
+    rows = first.reindex(city["city"].astype(str)).to_numpy()
+    city["x"] = df["x"].to_numpy()[rows]
+    city["y"] = df["y"].to_numpy()[rows]
+
+
+def merge_rollups(rollups: dict, delta: pd.DataFrame) -> dict:
+    """把新增的分钟级结果累加到已有的汇总表
+
+    按时间分组的汇总表中早于新增数据的行不变，只对其余的行重新求和，
+    城市坐标优先沿用已有汇总表中的值。结果与对全部数据调用
+    build_rollups 相同（分类取值的顺序可能不同）。
+    """
+    additions = build_rollups(delta)
+    merged = {}
+    for name, new in additions.items():
+        old = rollups.get(name)
+        if old is None:
+            merged[name] = new
+            continue
+
+        keys = ROLLUP_KEYS[name]
+        split = 0
+        if keys[0] == "min":
+            split = int(
+                np.searchsorted(
+                    old["min"].to_numpy(), new["min"].to_numpy()[0]
+                )
+            )
+        tail = concat_frames(
+            [old.iloc[split:][keys + ["count"]], new[keys + ["count"]]]
+        )
+        summed = group_sum(
+            {key: tail[key] for key in keys}, tail["count"].to_numpy()
+        )
+        merged[name] = concat_frames(
+            [old.iloc[:split][keys + ["count"]], summed]
+        )
+
+    coordinates = [
+        frame
+        for frame in (rollups.get("city"), additions.get("city"))
+        if frame is not None
+    ]
+    if "city" in merged and all(
+        {"x", "y"} <= set(frame.columns) for frame in coordinates
+    ):
+        _attach_coordinates(
+            merged["city"],
+            concat_frames(
+                [frame[["city", "x", "y"]] for frame in coordinates]
+            ),
+        )
+    return merged
+
+
+def rollup_path(frame_path: Path, name: str) -> Path:
+    """汇总表与结果文件保存在同一目录"""
+    frame_path = Path(frame_path)
+    return frame_path.with_name(
+        f"{frame_path.stem}.rollup-{name}{FRAME_SUFFIX}"
+    )
+
+
+def save_rollups(rollups: dict, frame_path: Path):
+    """保存汇总表"""
+    for name, rollup in rollups.items():
+        save_frame(rollup, rollup_path(frame_path, name))
+
+
+def load_rollups(frame_path: Path):
+    """加载汇总表，任一汇总表缺失或比结果文件旧时返回None"""
+    frame_mtime = frame_mtime_ns(frame_path)
+    rollups = {}
+    for name in ROLLUP_KEYS:
+        path = rollup_path(frame_path, name)
+        if not path.exists():
+            continue
+        if path.stat().st_mtime_ns < frame_mtime:
+            return None
+        try:
+            rollups[name] = load_frame(path)
+        except Exception:  # 处理所有可能的文件读取错误
+            return None
+    return rollups or None
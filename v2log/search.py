@@ -0,0 +1,135 @@
+import pickle
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# n-gram 索引的片段长度，更短的查询直接扫描不重复的取值
+NGRAM_SIZE = 3
+# 以该前缀开头的查询按域名后缀匹配，如 "*.google.com"
+SUFFIX_PREFIX = "*."
+
+
+def ngrams(text: str) -> set:
+    return {
+        text[i : i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)
+    }
+
+
+class SearchIndex:
+    """不重复取值（如 dst 域名）上的搜索索引，查询不区分大小写
+
+    - 子串查询：n-gram 倒排表求交得到候选，再逐个确认
+    - 域名后缀查询 "*.example.com"：匹配 example.com 及其所有子域名，
+      在按反转字符串排序的数组上二分查找
+
+    查询结果是匹配取值的布尔数组，按分类编码展开即可得到行过滤条件，
+    无需在每一行上做字符串匹配。
+    """
+
+    def __init__(self, values):
+        self.values = pd.Index(values)
+        lowered = [str(value).lower() for value in self.values]
+        self._lowered = lowered
+
+        postings = defaultdict(list)
+        for value_id, value in enumerate(lowered):
+            for gram in ngrams(value):
+                postings[gram].append(value_id)
+        self._postings = {
+            gram: np.array(ids, dtype=np.int32)
+            for gram, ids in postings.items()
+        }
+
+        reversed_values = np.array(
+            [value[::-1] for value in lowered], dtype=str
+        )
+        self._suffix_order = np.argsort(reversed_values, kind="stable")
+        self._reversed = reversed_values[self._suffix_order]
+
+    def __len__(self):
+        return len(self.values)
+
+    def match(self, term: str) -> np.ndarray:
+        """返回每个取值是否匹配查询"""
+        term = term.strip().lower()
+        matched = np.zeros(len(self.values), dtype=bool)
+        if term.startswith(SUFFIX_PREFIX):
+            matched[self._match_suffix(term[len(SUFFIX_PREFIX) :])] = True
+        else:
+            matched[self._match_substring(term)] = True
+        return matched
+
+    def _match_substring(self, term: str) -> np.ndarray:
+        if len(term) < NGRAM_SIZE:
+            candidates = range(len(self._lowered))
+        else:
+            lists = sorted(
+                (self._postings.get(gram, ()) for gram in ngrams(term)),
+                key=len,
+            )
+            candidates = lists[0]
+            for ids in lists[1:]:
+                if len(candidates) == 0:
+                    break
+                candidates = np.intersect1d(
+                    candidates, ids, assume_unique=True
+                )
+        return np.array(
+            [i for i in candidates if term in self._lowered[i]],
+            dtype=np.int64,
+        )
+
+    def _match_suffix(self, domain: str) -> np.ndarray:
+        """域名本身精确匹配，子域名即以 "."+域名 结尾的取值
+
+        反转后的后缀即前缀，在排序数组上二分查找得到连续的区间。
+        """
+        exact = domain[::-1]
+        subdomain = ("." + domain)[::-1]
+        starts = np.searchsorted(self._reversed, [exact, subdomain], "left")
+        ends = np.searchsorted(
+            self._reversed, [exact, subdomain + "\U0010ffff"], "right"
+        )
+        return np.concatenate(
+            [self._suffix_order[start:end] for start, end in zip(starts, ends)]
+        )
+
+    def filter_mask(self, column: pd.Series, term: str) -> np.ndarray:
+        """返回 column 中匹配查询的行
+
+        先求出列中每个不重复取值是否匹配，再按编码展开到各行；
+        索引中没有的取值（例如索引建立后新增的数据）单独匹配。
+        """
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.cat.categories
+            codes = column.cat.codes.to_numpy()
+        else:
+            codes, values = pd.factorize(column)
+
+        positions = self.values.get_indexer(values)
+        matched = np.append(self.match(term), False)[positions]
+        missing = positions < 0
+        if missing.any():
+            matched[missing] = SearchIndex(values[missing]).match(term)
+
+        # 缺失值的编码为 -1，对应末尾的 False
+        return np.append(matched, False)[codes]
+
+    def save(self, path: Path):
+        """保存索引"""
+        with Path(path).open("wb") as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, path: Path) -> "SearchIndex":
+        """加载索引"""
+        with Path(path).open("rb") as f:
+            return pickle.load(f)
+
+
+def index_path(frame_path: Path) -> Path:
+    """搜索索引与结果文件保存在同一目录"""
+    frame_path = Path(frame_path)
+    return frame_path.with_name(f"{frame_path.stem}.search.pkl")
@@ -0,0 +1,117 @@
+import glob
+import gzip
+import io
+import lzma
+import re
+from pathlib import Path
+
+try:
+    from compression import zstd  # Python 3.14 起的标准库
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:  # 未安装 zstandard 时不支持 zstd 压缩的日志
+        zstd = None
+
+# 按文件头识别压缩格式，不依赖文件扩展名
+MAGIC_NUMBERS = {
+    b"\x1f\x8b": "gzip",
+    b"\xfd7zXZ\x00": "xz",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+COMPRESSION_SUFFIXES = {".gz", ".xz", ".lzma", ".zst", ".zstd"}
+# 轮转文件名末尾的序号，如 access.log.2.gz 中的 2
+ROTATION_PATTERN = re.compile(r"\.(\d+)$")
+
+
+def compression_of(path: Path):
+    """返回文件的压缩格式，未压缩时返回None"""
+    with Path(path).open("rb") as f:
+        head = f.read(6)
+    for magic, name in MAGIC_NUMBERS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_source(path: Path) -> tuple:
+    """以二进制流打开日志文件，压缩文件边读边解压
+
+    返回 (stream, raw)，raw 为底层文件，raw.tell() 即已读取的压缩字节数，
+    用于汇报进度。
+    """
+    raw = Path(path).open("rb")
+    kind = compression_of(path)
+    if kind == "gzip":
+        return gzip.GzipFile(fileobj=raw), raw
+    if kind == "xz":
+        return lzma.LZMAFile(raw), raw
+    if kind == "zstd":
+        if zstd is None:
+            raw.close()
+            raise ValueError("读取 zstd 压缩的日志需要安装 zstandard")
+        if hasattr(zstd, "ZstdFile"):
+            return zstd.ZstdFile(raw), raw
+        reader = zstd.ZstdDecompressor().stream_reader(
+            raw, read_across_frames=True
+        )
+        return io.BufferedReader(reader), raw
+    return raw, raw
+
+
+def rotation_index(path: Path) -> int:
+    """轮转序号，当前正在写入的文件为0，序号越大越旧"""
+    name = Path(path).name
+    if Path(name).suffix in COMPRESSION_SUFFIXES:
+        name = Path(name).stem
+    match = ROTATION_PATTERN.search(name)
+    return int(match.group(1)) if match else 0
+
+
+def expand_sources(pattern) -> list:
+    """展开日志输入，返回按从旧到新排序的文件列表
+
+    pattern 可以是单个文件或 glob 模式（如 "access.log*"）。
+    带序号的轮转文件按序号倒序，其余按修改时间排序。
+    """
+    path = Path(pattern)
+    if path.is_file():
+        return [path]
+    paths = [Path(p) for p in glob.glob(str(pattern)) if Path(p).is_file()]
+    return sorted(
+        paths,
+        key=lambda p: (-rotation_index(p), p.stat().st_mtime_ns, p.name),
+    )
+
+
+def is_source_set(pattern) -> bool:
+    """是否需要按分段处理：glob 模式或压缩文件"""
+    path = Path(pattern)
+    return not path.is_file() or compression_of(path) is not None
+
+
+def source_key(path: Path) -> str:
+    """文件内容的标识，轮转改名后不变，内容变化后随之变化"""
+    stat = Path(path).stat()
+    return f"{stat.st_ino}-{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def sources_fingerprint(pattern) -> str:
+    """日志输入中全部文件的指纹"""
+    return ":".join(source_key(path) for path in expand_sources(pattern))
+
+
+def only_appended(old_keys, new_keys) -> bool:
+    """与 old_keys 相比，new_keys 是否只新增了文件或文件追加了内容
+
+    同一 inode 的文件变大视为追加；文件被删除、截断或替换时返回False。
+    """
+    sizes = {}
+    for key in new_keys:
+        inode, size, _ = key.split("-")
+        sizes[inode] = max(sizes.get(inode, 0), int(size))
+    for key in old_keys:
+        inode, size, _ = key.split("-")
+        if sizes.get(inode, -1) < int(size):
+            return False
+    return True
@@ -2,23 +2,31 @@
 
 from .generator import create_demo_log, generate_log
 from .helpers import (
+    bin_map_markers,
     calculate_statistics,
     filter_dataframe,
     format_dataframe_for_display,
     get_map_markers,
+    get_marker_labels,
+    get_valid_coordinates,
     paginate_dataframe,
     prepare_timeline_data,
     prepare_donut_data,
+    timeline_frequency,
 )
 
 __all__ = [
     "create_demo_log",
     "generate_log",
+    "bin_map_markers",
     "calculate_statistics",
     "filter_dataframe",
     "format_dataframe_for_display",
     "get_map_markers",
+    "get_marker_labels",
+    "get_valid_coordinates",
     "paginate_dataframe",
     "prepare_timeline_data",
     "prepare_donut_data",
+    "timeline_frequency",
 ]
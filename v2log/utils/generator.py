@@ -72,6 +72,6 @@ def create_demo_log(output_path: Path = None) -> Path:
         start_time=datetime.now() - timedelta(hours=1),
     )
 
-    # 写入文件
-    output_path.write_text(log_data)
+    # 写入文件，最后一行也以换行结尾
+    output_path.write_text(log_data + "\n")
     return output_path
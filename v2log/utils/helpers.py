@@ -1,31 +1,65 @@
-from typing import Any, Dict
+from functools import reduce
+from typing import Any, Dict, Tuple
 
+import numpy as np
 import pandas as pd
 
+from v2log.rollup import group_codes
+from v2log.search import SearchIndex
+
+# 地图网格：每个 256px 瓦片宽度内划分的格子数，以及合并后保留的最多标记数
+MAP_BINS_PER_TILE = 8
+MAX_MAP_POINTS = 2000
+# 时间轴的候选粒度（从细到粗）、最多的时间段数和单独显示的城市数
+TIMELINE_FREQUENCIES = ["1min", "5min", "1h", "1D"]
+MAX_TIMELINE_BUCKETS = 300
+TIMELINE_TOP_CITIES = 10
+OTHER_SERIES = "其他"
+
 
 def filter_dataframe(
-    df: pd.DataFrame, search_term: str, column: str = "dst"
+    df: pd.DataFrame,
+    search_term: str,
+    column: str = "dst",
+    index: SearchIndex = None,
 ) -> pd.DataFrame:
-    """根据搜索词过滤DataFrame"""
+    """根据搜索词过滤DataFrame
+
+    搜索词按子串匹配（不区分大小写），"*.example.com" 匹配该域名及其子域名。
+    匹配只在列的不重复取值上进行，传入持久化的 index 时直接查索引。
+    """
     if not search_term:
         return df
-    return df[df[column].str.contains(search_term, case=False)]
+    if index is None:
+        index = SearchIndex([])
+    return df[index.filter_mask(df[column], search_term)]
+
+
+def calculate_statistics(
+    df: pd.DataFrame, rollups: dict = None
+) -> Dict[str, Any]:
+    """计算数据统计信息
 
+    传入 rollups 时直接读取预先计算的汇总表，不再扫描全部数据。
+    """
+    if rollups is None:
+        rollups = {"src": df, "dst": df, "city": df}
 
-def calculate_statistics(df: pd.DataFrame) -> Dict[str, Any]:
-    """计算数据统计信息"""
+    src_counts = rollups["src"]
     return {
-        "total_visits": df["count"].sum(),
-        "unique_ips": df["src"].nunique(),
-        "unique_sites": df["dst"].nunique(),
+        "total_visits": src_counts["count"].sum(),
+        "unique_ips": src_counts["src"].nunique(),
+        "unique_sites": rollups["dst"]["dst"].nunique(),
         "top_sites": (
-            df.groupby("dst")["count"]
+            rollups["dst"]
+            .groupby("dst", observed=True)["count"]
             .sum()
             .sort_values(ascending=False)
             .head()
         ),
         "top_cities": (
-            df.groupby("city")["count"]
+            rollups["city"]
+            .groupby("city", observed=True)["count"]
             .sum()
             .sort_values(ascending=False)
             .head()
@@ -35,9 +69,11 @@ def calculate_statistics(df: pd.DataFrame) -> Dict[str, Any]:
 
 def format_dataframe_for_display(df: pd.DataFrame) -> pd.DataFrame:
     """格式化用于显示的DataFrame"""
-    return df[["min", "src", "dst", "city", "count"]].sort_values(
-        "min", ascending=False
-    )
+    df = df[["min", "src", "dst", "city", "count"]]
+    # 分析结果已按时间排序，直接倒序即可
+    if df["min"].is_monotonic_increasing:
+        return df.iloc[::-1]
+    return df.sort_values("min", ascending=False)
 
 
 def paginate_dataframe(
@@ -49,11 +85,60 @@ def paginate_dataframe(
     return df.iloc[start_idx:end_idx]
 
 
+def column_labels(column: pd.Series, prefix: str = "") -> np.ndarray:
+    """将一列格式化为带前缀的字符串数组
+
+    每个不重复的取值只格式化一次，再按编码展开到各行。
+    """
+    codes, uniques = pd.factorize(column, use_na_sentinel=False)
+    return np.array([f"{prefix}{value}" for value in uniques], dtype=object)[
+        codes
+    ]
+
+
+def join_labels(*parts: np.ndarray) -> np.ndarray:
+    """逐元素拼接多个字符串数组"""
+    return reduce(np.add, parts)
+
+
+def get_valid_coordinates(
+    df: pd.DataFrame,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """获取有效的坐标点数据，返回 (x, y, count, 悬停说明) 四个数组"""
+    valid_df = df[(df["x"] != 0) & (df["y"] != 0)]
+    labels = join_labels(
+        column_labels(valid_df["src"], "IP: "),
+        column_labels(valid_df["dst"], "<br>目标: "),
+        column_labels(valid_df["city"], "<br>城市: "),
+        column_labels(valid_df["count"], "<br>访问次数: "),
+    )
+    return (
+        valid_df["x"].to_numpy(),
+        valid_df["y"].to_numpy(),
+        valid_df["count"].to_numpy(),
+        labels,
+    )
+
+
+def get_marker_labels(markers: pd.DataFrame) -> np.ndarray:
+    """地图标记的说明文字，网格合并后的标记注明合并的城市数"""
+    parts = [column_labels(markers["city"])]
+    if "cities" in markers:
+        cities = markers["cities"].to_numpy()
+        parts.append(
+            np.where(cities > 1, column_labels(markers["cities"], " 等"), "")
+        )
+        parts.append(np.where(cities > 1, "个城市", ""))
+    parts.append(column_labels(markers["count"], ": "))
+    parts.append(" 次访问")
+    return join_labels(*parts)
+
+
 def get_map_markers(df: pd.DataFrame) -> pd.DataFrame:
-    """获取地图标记数据"""
+    """获取地图标记数据，df 也可以是按城市的汇总表"""
     # 按城市分组计算总访问量
     map_data = (
-        df.groupby("city")
+        df.groupby("city", observed=True)
         .agg(
             {
                 "count": "sum",
@@ -68,10 +153,107 @@ def get_map_markers(df: pd.DataFrame) -> pd.DataFrame:
     return map_data[(map_data["x"] != 0) & (map_data["y"] != 0)]
 
 
-def prepare_timeline_data(df: pd.DataFrame) -> pd.DataFrame:
-    """准备时间轴数据"""
-    # 按时间和城市分组
-    timeline = df.groupby(["min", "city"])["count"].sum().unstack(fill_value=0)
+def bin_map_markers(
+    markers: pd.DataFrame,
+    zoom: int,
+    bins_per_tile: int = MAP_BINS_PER_TILE,
+    max_points: int = MAX_MAP_POINTS,
+) -> pd.DataFrame:
+    """按缩放级别对应的经纬度网格合并地图标记
+
+    同一格子内的标记合并为一个，坐标取按访问量加权的中心，
+    city 为格子内访问量最大的城市，cities 为合并的城市数。
+    格子大小随缩放级别减半，标记数不超过 max_points，
+    与不重复的位置数无关。
+    """
+    cell = 360 / (2**zoom * bins_per_tile)
+    x = markers["x"].to_numpy(np.float64)
+    y = markers["y"].to_numpy(np.float64)
+    counts = markers["count"].to_numpy(np.float64)
+
+    rows = np.floor((x + 90) / cell).astype(np.int64)
+    cols = np.floor((y + 180) / cell).astype(np.int64)
+    _, bins = np.unique(
+        rows * (int(360 / cell) + 2) + cols, return_inverse=True
+    )
+    totals = np.bincount(bins, weights=counts)
+
+    # 按 (格子, 访问量降序) 排序后，每个格子的第一行即访问量最大的城市
+    order = np.lexsort((-counts, bins))
+    sorted_bins = bins[order]
+    top = order[np.concatenate(([True], sorted_bins[1:] != sorted_bins[:-1]))]
+
+    binned = pd.DataFrame(
+        {
+            "city": markers["city"].to_numpy()[top],
+            "x": np.bincount(bins, weights=x * counts) / totals,
+            "y": np.bincount(bins, weights=y * counts) / totals,
+            "count": totals.astype(np.int64),
+            "cities": np.bincount(bins),
+        }
+    )
+    if len(binned) > max_points:
+        binned = binned.nlargest(max_points, "count")
+    return binned
+
+
+def timeline_frequency(
+    span: pd.Timedelta, max_buckets: int = MAX_TIMELINE_BUCKETS
+) -> str:
+    """按时间跨度选择时间轴粒度，使时间段数不超过 max_buckets
+
+    重采样时第一段的起点按粒度对齐，可能早于数据的起点，
+    因此跨度须小于 max_buckets - 1 个时间段。
+    """
+    usable = max(max_buckets - 1, 1)
+    for freq in TIMELINE_FREQUENCIES:
+        if span < pd.Timedelta(freq) * usable:
+            return freq
+    # 跨度很长时按整数天合并，取满足段数上限的最小天数
+    days = span // (pd.Timedelta("1D") * usable) + 1
+    return f"{days}D"
+
+
+def prepare_timeline_data(
+    df: pd.DataFrame,
+    rollups: dict = None,
+    top_n: int = TIMELINE_TOP_CITIES,
+    max_buckets: int = MAX_TIMELINE_BUCKETS,
+) -> pd.DataFrame:
+    """准备时间轴数据
+
+    按时间跨度自动选择 1分钟/5分钟/1小时/1天 的粒度重采样，
+    访问量最大的 top_n 个城市各占一列，其余城市合并为"其他"，
+    结果的行数和列数都有上限。
+    """
+    if rollups is not None:
+        df = rollups["minute_city"]
+    if df.empty:
+        return pd.DataFrame({"total": []}, index=pd.DatetimeIndex([]))
+
+    # 访问量最大的城市各占一个序号，其余城市（含缺失值）归入最后一个序号
+    codes, cities = group_codes(df["city"])
+    counts = df["count"].to_numpy()
+    valid = codes >= 0
+    city_totals = np.bincount(
+        codes[valid], weights=counts[valid], minlength=len(cities)
+    )
+    top = np.argsort(-city_totals, kind="stable")[:top_n]
+    top = top[city_totals[top] > 0]
+    series = np.full(len(cities) + 1, len(top))
+    series[top] = np.arange(len(top))
+
+    timeline = (
+        df.groupby([df["min"], series[codes]])["count"]
+        .sum()
+        .unstack(fill_value=0)
+    )
+    freq = timeline_frequency(
+        timeline.index.max() - timeline.index.min(), max_buckets
+    )
+    timeline = timeline.resample(freq).sum()
+    names = [*np.asarray(cities)[top], OTHER_SERIES]
+    timeline.columns = [names[slot] for slot in timeline.columns]
 
     # 添加总访问量列
     timeline["total"] = timeline.sum(axis=1)
@@ -79,10 +261,15 @@ def prepare_timeline_data(df: pd.DataFrame) -> pd.DataFrame:
     return timeline
 
 
-def prepare_donut_data(df: pd.DataFrame) -> tuple[dict, dict, dict]:
+def prepare_donut_data(
+    df: pd.DataFrame, rollups: dict = None
+) -> tuple[dict, dict, dict]:
     """准备环形图数据"""
+    if rollups is None:
+        rollups = {"hour": df, "src": df, "city": df}
+
     # 时间段分布
-    df["hour"] = df["min"].dt.hour
+    hours = rollups["hour"]["min"].dt.hour
     time_periods = {
         "凌晨 (0-6)": (0, 6),
         "上午 (6-12)": (6, 12),
@@ -92,12 +279,13 @@ def prepare_donut_data(df: pd.DataFrame) -> tuple[dict, dict, dict]:
 
     period_data = {}
     for period, (start, end) in time_periods.items():
-        mask = (df["hour"] >= start) & (df["hour"] < end)
-        period_data[period] = df[mask]["count"].sum()
+        mask = (hours >= start) & (hours < end)
+        period_data[period] = rollups["hour"][mask]["count"].sum()
 
     # IP分布（取前10个IP）
     ip_data = (
-        df.groupby("src")["count"]
+        rollups["src"]
+        .groupby("src", observed=True)["count"]
         .sum()
         .sort_values(ascending=False)
         .head(10)
@@ -106,7 +294,8 @@ def prepare_donut_data(df: pd.DataFrame) -> tuple[dict, dict, dict]:
 
     # 地区分布（取前10个地区）
     city_data = (
-        df.groupby("city")["count"]
+        rollups["city"]
+        .groupby("city", observed=True)["count"]
         .sum()
         .sort_values(ascending=False)
         .head(10)